@@ -0,0 +1,107 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+from app.config import settings
+
+
+class AlertStormError(Exception):
+    pass
+
+
+def alert_fingerprint(machine_id: int, title: str, severity: str) -> str:
+    key = f"{machine_id}\x1f{' '.join(title.lower().split())}\x1f{severity}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class AlertDeduplicator:
+    """Fingerprint index of recent alerts plus a fleet-wide insert rate limit.
+
+    A fingerprint stays known for ``window_seconds`` after its last
+    occurrence; repeats inside the window are folded into the existing alert.
+    Entries are kept in expiry order so eviction only ever looks at the head.
+    New alerts draw from a token bucket refilled at ``max_inserts_per_second``.
+    The lock only guards this in-memory state and is never held across a
+    query: ``reserve`` runs before the alert is written, ``settle`` after.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = 900.0,
+        max_inserts_per_second: float = 20.0,
+        burst: int = 100,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.max_inserts_per_second = max_inserts_per_second
+        self.burst = burst
+        self._clock = clock
+        self._index: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._tokens = float(burst)
+        self._refilled_at = clock()
+        self.lock = threading.RLock()
+        self.deduplicated = 0
+        self.suppressed = 0
+
+    def _evict(self, now: float) -> None:
+        while self._index:
+            _, (_, expires_at) = next(iter(self._index.items()))
+            if expires_at > now:
+                break
+            self._index.popitem(last=False)
+
+    def lookup(self, fingerprint: str) -> int | None:
+        with self.lock:
+            now = self._clock()
+            self._evict(now)
+            entry = self._index.get(fingerprint)
+            return entry[0] if entry else None
+
+    def remember(self, fingerprint: str, alert_id: int) -> None:
+        with self.lock:
+            self._index[fingerprint] = (alert_id, self._clock() + self.window_seconds)
+            self._index.move_to_end(fingerprint)
+
+    def forget(self, fingerprint: str) -> None:
+        with self.lock:
+            self._index.pop(fingerprint, None)
+
+    def acquire(self) -> None:
+        with self.lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.max_inserts_per_second)
+            self._refilled_at = now
+            if self._tokens < 1:
+                self.suppressed += 1
+                raise AlertStormError(f"alert insert rate above {self.max_inserts_per_second:g}/s")
+            self._tokens -= 1
+
+    def reserve(self, fingerprint: str) -> int | None:
+        """Id of the known alert a repeat folds into, or None once an insert token is taken."""
+        with self.lock:
+            alert_id = self.lookup(fingerprint)
+            if alert_id is None:
+                self.acquire()
+            return alert_id
+
+    def settle(self, fingerprint: str, alert_id: int, created: bool) -> None:
+        with self.lock:
+            self.remember(fingerprint, alert_id)
+            if not created:
+                self.deduplicated += 1
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            self._evict(self._clock())
+            return {"tracked": len(self._index), "deduplicated": self.deduplicated, "suppressed": self.suppressed}
+
+
+alert_deduplicator = AlertDeduplicator(
+    settings.alert_dedup_window_seconds, settings.alert_max_inserts_per_second, settings.alert_storm_burst
+)
+
+
+def get_alert_deduplicator() -> AlertDeduplicator:
+    return alert_deduplicator
@@ -0,0 +1,127 @@
+import operator
+import threading
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import MetricAlertRule
+
+OPERATORS: dict[str, Callable[[float, float], bool]] = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+@dataclass(slots=True)
+class CompiledRule:
+    id: int
+    name: str
+    metric: str
+    operator: str
+    threshold: float
+    consecutive: int
+    severity: Any
+    auto_create_ticket: bool
+    check: Callable[[float, float], bool]
+    # machine_id -> number of consecutive breaching samples; only machines
+    # currently in breach are kept.
+    streaks: dict[int, int] = field(default_factory=dict)
+
+    @property
+    def condition(self) -> tuple[str, str, float]:
+        return self.metric, self.operator, self.threshold
+
+    def describe(self, value: float) -> str:
+        return (
+            f"{self.metric} {self.operator} {self.threshold:g} sur {self.consecutive} échantillon(s) "
+            f"consécutif(s), dernière valeur {value:g}"
+        )
+
+
+@dataclass(slots=True)
+class RuleHit:
+    rule: CompiledRule
+    machine_id: int
+    value: float
+
+
+class AlertRuleEngine:
+    """Evaluates metric threshold rules incrementally as samples arrive.
+
+    Each rule keeps one streak counter per breaching machine, so a sample
+    costs one comparison and one dict update per rule and history is never
+    re-read. A rule fires once when a streak reaches ``consecutive`` and
+    re-arms when the metric goes back under the threshold.
+    """
+
+    def __init__(self) -> None:
+        self._rules: list[CompiledRule] = []
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def rules(self) -> list[CompiledRule]:
+        return list(self._rules)
+
+    def load(self, db: Session) -> None:
+        definitions = db.scalars(select(MetricAlertRule).order_by(MetricAlertRule.id)).all()
+        with self._lock:
+            previous = {rule.id: rule for rule in self._rules}
+            compiled = []
+            for definition in definitions:
+                rule = CompiledRule(
+                    id=definition.id,
+                    name=definition.name,
+                    metric=definition.metric,
+                    operator=definition.operator,
+                    threshold=definition.threshold,
+                    consecutive=definition.consecutive,
+                    severity=definition.severity,
+                    auto_create_ticket=definition.auto_create_ticket,
+                    check=OPERATORS[definition.operator],
+                )
+                old = previous.get(rule.id)
+                # Streaks survive a reload as long as the condition itself is unchanged.
+                if old is not None and old.condition == rule.condition:
+                    rule.streaks = old.streaks
+                compiled.append(rule)
+            self._rules = compiled
+            self._loaded = True
+
+    def ensure_loaded(self, db: Session) -> None:
+        if not self._loaded:
+            self.load(db)
+
+    def evaluate(self, machine_id: int, sample: Mapping[str, Any]) -> list[RuleHit]:
+        hits: list[RuleHit] = []
+        with self._lock:
+            for rule in self._rules:
+                value = sample[rule.metric]
+                if rule.check(value, rule.threshold):
+                    streak = rule.streaks.get(machine_id, 0) + 1
+                    rule.streaks[machine_id] = streak
+                    if streak == rule.consecutive:
+                        hits.append(RuleHit(rule, machine_id, value))
+                else:
+                    rule.streaks.pop(machine_id, None)
+        return hits
+
+    def evaluate_rows(self, rows: Iterable[Mapping[str, Any]]) -> list[RuleHit]:
+        if not self._rules:
+            return []
+        hits: list[RuleHit] = []
+        for row in rows:
+            hits.extend(self.evaluate(row["machine_id"], row))
+        return hits
+
+
+alert_rule_engine = AlertRuleEngine()
+
+
+def get_alert_rule_engine() -> AlertRuleEngine:
+    return alert_rule_engine
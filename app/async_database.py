@@ -0,0 +1,26 @@
+"""``AsyncSession`` counterpart of ``app.database`` (needs ``sqlalchemy[asyncio]`` and aiosqlite or asyncpg)."""
+
+from collections.abc import AsyncGenerator
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.database import DATABASE_URL, create_database_engine
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    """Same database through its async driver: ``sqlite://`` -> ``sqlite+aiosqlite://``."""
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+# Same settings as the sync engine: WAL and pragmas on SQLite, pool and prepared statements on PostgreSQL.
+async_engine = create_database_engine(async_database_url(DATABASE_URL), factory=create_async_engine)
+# Objects stay loaded after commit: an expired attribute would need a lazy load outside the event loop.
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
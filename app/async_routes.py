@@ -0,0 +1,190 @@
+"""Event-loop versions of the hottest endpoints, served from an ``AsyncSession``.
+
+Enabled by ``CRM_RMM_ASYNC_DB_ENABLED``: ``app.main`` then registers this
+router ahead of the threadpool routes for the same paths. Domain code stays
+synchronous and runs through ``AsyncSession.run_sync``, so its queries are
+awaited on the event loop instead of holding one of the threadpool workers.
+The alert deduplicator's lock is the exception: it is only ever taken in a
+worker thread, see ``raise_alerts``.
+"""
+
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.alert_dedup import AlertDeduplicator, AlertStormError, alert_fingerprint, get_alert_deduplicator
+from app.alert_rules import AlertRuleEngine, RuleHit, get_alert_rule_engine
+from app.async_database import get_async_db
+from app.heartbeats import HeartbeatTracker, get_heartbeat_tracker
+from app.http_cache import VersionedRoute, versioned
+from app.ingest import IngestQueue, get_ingest_queue
+from app.listing import ALERT_KEYS, TICKET_KEYS, alerts_query, fast_keyset_page, tickets_query
+from app.metric_buffer import RecentMetricsBuffer, get_metric_buffer
+from app.models import Alert, AlertSeverity, Machine, MetricSample, TicketPriority, TicketStatus
+from app.pagination import DEFAULT_LIMIT, MAX_LIMIT
+from app.schemas import (
+    AlertCreate,
+    AlertListItemOut,
+    AlertOut,
+    HeartbeatCreate,
+    MachineOut,
+    MetricBatchCreate,
+    MetricBatchOut,
+    MetricCreate,
+    MetricOut,
+    MetricQueuedOut,
+    Page,
+    TicketOut,
+)
+from app.services import prepare_metric_batch, reserve_rule_alerts, settle_alerts, write_alert, write_rule_alerts
+from app.telemetry import accept_metric, accept_metric_rows
+
+router = APIRouter(route_class=VersionedRoute)
+
+
+async def raise_alerts(db: AsyncSession, hits: list[RuleHit], dedup: AlertDeduplicator) -> None:
+    """``raise_rule_alerts`` with the deduplicator's steps in worker threads.
+
+    Its lock is a threading lock, which a threadpool request may hold: taken
+    on the event loop it would block every coroutine until released.
+    """
+    reserved = await run_in_threadpool(reserve_rule_alerts, hits, dedup)
+    written = await db.run_sync(write_rule_alerts, reserved, dedup.window_seconds)
+    await run_in_threadpool(settle_alerts, dedup, written)
+
+
+@router.post("/machines/{machine_id}/heartbeat", response_model=MachineOut)
+async def machine_heartbeat(
+    machine_id: int,
+    payload: HeartbeatCreate,
+    db: AsyncSession = Depends(get_async_db),
+    tracker: HeartbeatTracker = Depends(get_heartbeat_tracker),
+) -> MachineOut:
+    if not tracker.known(machine_id):
+        machine = await db.get(Machine, machine_id)
+        if not machine:
+            raise HTTPException(status_code=404, detail="Machine introuvable")
+        tracker.remember(machine)
+    tracker.record(machine_id, datetime.utcnow(), payload.agent_version)
+    return tracker.current(machine_id)
+
+
+@router.post(
+    "/machines/{machine_id}/metrics",
+    response_model=MetricOut,
+    responses={202: {"model": MetricQueuedOut, "description": "Échantillon mis en file d'ingestion"}},
+)
+async def push_metrics(
+    machine_id: int,
+    payload: MetricCreate,
+    db: AsyncSession = Depends(get_async_db),
+    queue: IngestQueue | None = Depends(get_ingest_queue),
+    buffer: RecentMetricsBuffer = Depends(get_metric_buffer),
+    rules: AlertRuleEngine = Depends(get_alert_rule_engine),
+    dedup: AlertDeduplicator = Depends(get_alert_deduplicator),
+) -> MetricSample | JSONResponse:
+    if not await db.get(Machine, machine_id):
+        raise HTTPException(status_code=404, detail="Machine introuvable")
+    row = {"machine_id": machine_id, **payload.model_dump(), "created_at": datetime.utcnow()}
+    metric, hits = await db.run_sync(accept_metric, row, queue, rules)
+    if hits:
+        await raise_alerts(db, hits, dedup)
+    if metric is not None or hits:
+        await db.commit()
+    buffer.extend([row])
+    if metric is None:
+        return JSONResponse(status_code=202, content=MetricQueuedOut(machine_id=machine_id).model_dump())
+    await db.refresh(metric)
+    return metric
+
+
+@router.post("/metrics/batch", response_model=MetricBatchOut)
+async def push_metrics_batch(
+    payload: MetricBatchCreate,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    queue: IngestQueue | None = Depends(get_ingest_queue),
+    buffer: RecentMetricsBuffer = Depends(get_metric_buffer),
+    rules: AlertRuleEngine = Depends(get_alert_rule_engine),
+    dedup: AlertDeduplicator = Depends(get_alert_deduplicator),
+) -> dict:
+    results, rows = await db.run_sync(prepare_metric_batch, payload.samples)
+    if hits := await db.run_sync(accept_metric_rows, rows, queue, rules):
+        await raise_alerts(db, hits, dedup)
+    await db.commit()
+    buffer.extend(rows)
+    if queue:
+        response.status_code = 202
+    accepted = sum(1 for result in results if result["accepted"])
+    return {"accepted": accepted, "rejected": len(results) - accepted, "results": results}
+
+
+@router.post("/machines/{machine_id}/alerts", response_model=AlertOut)
+async def create_alert(
+    machine_id: int,
+    payload: AlertCreate,
+    db: AsyncSession = Depends(get_async_db),
+    dedup: AlertDeduplicator = Depends(get_alert_deduplicator),
+) -> Alert:
+    machine = await db.get(Machine, machine_id)
+    if not machine:
+        raise HTTPException(status_code=404, detail="Machine introuvable")
+
+    fingerprint = alert_fingerprint(machine.id, payload.title, payload.severity.value)
+    try:
+        known_id = await run_in_threadpool(dedup.reserve, fingerprint)
+    except AlertStormError as exc:
+        raise HTTPException(status_code=429, detail=f"Tempête d'alertes: {exc}", headers={"Retry-After": "1"}) from exc
+    alert, created = await db.run_sync(
+        write_alert,
+        machine,
+        payload.severity,
+        payload.title,
+        fingerprint,
+        known_id,
+        dedup.window_seconds,
+        payload.details,
+        payload.auto_create_ticket,
+    )
+    await run_in_threadpool(dedup.settle, fingerprint, alert.id, created)
+    await db.commit()
+    await db.refresh(alert)
+    return alert
+
+
+@router.get("/alerts", response_model=Page[AlertListItemOut])
+@versioned("alerts")
+async def list_alerts(
+    machine_id: int | None = None,
+    severity: AlertSeverity | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = Query(None, description="Champs à renvoyer, séparés par des virgules"),
+    db: AsyncSession = Depends(get_async_db),
+) -> Response:
+    query, names = alerts_query(fields, machine_id, severity, start, end)
+    return await db.run_sync(fast_keyset_page, query, ALERT_KEYS, limit, cursor, names)
+
+
+@router.get("/tickets", response_model=Page[TicketOut])
+@versioned("tickets")
+async def list_tickets(
+    status: TicketStatus | None = None,
+    priority: TicketPriority | None = None,
+    client_id: int | None = None,
+    technician_id: int | None = None,
+    machine_id: int | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = Query(None, description="Champs à renvoyer, séparés par des virgules"),
+    db: AsyncSession = Depends(get_async_db),
+) -> Response:
+    query, names = tickets_query(fields, status, priority, client_id, technician_id, machine_id, start, end)
+    return await db.run_sync(fast_keyset_page, query, TICKET_KEYS, limit, cursor, names)
@@ -0,0 +1,129 @@
+"""Month-end subscription billing over every due contract, one chunk per transaction.
+
+A run walks the subscription contracts in id order. Each chunk's amounts
+are computed from one column select, its invoices go in with a single
+``INSERT ... ON CONFLICT DO NOTHING`` on the (contract, period) idempotency
+key, and the run's progress is committed in the same transaction. A run
+interrupted by a crash restarts after its last committed contract, and a
+contract already invoiced for the period, by this run or by
+``POST /billing/subscription``, is counted as such instead of being billed twice.
+"""
+
+import threading
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Engine, func, select
+from sqlalchemy.orm import Session
+
+from app.database import upsert_insert
+from app.models import BillingRun, BillingRunStatus, Contract, ContractType, Invoice, InvoiceStatus
+from app.services import subscription_amount, subscription_invoice_key
+
+BILLING_CHUNK_CONTRACTS = 1000
+
+_active_runs: set[int] = set()
+_active_lock = threading.Lock()
+
+
+def period_end(period: str) -> datetime:
+    """First instant after ``period`` ("YYYY-MM")."""
+    year, month = map(int, period.split("-"))
+    return datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def due_contracts(period: str) -> Any:
+    """Subscription contracts signed before the end of ``period``, in id order."""
+    return (
+        select(Contract.id, Contract.client_id, Contract.monthly_price, Contract.monthly_units)
+        .where(Contract.type == ContractType.SUBSCRIPTION, Contract.created_at < period_end(period))
+        .order_by(Contract.id)
+    )
+
+
+def start_billing_run(db: Session, period: str) -> BillingRun:
+    """The unfinished run for ``period`` if there is one (it will resume), else a new run."""
+    run = db.scalar(
+        select(BillingRun)
+        .where(BillingRun.period == period, BillingRun.status != BillingRunStatus.COMPLETED)
+        .order_by(BillingRun.id.desc())
+    )
+    if run is None:
+        total = db.scalar(select(func.count()).select_from(due_contracts(period).order_by(None).subquery()))
+        run = BillingRun(period=period, total_contracts=total)
+        db.add(run)
+    run.status = BillingRunStatus.RUNNING
+    run.error = None
+    run.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def insert_invoices(db: Session, rows: list[dict[str, Any]]) -> int:
+    """Insert ``rows``, skipping idempotency keys already used; returns the number inserted."""
+    statement = upsert_insert(db, Invoice).on_conflict_do_nothing(index_elements=["idempotency_key"])
+    return len(db.execute(statement.returning(Invoice.id), rows).all())
+
+
+def bill_chunk(db: Session, run: BillingRun, contracts: list[Any]) -> None:
+    now = datetime.utcnow()
+    rows = []
+    for contract in contracts:
+        amount = subscription_amount(contract.monthly_price, contract.monthly_units)
+        if amount <= 0:
+            continue
+        rows.append(
+            {
+                "client_id": contract.client_id,
+                "amount": amount,
+                "description": f"Abonnement mensuel contrat #{contract.id} ({run.period})",
+                "status": InvoiceStatus.DRAFT,
+                "created_at": now,
+                "contract_id": contract.id,
+                "period": run.period,
+                "idempotency_key": subscription_invoice_key(contract.id, run.period),
+            }
+        )
+    inserted = insert_invoices(db, rows) if rows else 0
+    run.processed += len(contracts)
+    run.invoiced += inserted
+    run.already_billed += len(rows) - inserted
+    run.skipped += len(contracts) - len(rows)
+    run.last_contract_id = contracts[-1].id
+    run.updated_at = now
+    db.commit()
+
+
+def execute_billing_run(db: Session, run_id: int, chunk_size: int = BILLING_CHUNK_CONTRACTS) -> BillingRun:
+    """Bill the contracts left in run ``run_id``; a failure marks the run failed, ready to resume."""
+    run = db.get(BillingRun, run_id)
+    try:
+        while contracts := db.execute(
+            due_contracts(run.period).where(Contract.id > run.last_contract_id).limit(chunk_size)
+        ).all():
+            bill_chunk(db, run, contracts)
+    except Exception as exc:
+        db.rollback()
+        run.status = BillingRunStatus.FAILED
+        run.error = f"{exc.__class__.__name__}: {exc}"
+    else:
+        run.status = BillingRunStatus.COMPLETED
+        run.finished_at = datetime.utcnow()
+    run.updated_at = datetime.utcnow()
+    db.commit()
+    return run
+
+
+def run_in_background(bind: Engine, run_id: int) -> None:
+    """Execute ``run_id`` unless this process is already executing it."""
+    with _active_lock:
+        if run_id in _active_runs:
+            return
+        _active_runs.add(run_id)
+    try:
+        with Session(bind=bind, autoflush=False) as db:
+            execute_billing_run(db, run_id)
+    finally:
+        with _active_lock:
+            _active_runs.discard(run_id)
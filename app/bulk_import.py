@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+from typing import Any
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models import Client, Contact, Machine
+from app.schemas import ClientCreate, ClientRef, ContactImport, MachineImport
+
+IMPORT_CHUNK_ROWS = 1000
+MAX_IMPORT_ERRORS = 100
+
+
+@dataclass(frozen=True)
+class ImportSpec:
+    model: type[Base]
+    schema: type[BaseModel]
+    # Column whose value must be new, in the database and within the upload.
+    unique: str | None = None
+
+
+IMPORTS = {
+    "clients": ImportSpec(Client, ClientCreate, unique="email"),
+    "contacts": ImportSpec(Contact, ContactImport),
+    "machines": ImportSpec(Machine, MachineImport),
+}
+IMPORT_MEDIA_TYPES = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+
+
+class BulkImporter:
+    """Imports one entity chunk by chunk: validate, resolve references, insert, commit.
+
+    Each chunk is validated in one ``TypeAdapter`` call, client references
+    are resolved with one ``IN`` query for the emails and ids not seen in
+    earlier chunks, and the surviving rows go in with a single executemany
+    insert and a commit. Rejected rows are counted and the first
+    ``max_errors`` are detailed; they never stop the import.
+    """
+
+    def __init__(self, db: Session, entity: str, max_errors: int = MAX_IMPORT_ERRORS) -> None:
+        self.db = db
+        self.entity = entity
+        self.spec = IMPORTS[entity]
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.rejected = 0
+        self.errors: list[dict[str, Any]] = []
+        self._adapter = TypeAdapter(list[self.spec.schema])
+        self._seen: set[Any] = set()
+        self._client_emails: dict[str, int] = {}
+        self._client_ids: set[int] = set()
+
+    def reject(self, index: int, error: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"index": index, "error": error})
+
+    def add_chunk(self, rows: list[tuple[int, dict[str, Any]]]) -> None:
+        items = self._validate(rows)
+        if self.spec.unique:
+            items = self._unique(items)
+        if issubclass(self.spec.schema, ClientRef):
+            items = self._resolve_clients(items)
+        if not items:
+            return
+        try:
+            self.db.execute(insert(self.spec.model), [values for _, values in items])
+            self.db.commit()
+        except SQLAlchemyError as exc:
+            self.db.rollback()
+            for index, _ in items:
+                self.reject(index, f"Erreur d'insertion : {exc.__class__.__name__}")
+            return
+        self.inserted += len(items)
+
+    def result(self) -> dict[str, Any]:
+        return {"entity": self.entity, "inserted": self.inserted, "rejected": self.rejected, "errors": self.errors}
+
+    def _validate(self, rows: list[tuple[int, dict[str, Any]]]) -> list[tuple[int, dict[str, Any]]]:
+        # CSV cells are strings: an empty cell means "no value".
+        values = [{key: value for key, value in row.items() if value != ""} for _, row in rows]
+        positions = list(range(len(rows)))
+        try:
+            models = self._adapter.validate_python(values)
+        except ValidationError as exc:
+            failed: dict[int, str] = {}
+            for error in exc.errors():
+                position, *location = error["loc"]
+                field = ".".join(str(part) for part in location)
+                failed.setdefault(position, f"{field}: {error['msg']}" if field else error["msg"])
+            for position, message in sorted(failed.items()):
+                self.reject(rows[position][0], message)
+            positions = [position for position in positions if position not in failed]
+            models = self._adapter.validate_python([values[position] for position in positions])
+        return [(rows[position][0], model.model_dump()) for position, model in zip(positions, models)]
+
+    def _unique(self, items: list[tuple[int, dict[str, Any]]]) -> list[tuple[int, dict[str, Any]]]:
+        column = self.spec.model.__table__.c[self.spec.unique]
+        candidates = {values[self.spec.unique] for _, values in items} - self._seen
+        existing = set(self.db.scalars(select(column).where(column.in_(candidates)))) if candidates else set()
+        kept = []
+        for index, values in items:
+            value = values[self.spec.unique]
+            if value in self._seen or value in existing:
+                self.reject(index, f"{self.spec.unique} déjà utilisé : {value}")
+                continue
+            self._seen.add(value)
+            kept.append((index, values))
+        return kept
+
+    def _resolve_clients(self, items: list[tuple[int, dict[str, Any]]]) -> list[tuple[int, dict[str, Any]]]:
+        emails = {values["client_email"] for _, values in items if values["client_id"] is None}
+        emails -= self._client_emails.keys()
+        if emails:
+            self._client_emails.update(self.db.execute(select(Client.email, Client.id).where(Client.email.in_(emails))).all())
+        ids = {values["client_id"] for _, values in items if values["client_id"] is not None} - self._client_ids
+        if ids:
+            self._client_ids.update(self.db.scalars(select(Client.id).where(Client.id.in_(ids))))
+
+        kept = []
+        for index, values in items:
+            email = values.pop("client_email")
+            reference = values["client_id"] if values["client_id"] is not None else email
+            if values["client_id"] is None:
+                values["client_id"] = self._client_emails.get(email)
+            elif values["client_id"] not in self._client_ids:
+                values["client_id"] = None
+            if values["client_id"] is None:
+                self.reject(index, f"Client introuvable : {reference}")
+                continue
+            kept.append((index, values))
+        return kept
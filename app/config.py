@@ -0,0 +1,60 @@
+import os
+from dataclasses import dataclass, fields
+
+ENV_PREFIX = "CRM_RMM_"
+
+
+@dataclass(frozen=True)
+class Settings:
+    database_url: str = "sqlite:///./crm_rmm.db"
+    sqlite_journal_mode: str = "wal"
+    sqlite_synchronous: str = "normal"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_kb: int = 64 * 1024
+    sqlite_mmap_size_bytes: int = 256 * 1024 * 1024
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_pre_ping: bool = True
+    db_pool_recycle_seconds: int = 1800
+    db_statement_cache_size: int = 500
+    ingest_queue_enabled: bool = False
+    ingest_queue_size: int = 10_000
+    ingest_batch_size: int = 500
+    ingest_flush_ms: int = 200
+    ingest_workers: int = 1
+    ingest_write_attempts: int = 3
+    max_request_body_bytes: int = 32 * 1024 * 1024
+    async_db_enabled: bool = False
+    heartbeat_flush_seconds: float = 30.0
+    alert_dedup_window_seconds: float = 900.0
+    alert_max_inserts_per_second: float = 20.0
+    alert_storm_burst: int = 100
+    inventory_keyframe_interval: int = 10
+    dashboard_reconcile_seconds: float = 300.0
+    prebilling_consolidate_seconds: float = 3600.0
+    http_cache_enabled: bool = False
+    """ETags and the GET response cache; single worker only, since table versions only follow this process's writes."""
+    response_cache_entries: int = 256
+    metrics_buffer_window: int = 60
+    metrics_rollup_interval_seconds: float = 60.0
+    metrics_rollup_lag_ids: int = 5000
+    metrics_raw_retention_hours: int = 48
+    metrics_1m_retention_days: int = 7
+    metrics_5m_retention_days: int = 31
+    metrics_1h_retention_days: int = 400
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        values: dict[str, object] = {}
+        for field in fields(cls):
+            raw = os.environ.get(f"{ENV_PREFIX}{field.name.upper()}")
+            if raw is None:
+                continue
+            if isinstance(field.default, bool):
+                values[field.name] = raw.strip().lower() in {"1", "true", "yes", "on"}
+            else:
+                values[field.name] = type(field.default)(raw)
+        return cls(**values)
+
+
+settings = Settings.from_env()
@@ -0,0 +1,186 @@
+import threading
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from app.models import Alert, Client, Invoice, Machine, Prospect, Ticket
+from app.services import INSERTED_ALERTS_KEY, OPEN_TICKET_STATUSES, UNPAID_INVOICE_STATUSES, dashboard_counts
+
+ALERT_WINDOW = timedelta(hours=24)
+EPOCH = datetime(1970, 1, 1)
+# Tables whose row count feeds a counter: any bulk insert/delete on them
+# bypasses the per-object tracking and invalidates the cache.
+COUNTED_TABLES = frozenset({"clients", "prospects", "machines", "tickets", "alerts", "invoices"})
+STATUS_TABLES = frozenset({"tickets", "invoices"})
+PENDING_KEY = "dashboard_pending"
+ROW_COUNTERS: dict[type, str] = {Client: "clients", Prospect: "prospects", Machine: "machines"}
+# Status-bearing models: counter key and whether a given status is counted.
+STATUS_COUNTERS: dict[type, tuple[str, Callable[[Any], bool]]] = {
+    Ticket: ("open_tickets", lambda status: status in OPEN_TICKET_STATUSES),
+    Invoice: ("unpaid_invoices", lambda status: status in UNPAID_INVOICE_STATUSES),
+}
+
+
+def _minute(moment: datetime) -> int:
+    return int((moment - EPOCH).total_seconds() // 60)
+
+
+class DashboardCounters:
+    """In-memory dashboard counters kept current by the ORM write paths.
+
+    ``after_flush`` turns new, deleted and status-changed objects into
+    deltas held on the session, applied on commit and dropped on rollback.
+    Bulk statements on counted tables simply invalidate the cache, and
+    ``reconcile`` (periodic job) reloads everything in one query, which
+    also corrects drift from writes done outside the ORM. Alerts are kept
+    as per-minute buckets so the 24 h window can slide without a query.
+    """
+
+    def __init__(self, clock: Callable[[], datetime] = datetime.utcnow) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counts: dict[str, int] | None = None
+        self._alert_minutes: dict[int, int] = {}
+        self.reloads = 0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = None
+            self._alert_minutes = {}
+            self.reloads = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._counts = None
+
+    def reconcile(self, db: Session) -> dict[str, int]:
+        counts = dashboard_counts(db)
+        since = self._clock() - ALERT_WINDOW
+        minutes: dict[int, int] = {}
+        for created_at in db.scalars(
+            select(Alert.created_at).where(Alert.created_at >= since).execution_options(yield_per=10_000)
+        ):
+            minute = _minute(created_at)
+            minutes[minute] = minutes.get(minute, 0) + 1
+        with self._lock:
+            self._counts = {key: value for key, value in counts.items() if key != "alerts_24h"}
+            self._alert_minutes = minutes
+            self.reloads += 1
+        return counts
+
+    def snapshot(self, db: Session) -> dict[str, int]:
+        with self._lock:
+            if self._counts is not None:
+                return {**self._counts, "alerts_24h": self._alerts_in_window()}
+        return self.reconcile(db)
+
+    def apply(self, deltas: dict[str, int], alert_times: list[datetime]) -> None:
+        with self._lock:
+            if self._counts is None:
+                return
+            for key, delta in deltas.items():
+                self._counts[key] += delta
+            for created_at in alert_times:
+                minute = _minute(created_at)
+                self._alert_minutes[minute] = self._alert_minutes.get(minute, 0) + 1
+
+    def _alerts_in_window(self) -> int:
+        oldest = _minute(self._clock() - ALERT_WINDOW)
+        for minute in [minute for minute in self._alert_minutes if minute < oldest]:
+            del self._alert_minutes[minute]
+        return sum(self._alert_minutes.values())
+
+
+dashboard_counters = DashboardCounters()
+
+
+def get_dashboard_counters() -> DashboardCounters:
+    return dashboard_counters
+
+
+def _pending(session: Session) -> dict[str, Any]:
+    return session.info.setdefault(PENDING_KEY, {"deltas": {}, "alerts": [], "stale": False})
+
+
+def _add(deltas: dict[str, int], key: str, delta: int) -> None:
+    deltas[key] = deltas.get(key, 0) + delta
+
+
+def _contribution(obj: object) -> tuple[str, int] | None:
+    if type(obj) in ROW_COUNTERS:
+        return ROW_COUNTERS[type(obj)], 1
+    if type(obj) in STATUS_COUNTERS:
+        key, counted = STATUS_COUNTERS[type(obj)]
+        return key, int(counted(obj.status))
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session: Session, flush_context: Any) -> None:
+    pending = _pending(session)
+    deltas = pending["deltas"]
+    for obj in session.new:
+        if isinstance(obj, Alert):
+            pending["alerts"].append(obj.created_at or datetime.utcnow())
+        elif counted := _contribution(obj):
+            _add(deltas, *counted)
+    for obj in session.deleted:
+        if isinstance(obj, Alert):
+            pending["stale"] = True
+        elif counted := _contribution(obj):
+            _add(deltas, counted[0], -counted[1])
+    for obj in session.dirty:
+        if type(obj) not in STATUS_COUNTERS:
+            continue
+        history = inspect(obj).attrs.status.history
+        if not history.added:
+            continue
+        if not history.deleted:
+            # Previous status unknown (expired attribute): recount instead of guessing.
+            pending["stale"] = True
+            continue
+        key, counted = STATUS_COUNTERS[type(obj)]
+        _add(deltas, key, int(counted(history.added[0])) - int(counted(history.deleted[0])))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk(state: ORMExecuteState) -> None:
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = getattr(state.statement, "table", None)
+    if table is None or table.name not in COUNTED_TABLES:
+        return
+    if state.execution_options.get(INSERTED_ALERTS_KEY):
+        # Reported by ``write_alert`` in ``session.info`` once the row exists.
+        _pending(state.session)
+        return
+    if state.is_update:
+        if table.name not in STATUS_TABLES:
+            return
+        parameters = state.parameters if isinstance(state.parameters, list) else [state.parameters or {}]
+        keys = set(state.statement.compile().params).union(*(row.keys() for row in parameters))
+        if "status" not in keys:
+            return
+    _pending(state.session)["stale"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_commit(session: Session) -> None:
+    pending = session.info.pop(PENDING_KEY, None)
+    inserted_alerts = session.info.pop(INSERTED_ALERTS_KEY, [])
+    if pending is None:
+        return
+    pending["alerts"].extend(inserted_alerts)
+    if pending["stale"]:
+        dashboard_counters.invalidate()
+    else:
+        dashboard_counters.apply(pending["deltas"], pending["alerts"])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rollback(session: Session) -> None:
+    session.info.pop(PENDING_KEY, None)
+    session.info.pop(INSERTED_ALERTS_KEY, None)
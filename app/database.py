@@ -1,11 +1,75 @@
-from collections.abc import Generator
+from collections.abc import Callable, Generator
+from typing import Any
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
-DATABASE_URL = "sqlite:///./crm_rmm.db"
+from app.config import Settings, settings
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_URL = settings.database_url
+# Inserts supporting ``on_conflict_do_nothing`` / ``on_conflict_do_update``.
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def engine_options(url: str, config: Settings = settings) -> dict[str, Any]:
+    """``create_engine`` keyword arguments for the backend behind ``url``."""
+    backend = make_url(url)
+    options: dict[str, Any] = {"query_cache_size": config.db_statement_cache_size}
+    if backend.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False} if backend.get_driver_name() == "pysqlite" else {}
+        return options
+    options.update(
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_pre_ping=config.db_pool_pre_ping,
+        pool_recycle=config.db_pool_recycle_seconds,
+    )
+    # Server-side prepared statements, reused per connection.
+    if backend.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": config.db_statement_cache_size}
+    elif backend.get_driver_name() == "psycopg":
+        options["connect_args"] = {"prepare_threshold": 5}
+    return options
+
+
+def sqlite_pragmas(config: Settings = settings) -> dict[str, str | int]:
+    return {
+        "journal_mode": config.sqlite_journal_mode,
+        "synchronous": config.sqlite_synchronous,
+        "busy_timeout": config.sqlite_busy_timeout_ms,
+        # Negative: a size in KiB rather than in pages.
+        "cache_size": -config.sqlite_cache_size_kb,
+        "mmap_size": config.sqlite_mmap_size_bytes,
+    }
+
+
+def create_database_engine(
+    url: str = DATABASE_URL, config: Settings = settings, factory: Callable[..., Any] = create_engine
+) -> Any:
+    """Engine for ``url`` tuned from ``config``; ``factory`` may be ``create_async_engine``.
+
+    SQLite connections get their pragmas on connect: WAL lets readers run
+    alongside the single writer, ``synchronous=NORMAL`` syncs at checkpoints
+    rather than on every commit, and ``busy_timeout`` makes a blocked writer
+    wait instead of failing with "database is locked".
+    """
+    engine = factory(url, **engine_options(url, config))
+    if engine.dialect.name == "sqlite":
+        pragmas = sqlite_pragmas(config)
+
+        @event.listens_for(getattr(engine, "sync_engine", engine), "connect")
+        def apply_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return engine
+
+
+engine: Engine = create_database_engine()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 
@@ -13,6 +77,11 @@ class Base(DeclarativeBase):
     pass
 
 
+def upsert_insert(db: Session, model: Any) -> Any:
+    """``INSERT`` for ``model`` in the session's dialect, with its ``ON CONFLICT`` clauses."""
+    return UPSERT_INSERTS[db.get_bind().dialect.name](model)
+
+
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
     try:
@@ -0,0 +1,74 @@
+import csv
+import io
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import Table, select
+from sqlalchemy.orm import Session
+
+from app.models import Invoice, MetricSample, Ticket
+from app.serialization import csv_value, dumps
+
+EXPORT_CHUNK_ROWS = 5000
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    table: Table
+    # Query parameters accepted as equality filters for this entity.
+    filters: tuple[str, ...]
+
+
+EXPORTS = {
+    "tickets": ExportSpec(Ticket.__table__, ("client_id", "machine_id", "technician_id", "status")),
+    "invoices": ExportSpec(Invoice.__table__, ("client_id", "status")),
+    "metrics": ExportSpec(MetricSample.__table__, ("machine_id",)),
+}
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def iter_export(
+    db: Session,
+    entity: str,
+    fmt: str,
+    filters: dict[str, object] | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> Iterator[bytes]:
+    """Stream ``entity`` rows as NDJSON or CSV, one encoded chunk per ``chunk_rows`` rows.
+
+    Rows come from a Core select with ``yield_per``, so there is no ORM
+    identity map and no Pydantic model per row, and memory stays bounded by
+    one chunk whatever the row count.
+    """
+    spec = EXPORTS[entity]
+    columns = list(spec.table.columns)
+    # Same order as the list endpoints, so every filter is served by its (..., created_at, id) index.
+    query = select(*columns).order_by(spec.table.c.created_at, spec.table.c.id)
+    for name, value in (filters or {}).items():
+        if value is not None:
+            query = query.where(spec.table.c[name] == value)
+    if start is not None:
+        query = query.where(spec.table.c.created_at >= start)
+    if end is not None:
+        query = query.where(spec.table.c.created_at < end)
+
+    keys = [column.key for column in columns]
+    result = db.execute(query.execution_options(yield_per=chunk_rows))
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(keys)
+        for rows in result.partitions():
+            writer.writerows([csv_value(value) for value in row] for row in rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+        return
+
+    for rows in result.partitions():
+        yield b"".join(dumps(dict(zip(keys, row))) + b"\n" for row in rows)
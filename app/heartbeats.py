@@ -0,0 +1,110 @@
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.http_cache import resource_versions
+from app.models import Machine
+from app.schemas import MachineOut
+
+
+@dataclass(slots=True)
+class LastSeen:
+    heartbeat_at: datetime
+    agent_version: str | None
+
+
+class HeartbeatTracker:
+    """Coalesces agent heartbeats in memory and persists them in bulk.
+
+    Every heartbeat only updates the last-seen map; ``flush`` writes the
+    machines that changed since the previous flush with a single executemany
+    UPDATE, so a fleet costs one write transaction per interval instead of one
+    per ping.
+
+    The tracker also keeps the row of each machine that has pinged
+    (machines are never updated elsewhere nor deleted), so later pings are
+    answered without reading the database. Each heartbeat bumps the
+    in-memory ``heartbeats`` version, which machine listings depend on
+    alongside ``machines``, so their ETag and cached page change before the
+    flush writes the rows.
+    """
+
+    def __init__(self, flush_interval_seconds: float = 30.0) -> None:
+        self.flush_interval_seconds = flush_interval_seconds
+        self._last_seen: dict[int, LastSeen] = {}
+        self._machines: dict[int, MachineOut] = {}
+        self._dirty: set[int] = set()
+        self._lock = threading.Lock()
+        self.flushed_rows = 0
+        self.flushes = 0
+
+    def record(self, machine_id: int, heartbeat_at: datetime, agent_version: str | None = None) -> None:
+        with self._lock:
+            previous = self._last_seen.get(machine_id)
+            if agent_version is None and previous is not None:
+                agent_version = previous.agent_version
+            self._last_seen[machine_id] = LastSeen(heartbeat_at, agent_version)
+            self._dirty.add(machine_id)
+        resource_versions.bump("heartbeats")
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._dirty)
+
+    def known(self, machine_id: int) -> bool:
+        return machine_id in self._machines
+
+    def remember(self, machine: Machine) -> None:
+        self._machines.setdefault(machine.id, MachineOut.model_validate(machine))
+
+    def current(self, machine_id: int) -> MachineOut:
+        """Merged state of a machine passed to ``remember``."""
+        return self._merge_out(self._machines[machine_id])
+
+    def merge(self, machine: Machine) -> MachineOut:
+        return self._merge_out(MachineOut.model_validate(machine))
+
+    def _merge_out(self, out: MachineOut) -> MachineOut:
+        seen = self._last_seen.get(out.id)
+        if seen is None or (out.heartbeat_at is not None and out.heartbeat_at >= seen.heartbeat_at):
+            return out
+        changes: dict[str, Any] = {"heartbeat_at": seen.heartbeat_at}
+        if seen.agent_version:
+            changes["agent_version"] = seen.agent_version
+        return out.model_copy(update=changes)
+
+    def flush(self, db: Session) -> int:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            rows: list[dict[str, Any]] = []
+            for machine_id in dirty:
+                seen = self._last_seen[machine_id]
+                row: dict[str, Any] = {"id": machine_id, "heartbeat_at": seen.heartbeat_at}
+                if seen.agent_version:
+                    row["agent_version"] = seen.agent_version
+                rows.append(row)
+        if not rows:
+            return 0
+        try:
+            db.execute(update(Machine), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        self.flushed_rows += len(rows)
+        self.flushes += 1
+        return len(rows)
+
+
+heartbeat_tracker = HeartbeatTracker(settings.heartbeat_flush_seconds)
+
+
+def get_heartbeat_tracker() -> HeartbeatTracker:
+    return heartbeat_tracker
@@ -0,0 +1,179 @@
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Coroutine
+from typing import Any, TypeVar
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from app.config import settings
+
+PENDING_KEY = "resource_versions_pending"
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class ResourceVersions:
+    """Per-table change counters, bumped when a transaction touching the table commits.
+
+    Counters live in this process only (like the heartbeat tracker and the
+    metric buffer); the boot nonce keeps ETags from a previous process from
+    ever matching.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._versions: dict[str, int] = {}
+        self._listeners: list[Callable[[set[str]], None]] = []
+        self._nonce = secrets.token_hex(4)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._versions.clear()
+            self._nonce = secrets.token_hex(4)
+
+    def subscribe(self, listener: Callable[[set[str]], None]) -> None:
+        self._listeners.append(listener)
+
+    def bump(self, *tables: str) -> None:
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+        for listener in self._listeners:
+            listener(set(tables))
+
+    def token(self, tables: tuple[str, ...]) -> str:
+        with self._lock:
+            return self._nonce + "".join(f".{self._versions.get(table, 0)}" for table in tables)
+
+
+class ResponseCache:
+    """Small LRU of rendered GET responses, dropped as soon as one of their tables changes."""
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[frozenset[str], str, Response]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def get(self, key: str, etag: str) -> Response | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: str, tables: tuple[str, ...], etag: str, response: Response) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (frozenset(tables), etag, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tables: set[str]) -> None:
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] & tables]:
+                del self._entries[key]
+
+
+resource_versions = ResourceVersions()
+response_cache = ResponseCache(settings.response_cache_entries)
+resource_versions.subscribe(response_cache.invalidate)
+
+
+def versioned(*tables: str) -> Callable[[F], F]:
+    """Mark a GET endpoint as depending only on ``tables`` (see ``VersionedRoute``)."""
+
+    def decorate(endpoint: F) -> F:
+        endpoint.__versioned_tables__ = tables
+        return endpoint
+
+    return decorate
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    candidates = {candidate.strip() for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or etag.removeprefix("W/") in candidates
+
+
+class VersionedRoute(APIRoute):
+    """Adds ETag / If-None-Match and the response cache to ``@versioned`` endpoints.
+
+    The ETag is computed from the table versions alone, so a matching
+    ``If-None-Match`` or a cache hit answers before dependencies run, without
+    opening a session. Versions only follow writes made by this process, so
+    the whole mechanism is off unless ``http_cache_enabled`` is set, which is
+    only correct with a single worker.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+        tables: tuple[str, ...] | None = getattr(self.endpoint, "__versioned_tables__", None)
+        if tables is None:
+            return handler
+        name = self.name
+
+        async def versioned_handler(request: Request) -> Response:
+            if not settings.http_cache_enabled:
+                return await handler(request)
+            digest = hashlib.sha1(f"{request.url.path}?{request.url.query}".encode()).hexdigest()[:16]
+            etag = f'W/"{name}-{digest}-{resource_versions.token(tables)}"'
+            if _matches(request.headers.get("if-none-match", ""), etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            key = f"{request.url.path}?{request.url.query}"
+            cached = response_cache.get(key, etag)
+            if cached is not None:
+                return cached
+
+            response = await handler(request)
+            if response.status_code == 200 and hasattr(response, "body"):
+                response.headers["ETag"] = etag
+                response_cache.put(key, tables, etag, response)
+            return response
+
+        return versioned_handler
+
+
+def _pending(session: Session) -> set[str]:
+    return session.info.setdefault(PENDING_KEY, set())
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session: Session, flush_context: Any) -> None:
+    tables = _pending(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tables.add(obj.__table__.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk(state: ORMExecuteState) -> None:
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        if table is not None:
+            _pending(state.session).add(table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_commit(session: Session) -> None:
+    tables = session.info.pop(PENDING_KEY, None)
+    if tables:
+        resource_versions.bump(*tables)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rollback(session: Session) -> None:
+    session.info.pop(PENDING_KEY, None)
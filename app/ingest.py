@@ -0,0 +1,203 @@
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.config import Settings
+from app.models import MetricSample
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class IngestQueue:
+    """Bounded in-process write-behind queue for agent metric samples.
+
+    Endpoints enqueue rows and answer immediately; worker threads drain the
+    buffer and group-commit every ``batch_size`` rows or ``flush_interval_ms``,
+    whichever comes first. Accepted rows have already been acknowledged, so a
+    failed group commit is retried up to ``write_attempts`` times, with a
+    growing pause, before the batch is dropped; dropped rows are logged and
+    counted as ``failed``.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        maxsize: int = 10_000,
+        batch_size: int = 500,
+        flush_interval_ms: int = 200,
+        workers: int = 1,
+        write_attempts: int = 3,
+    ) -> None:
+        self._session_factory = session_factory
+        self.maxsize = maxsize
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval_ms / 1000
+        self._worker_count = workers
+        self._write_attempts = max(1, write_attempts)
+        self._buffer: deque[dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._closing = False
+        self._in_flight = 0
+        self._enqueued = 0
+        self._written = 0
+        self._rejected = 0
+        self._failed = 0
+        self._retries = 0
+        self._flushes = 0
+        self._flush_ms_total = 0.0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+    @classmethod
+    def from_settings(cls, session_factory: Callable[[], Session], settings: Settings) -> "IngestQueue":
+        return cls(
+            session_factory,
+            maxsize=settings.ingest_queue_size,
+            batch_size=settings.ingest_batch_size,
+            flush_interval_ms=settings.ingest_flush_ms,
+            workers=settings.ingest_workers,
+            write_attempts=settings.ingest_write_attempts,
+        )
+
+    def start(self) -> None:
+        for index in range(self._worker_count):
+            thread = threading.Thread(target=self._run, name=f"ingest-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit_metrics(self, rows: list[dict[str, Any]]) -> None:
+        with self._cond:
+            if self._closing:
+                self._rejected += len(rows)
+                raise QueueFullError("ingest queue is shutting down")
+            if len(self._buffer) + len(rows) > self.maxsize:
+                self._rejected += len(rows)
+                raise QueueFullError(f"ingest queue full ({len(self._buffer)}/{self.maxsize})")
+            self._buffer.extend(rows)
+            self._enqueued += len(rows)
+            self._cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until everything enqueued so far has been written."""
+        with self._cond:
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._buffer and not self._in_flight, timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+        # Workers exit once the buffer is empty; anything left (no workers
+        # started, or join timed out) is written synchronously here.
+        while self._buffer:
+            with self._cond:
+                batch = self._take_batch()
+            self._write(batch)
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            return {
+                "enabled": True,
+                "depth": len(self._buffer),
+                "in_flight": self._in_flight,
+                "capacity": self.maxsize,
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "rejected": self._rejected,
+                "failed": self._failed,
+                "retries": self._retries,
+                "flushes": self._flushes,
+                "last_flush_ms": round(self._last_flush_ms, 3),
+                "max_flush_ms": round(self._max_flush_ms, 3),
+                "avg_flush_ms": round(self._flush_ms_total / self._flushes, 3) if self._flushes else 0.0,
+            }
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closing:
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+                deadline = time.monotonic() + self._flush_interval
+                while len(self._buffer) < self._batch_size and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+            self._write(batch)
+
+    def _take_batch(self) -> list[dict[str, Any]]:
+        count = min(len(self._buffer), self._batch_size)
+        self._in_flight += count
+        return [self._buffer.popleft() for _ in range(count)]
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        for attempt in range(1, self._write_attempts + 1):
+            started = time.perf_counter()
+            db = self._session_factory()
+            try:
+                db.execute(insert(MetricSample), batch)
+                db.commit()
+                break
+            except Exception:
+                db.rollback()
+                if attempt == self._write_attempts:
+                    logger.exception("ingest group commit failed %d times, dropping %d rows", attempt, len(batch))
+                    with self._cond:
+                        self._in_flight -= len(batch)
+                        self._failed += len(batch)
+                        self._cond.notify_all()
+                    return
+                logger.warning("ingest group commit failed, retrying %d rows", len(batch), exc_info=True)
+                with self._cond:
+                    self._retries += 1
+            finally:
+                db.close()
+            time.sleep(self._flush_interval * attempt)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self._cond:
+            self._in_flight -= len(batch)
+            self._written += len(batch)
+            self._flushes += 1
+            self._flush_ms_total += elapsed_ms
+            self._last_flush_ms = elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            self._cond.notify_all()
+
+
+_ingest_queue: IngestQueue | None = None
+
+
+def start_ingest_queue(session_factory: Callable[[], Session], settings: Settings) -> IngestQueue:
+    global _ingest_queue
+    _ingest_queue = IngestQueue.from_settings(session_factory, settings)
+    _ingest_queue.start()
+    return _ingest_queue
+
+
+def stop_ingest_queue() -> None:
+    global _ingest_queue
+    if _ingest_queue is not None:
+        _ingest_queue.close()
+        _ingest_queue = None
+
+
+def get_ingest_queue() -> IngestQueue | None:
+    return _ingest_queue
@@ -0,0 +1,193 @@
+import copy
+import hashlib
+import json
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.interfaces import ORMOption
+
+from app.models import InventorySnapshot, Machine
+
+# Delta operations: ["set", path, value], ["del", path], ["trunc", path, length].
+# Paths are lists of dict keys and list indices from the document root.
+Delta = list[list[Any]]
+
+
+def canonical_json(document: Any) -> str:
+    return json.dumps(document, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def content_hash(document: Any) -> str:
+    return hashlib.sha256(canonical_json(document).encode()).hexdigest()
+
+
+def diff(old: Any, new: Any, path: tuple[Any, ...] = ()) -> Delta:
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: Delta = [["del", [*path, key]] for key in old if key not in new]
+        for key, value in new.items():
+            if key in old:
+                ops.extend(diff(old[key], value, (*path, key)))
+            else:
+                ops.append(["set", [*path, key], value])
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        ops = []
+        common = min(len(old), len(new))
+        for index in range(common):
+            ops.extend(diff(old[index], new[index], (*path, index)))
+        if len(old) > common:
+            ops.append(["trunc", list(path), common])
+        ops.extend(["set", [*path, index], new[index]] for index in range(common, len(new)))
+        return ops
+    if type(old) is type(new) and old == new:
+        return []
+    return [["set", list(path), new]]
+
+
+def apply_delta(document: Any, ops: Delta) -> Any:
+    """Apply ``ops`` in place and return the (possibly replaced) root."""
+    for op, path, *args in ops:
+        if op == "trunc":
+            target = document
+            for key in path:
+                target = target[key]
+            del target[args[0]:]
+            continue
+        if not path:
+            document = copy.deepcopy(args[0])
+            continue
+        parent = document
+        for key in path[:-1]:
+            parent = parent[key]
+        last = path[-1]
+        if op == "del":
+            del parent[last]
+        elif isinstance(parent, list) and last == len(parent):
+            parent.append(copy.deepcopy(args[0]))
+        else:
+            parent[last] = copy.deepcopy(args[0])
+    return document
+
+
+def latest_snapshot(db: Session, machine_id: int, *options: ORMOption) -> InventorySnapshot | None:
+    return db.scalars(
+        select(InventorySnapshot)
+        .options(*options)
+        .where(InventorySnapshot.machine_id == machine_id)
+        .order_by(InventorySnapshot.id.desc())
+        .limit(1)
+    ).first()
+
+
+def snapshot_at(db: Session, machine_id: int, at: datetime, *options: ORMOption) -> InventorySnapshot | None:
+    return db.scalars(
+        select(InventorySnapshot)
+        .options(*options)
+        .where(InventorySnapshot.machine_id == machine_id, InventorySnapshot.created_at <= at)
+        .order_by(InventorySnapshot.created_at.desc(), InventorySnapshot.id.desc())
+        .limit(1)
+    ).first()
+
+
+def previous_snapshot(db: Session, snapshot: InventorySnapshot) -> InventorySnapshot | None:
+    return db.scalars(
+        select(InventorySnapshot)
+        .where(InventorySnapshot.machine_id == snapshot.machine_id, InventorySnapshot.id < snapshot.id)
+        .order_by(InventorySnapshot.id.desc())
+        .limit(1)
+    ).first()
+
+
+def reconstruct(db: Session, snapshot: InventorySnapshot) -> dict:
+    """Rebuild a full inventory from its keyframe and the deltas up to ``snapshot``."""
+    if snapshot.is_keyframe:
+        return copy.deepcopy(snapshot.raw_json)
+    chain = db.scalars(
+        select(InventorySnapshot)
+        .where(
+            or_(
+                InventorySnapshot.id == snapshot.keyframe_id,
+                and_(InventorySnapshot.keyframe_id == snapshot.keyframe_id, InventorySnapshot.id <= snapshot.id),
+            )
+        )
+        .order_by(InventorySnapshot.id)
+    ).all()
+    # Each delta applies to the newest earlier link one position before it. Walking back that way skips
+    # sibling deltas computed against the same parent (left by concurrent submissions before the lock).
+    links: list[InventorySnapshot] = []
+    position = snapshot.chain_position
+    for link in reversed(chain[1:]):
+        if link.chain_position == position:
+            links.append(link)
+            position -= 1
+    document = copy.deepcopy(chain[0].raw_json)
+    for link in reversed(links):
+        document = apply_delta(document, link.delta_json)
+    return document
+
+
+def store_inventory(
+    db: Session, machine: Machine, document: dict, keyframe_interval: int
+) -> tuple[InventorySnapshot, str]:
+    """Store ``document`` as nothing, a delta or a keyframe; returns the snapshot and the storage kind."""
+    digest = content_hash(document)
+    # One submission per machine at a time, so every delta is computed against the latest snapshot
+    # (row lock on PostgreSQL; SQLite has one writer anyway).
+    db.execute(select(Machine.id).where(Machine.id == machine.id).with_for_update())
+    previous = latest_snapshot(db, machine.id)
+    machine.last_inventory_at = datetime.utcnow()
+    db.add(machine)
+
+    if previous is not None:
+        previous_hash = previous.content_hash
+        if previous_hash is None and previous.is_keyframe:
+            previous_hash = content_hash(previous.raw_json)
+        if previous_hash == digest:
+            return previous, "unchanged"
+
+    if previous is not None and previous.chain_position + 1 < keyframe_interval:
+        ops = diff(reconstruct(db, previous), document)
+        # A delta bigger than half the document saves little and slows reconstruction.
+        if len(canonical_json(ops)) * 2 < len(canonical_json(document)):
+            snapshot = InventorySnapshot(
+                machine_id=machine.id,
+                delta_json=ops,
+                content_hash=digest,
+                keyframe_id=previous.keyframe_id or previous.id,
+                chain_position=previous.chain_position + 1,
+            )
+            db.add(snapshot)
+            return snapshot, "delta"
+
+    snapshot = InventorySnapshot(machine_id=machine.id, raw_json=document, content_hash=digest, chain_position=0)
+    db.add(snapshot)
+    return snapshot, "full"
+
+
+def inventory_changes(db: Session, machine_id: int, start: datetime | None, end: datetime | None) -> list[dict]:
+    query = select(InventorySnapshot).where(InventorySnapshot.machine_id == machine_id)
+    if start is not None:
+        query = query.where(InventorySnapshot.created_at >= start)
+    if end is not None:
+        query = query.where(InventorySnapshot.created_at < end)
+    snapshots = db.scalars(query.order_by(InventorySnapshot.id)).all()
+
+    changes = []
+    for index, snapshot in enumerate(snapshots):
+        if not snapshot.is_keyframe:
+            ops = snapshot.delta_json
+        else:
+            # Keyframes store no delta; diff them against the snapshot just before.
+            before = snapshots[index - 1] if index else previous_snapshot(db, snapshot)
+            ops = diff(reconstruct(db, before), snapshot.raw_json) if before is not None else None
+        changes.append(
+            {
+                "snapshot_id": snapshot.id,
+                "created_at": snapshot.created_at,
+                "storage": "full" if snapshot.is_keyframe else "delta",
+                "changes": ops,
+            }
+        )
+    return changes
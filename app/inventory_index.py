@@ -0,0 +1,214 @@
+import math
+import re
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import Select, delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.models import InstalledSoftware, InventoryFact, InventorySnapshot, Machine
+
+# Inventory lists holding installed software; they go to InstalledSoftware
+# instead of being flattened into facts.
+SOFTWARE_KEYS = ("software", "applications", "installed_software")
+NAME_KEYS = ("name", "DisplayName")
+VERSION_KEYS = ("version", "DisplayVersion")
+MAX_TEXT = 255
+
+FILTER_PATTERN = re.compile(r"^\s*([\w.*-]+)\s*(<=|>=|!=|=|<|>|~)\s*(.*?)\s*$")
+VERSION_PATTERN = re.compile(r"^\s*(<=|>=|!=|=|<|>)?\s*(\S+)\s*$")
+
+
+@dataclass(frozen=True)
+class Condition:
+    path: str
+    operator: str
+    value: str
+
+
+def parse_condition(expression: str) -> Condition:
+    match = FILTER_PATTERN.match(expression)
+    if not match:
+        raise ValueError(f"Filtre invalide : {expression!r}")
+    path, operator, value = match.groups()
+    return Condition(path, operator, value)
+
+
+def parse_version_condition(expression: str) -> tuple[str, str]:
+    match = VERSION_PATTERN.match(expression)
+    if not match:
+        raise ValueError(f"Version invalide : {expression!r}")
+    operator, version = match.groups()
+    return operator or "=", version
+
+
+def version_key(version: str) -> str:
+    """Sortable form of a version: numeric parts are zero padded, so ``9.2 < 10.0``.
+
+    Trailing zero parts are dropped so that ``120`` and ``120.0`` compare equal.
+    """
+    parts = [part.lower() for part in re.split(r"[^0-9A-Za-z]+", version) if part]
+    while parts and parts[-1].isdigit() and int(parts[-1]) == 0:
+        parts.pop()
+    return ".".join(part.zfill(10) if part.isdigit() else part for part in parts)
+
+
+def _as_number(value: str) -> float | None:
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _first(item: dict, keys: tuple[str, ...]) -> Any:
+    return next((item[key] for key in keys if item.get(key) not in (None, "")), None)
+
+
+def _flatten(value: Any, path: str, out: list[tuple[str, Any]]) -> None:
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if not path and key in SOFTWARE_KEYS and isinstance(child, list):
+                continue
+            _flatten(child, f"{path}.{key}" if path else str(key), out)
+    elif isinstance(value, list):
+        for child in value:
+            _flatten(child, f"{path}.*", out)
+    elif value is not None:
+        out.append((path, value))
+
+
+def extract_facts(document: dict) -> list[tuple[str, Any]]:
+    facts: list[tuple[str, Any]] = []
+    _flatten(document, "", facts)
+    return list(dict.fromkeys((path, value) for path, value in facts if len(path) <= MAX_TEXT))
+
+
+def extract_software(document: dict) -> list[tuple[str, str]]:
+    software: dict[tuple[str, str], None] = {}
+    for key in SOFTWARE_KEYS:
+        for item in document.get(key) or []:
+            if not isinstance(item, dict):
+                continue
+            name = _first(item, NAME_KEYS)
+            if name is None:
+                continue
+            version = _first(item, VERSION_KEYS)
+            software[(str(name).strip().lower()[:MAX_TEXT], "" if version is None else str(version)[:100])] = None
+    return list(software)
+
+
+def _fact_row(machine_id: int, snapshot_id: int, path: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        text, number = "true" if value else "false", None
+    elif isinstance(value, (int, float)):
+        text, number = str(value), float(value)
+    else:
+        # Numeric strings ("22631", "8.5") are also comparable as numbers.
+        text, number = str(value), _as_number(str(value))
+    return {
+        "machine_id": machine_id,
+        "snapshot_id": snapshot_id,
+        "path": path,
+        "value_text": text[:MAX_TEXT],
+        "value_num": number,
+    }
+
+
+def index_rows(machine_id: int, snapshot_id: int, document: dict) -> tuple[list[dict], list[dict]]:
+    facts = [_fact_row(machine_id, snapshot_id, path, value) for path, value in extract_facts(document)]
+    software = [
+        {
+            "machine_id": machine_id,
+            "snapshot_id": snapshot_id,
+            "name": name,
+            "version": version,
+            "version_key": version_key(version),
+        }
+        for name, version in extract_software(document)
+    ]
+    return facts, software
+
+
+def index_inventory(db: Session, machine_id: int, snapshot: InventorySnapshot, document: dict) -> None:
+    """Replace the machine's index rows with those of its latest inventory."""
+    db.execute(delete(InventoryFact).where(InventoryFact.machine_id == machine_id))
+    db.execute(delete(InstalledSoftware).where(InstalledSoftware.machine_id == machine_id))
+    facts, software = index_rows(machine_id, snapshot.id, document)
+    if facts:
+        db.execute(insert(InventoryFact), facts)
+    if software:
+        db.execute(insert(InstalledSoftware), software)
+
+
+def _compare(column: Any, operator: str, value: Any) -> Any:
+    return {
+        "=": column == value,
+        "!=": column != value,
+        "<": column < value,
+        "<=": column <= value,
+        ">": column > value,
+        ">=": column >= value,
+    }[operator]
+
+
+def fact_filter(condition: Condition) -> Select:
+    query = select(InventoryFact.machine_id).where(InventoryFact.path == condition.path)
+    if condition.operator == "~":
+        return query.where(InventoryFact.value_text.contains(condition.value, autoescape=True))
+    number = _as_number(condition.value)
+    if number is not None:
+        return query.where(_compare(InventoryFact.value_num, condition.operator, number))
+    if condition.operator not in ("=", "!="):
+        raise ValueError(f"Comparaison numérique sur une valeur non numérique : {condition.value!r}")
+    text = {"true": "true", "false": "false"}.get(condition.value.lower(), condition.value)
+    return query.where(_compare(InventoryFact.value_text, condition.operator, text))
+
+
+def software_filter(name: str, version: str | None) -> Select:
+    name = name.strip().lower()
+    query = select(InstalledSoftware.machine_id)
+    if name.endswith("*"):
+        # A range instead of LIKE keeps the prefix search on the (name, version_key) index.
+        prefix = name[:-1]
+        query = query.where(InstalledSoftware.name >= prefix, InstalledSoftware.name < prefix + "\uffff")
+    else:
+        query = query.where(InstalledSoftware.name == name)
+    if version:
+        operator, value = parse_version_condition(version)
+        query = query.where(_compare(InstalledSoftware.version_key, operator, version_key(value)))
+    return query
+
+
+def search_inventory(
+    db: Session,
+    conditions: list[Condition],
+    software: str | None = None,
+    version: str | None = None,
+    client_id: int | None = None,
+    limit: int = 100,
+) -> list[dict[str, Any]]:
+    """Machines whose latest inventory matches every condition (AND)."""
+    query = select(Machine.id, Machine.client_id, Machine.hostname).order_by(Machine.id).limit(limit)
+    for condition in conditions:
+        query = query.where(Machine.id.in_(fact_filter(condition)))
+    if software:
+        query = query.where(Machine.id.in_(software_filter(software, version)))
+    if client_id is not None:
+        query = query.where(Machine.client_id == client_id)
+    machines = db.execute(query).all()
+
+    versions: dict[int, list[dict[str, str]]] = {}
+    if software and machines:
+        matched = software_filter(software, version).add_columns(InstalledSoftware.name, InstalledSoftware.version)
+        for row in db.execute(matched.where(InstalledSoftware.machine_id.in_([m.id for m in machines]))):
+            versions.setdefault(row.machine_id, []).append({"name": row.name, "version": row.version})
+    return [
+        {
+            "machine_id": machine.id,
+            "client_id": machine.client_id,
+            "hostname": machine.hostname,
+            "software": versions.get(machine.id, []),
+        }
+        for machine in machines
+    ]
@@ -0,0 +1,53 @@
+import logging
+import threading
+from collections.abc import Callable
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """Runs ``func`` with a fresh session every ``interval_seconds`` on a daemon thread."""
+
+    def __init__(
+        self,
+        name: str,
+        interval_seconds: float,
+        func: Callable[[Session], object],
+        session_factory: Callable[[], Session],
+        run_on_stop: bool = False,
+    ) -> None:
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self._func = func
+        self._session_factory = session_factory
+        self._run_on_stop = run_on_stop
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name=f"job-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._run_on_stop:
+            self.run_once()
+
+    def run_once(self) -> None:
+        db = self._session_factory()
+        try:
+            self._func(db)
+        except Exception:
+            db.rollback()
+            logger.exception("periodic job %s failed", self.name)
+        finally:
+            db.close()
+
+    def _loop(self) -> None:
+        while not self._stopped.wait(self.interval_seconds):
+            self.run_once()
@@ -0,0 +1,110 @@
+"""Responses of the keyset-paginated list endpoints, shared by the sync and async routes."""
+
+from datetime import datetime
+
+from fastapi import HTTPException, Response
+from sqlalchemy import Select, select
+from sqlalchemy.orm import Session
+
+from app.models import Alert, AlertSeverity, Ticket, TicketPriority, TicketStatus
+from app.pagination import InvalidCursorError, paginate, paginate_columns
+from app.schemas import AlertListItemOut, TicketOut
+from app.serialization import json_response, model_columns, select_fields
+
+ALERT_KEYS = (Alert.created_at, Alert.id)
+TICKET_KEYS = (Ticket.created_at, Ticket.id)
+
+
+def keyset_page(
+    db: Session, query: Select, columns: tuple, limit: int, cursor: str | None, descending: bool = True
+) -> dict:
+    try:
+        items, next_cursor = paginate(db, query, columns, limit, cursor, descending)
+    except InvalidCursorError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def fast_keyset_page(
+    db: Session,
+    query: Select,
+    columns: tuple,
+    limit: int,
+    cursor: str | None,
+    fields: list[str] | None = None,
+    descending: bool = True,
+) -> Response:
+    """``keyset_page`` for column selects, encoded straight to JSON bytes.
+
+    ``fields`` trims the keyset columns from the items when they were only
+    selected for the cursor.
+    """
+    try:
+        items, next_cursor = paginate_columns(db, query, columns, limit, cursor, descending)
+    except InvalidCursorError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if fields is not None and any(column.key not in fields for column in columns):
+        items = [{name: item[name] for name in fields} for item in items]
+    return json_response({"items": items, "next_cursor": next_cursor})
+
+
+def requested_fields(schema: type, fields: str | None, deferred: tuple[str, ...] = ()) -> list[str]:
+    try:
+        return select_fields(schema, fields, deferred)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def projection(model: type, fields: list[str], columns: tuple) -> Select:
+    """Select only ``fields``, plus the keyset ``columns`` the cursor is built from."""
+    keys = [column.key for column in columns if column.key not in fields]
+    return select(*model_columns(model, [*fields, *keys]))
+
+
+def created_between(query: Select, column, start: datetime | None, end: datetime | None) -> Select:
+    if start is not None:
+        query = query.where(column >= start)
+    if end is not None:
+        query = query.where(column < end)
+    return query
+
+
+def matching(query: Select, filters: dict) -> Select:
+    """``query`` restricted to rows equal to each filter value that was given."""
+    return query.where(*(column == value for column, value in filters.items() if value is not None))
+
+
+def alerts_query(
+    fields: str | None,
+    machine_id: int | None,
+    severity: AlertSeverity | None,
+    start: datetime | None,
+    end: datetime | None,
+) -> tuple[Select, list[str]]:
+    """Statement and returned fields of an alert list page; ``details`` is only read when requested."""
+    names = requested_fields(AlertListItemOut, fields, deferred=("details",))
+    query = created_between(projection(Alert, names, ALERT_KEYS), Alert.created_at, start, end)
+    return matching(query, {Alert.machine_id: machine_id, Alert.severity: severity}), names
+
+
+def tickets_query(
+    fields: str | None,
+    status: TicketStatus | None,
+    priority: TicketPriority | None,
+    client_id: int | None,
+    technician_id: int | None,
+    machine_id: int | None,
+    start: datetime | None,
+    end: datetime | None,
+) -> tuple[Select, list[str]]:
+    """Statement and returned fields of a ticket list page."""
+    names = requested_fields(TicketOut, fields)
+    query = created_between(projection(Ticket, names, TICKET_KEYS), Ticket.created_at, start, end)
+    filters = {
+        Ticket.status: status,
+        Ticket.priority: priority,
+        Ticket.client_id: client_id,
+        Ticket.technician_id: technician_id,
+        Ticket.machine_id: machine_id,
+    }
+    return matching(query, filters), names
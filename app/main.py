@@ -1,31 +1,83 @@
-from datetime import datetime
-
-from fastapi import Depends, FastAPI, HTTPException
-from sqlalchemy.orm import Session
-
-from app.database import Base, engine, get_db
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Literal
+
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session, load_only
+
+from app.alert_dedup import AlertDeduplicator, AlertStormError, get_alert_deduplicator
+from app.alert_rules import AlertRuleEngine, get_alert_rule_engine
+from app.billing_runs import run_in_background, start_billing_run
+from app.bulk_import import IMPORT_CHUNK_ROWS, IMPORT_MEDIA_TYPES, BulkImporter
+from app.config import settings
+from app.database import SessionLocal, engine, get_db
+from app.dashboard import DashboardCounters, dashboard_counters, get_dashboard_counters
+from app.exports import EXPORT_MEDIA_TYPES, EXPORTS, iter_export
+from app.heartbeats import HeartbeatTracker, get_heartbeat_tracker, heartbeat_tracker
+from app.http_cache import VersionedRoute, versioned
+from app.ingest import IngestQueue, get_ingest_queue, start_ingest_queue, stop_ingest_queue
+from app.inventory import inventory_changes, latest_snapshot, reconstruct, snapshot_at, store_inventory
+from app.inventory_index import index_inventory, parse_condition, search_inventory
+from app.jobs import PeriodicJob
+from app.listing import (
+    ALERT_KEYS,
+    TICKET_KEYS,
+    alerts_query,
+    created_between,
+    fast_keyset_page,
+    keyset_page,
+    projection,
+    requested_fields,
+    tickets_query,
+)
+from app.prebilling import accumulate_time_entry, consolidate_prebilling
+from app.metric_buffer import RecentMetricsBuffer, get_metric_buffer, metric_buffer
+from app.migrations import migrate
+from app.pagination import DEFAULT_LIMIT, MAX_LIMIT
+from app.request_bodies import RequestBodyMiddleware, iter_csv, iter_ndjson
+from app.rollups import choose_resolution, maintain_metrics, metric_series
 from app.models import (
     Alert,
+    AlertSeverity,
+    BillingRun,
     Client,
     Contact,
     Contract,
     ContractType,
+    HoursLedgerEntry,
     Intervention,
     InventorySnapshot,
     Invoice,
+    InvoiceLine,
+    InvoiceStatus,
     Machine,
+    MetricAlertRule,
     MetricSample,
     Opportunity,
     Playbook,
     PlaybookRun,
+    PrebillingBucket,
     Prospect,
+    ProspectStatus,
     Technician,
     Ticket,
+    TicketPriority,
+    TicketStatus,
     TimeEntry,
 )
 from app.schemas import (
     AlertCreate,
+    AlertDedupStatsOut,
+    AlertListItemOut,
     AlertOut,
+    AlertRuleCreate,
+    AlertRuleOut,
+    BillingRunCreate,
+    BillingRunOut,
     ClientCreate,
     ClientOut,
     ContactCreate,
@@ -34,22 +86,40 @@ from app.schemas import (
     ContractOut,
     DashboardOut,
     HeartbeatCreate,
+    HoursBalanceOut,
+    HoursLedgerEntryOut,
+    ImportResultOut,
+    IngestStatsOut,
     InterventionCreate,
     InterventionOut,
+    InventoryChangeOut,
     InventoryCreate,
+    InventorySearchHitOut,
     InventoryOut,
     InvoiceCreate,
+    InvoiceLineOut,
     InvoiceOut,
     MachineCreate,
+    MachineMetricStatsOut,
     MachineOut,
+    Page,
+    MetricBatchCreate,
+    MetricBatchOut,
+    MetricStreamOut,
     MetricCreate,
     MetricOut,
+    MetricQueuedOut,
+    MetricSeriesOut,
     OpportunityCreate,
     OpportunityOut,
     PlaybookCreate,
     PlaybookOut,
     PlaybookRunCreate,
+    PlaybookRunListItemOut,
     PlaybookRunOut,
+    PrebillingBucketOut,
+    PrebillingConsolidate,
+    PrebillingConsolidationOut,
     ProspectCreate,
     ProspectOut,
     SubscriptionBillingRequest,
@@ -61,16 +131,56 @@ from app.schemas import (
     TimeEntryCreate,
     TimeEntryOut,
 )
+from app.serialization import json_response, model_columns
 from app.services import (
     consume_hours_bank_if_needed,
-    create_ticket_from_alert,
-    dashboard_counts,
-    generate_invoice_from_time_entry,
+    hours_balance,
+    open_hours_ledger,
     generate_subscription_invoice,
+    open_alert,
+    prepare_metric_batch,
 )
-
-app = FastAPI(title="CRM-RMM-PSA API", version="0.2.0")
-Base.metadata.create_all(bind=engine)
+from app.telemetry import record_metric, store_metric_rows
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    if settings.ingest_queue_enabled:
+        start_ingest_queue(SessionLocal, settings)
+    with SessionLocal() as db:
+        metric_buffer.load_recent(db)
+    jobs = [
+        PeriodicJob(
+            "heartbeat-flush", settings.heartbeat_flush_seconds, heartbeat_tracker.flush, SessionLocal, run_on_stop=True
+        ),
+        PeriodicJob("metric-rollups", settings.metrics_rollup_interval_seconds, maintain_metrics, SessionLocal),
+        PeriodicJob(
+            "dashboard-reconcile", settings.dashboard_reconcile_seconds, dashboard_counters.reconcile, SessionLocal
+        ),
+        PeriodicJob(
+            "prebilling-consolidation", settings.prebilling_consolidate_seconds, consolidate_prebilling, SessionLocal
+        ),
+    ]
+    for job in jobs:
+        job.start()
+    yield
+    for job in jobs:
+        job.stop()
+    stop_ingest_queue()
+
+
+app = FastAPI(title="CRM-RMM-PSA API", version="0.2.0", lifespan=lifespan)
+app.router.route_class = VersionedRoute
+app.add_middleware(RequestBodyMiddleware, max_body_bytes=settings.max_request_body_bytes)
+if settings.async_db_enabled:
+    from app.async_routes import router as async_router
+
+    # Registered first, so these paths are served on the event loop rather than the threadpool.
+    app.include_router(async_router)
+migrate(engine)
+
+
+MAX_STREAM_ERRORS = 100
 
 
 @app.get("/health")
@@ -78,9 +188,16 @@ def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/ingest/stats", response_model=IngestStatsOut)
+def ingest_stats(queue: IngestQueue | None = Depends(get_ingest_queue)) -> dict:
+    return queue.stats() if queue else {"enabled": False}
+
+
 @app.get("/dashboard", response_model=DashboardOut)
-def get_dashboard(db: Session = Depends(get_db)) -> dict[str, int]:
-    return dashboard_counts(db)
+def get_dashboard(
+    db: Session = Depends(get_db), counters: DashboardCounters = Depends(get_dashboard_counters)
+) -> dict[str, int]:
+    return counters.snapshot(db)
 
 
 @app.post("/clients", response_model=ClientOut)
@@ -92,9 +209,20 @@ def create_client(payload: ClientCreate, db: Session = Depends(get_db)) -> Clien
     return client
 
 
-@app.get("/clients", response_model=list[ClientOut])
-def list_clients(db: Session = Depends(get_db)) -> list[Client]:
-    return db.query(Client).order_by(Client.created_at.desc()).all()
+@app.get("/clients", response_model=Page[ClientOut])
+@versioned("clients")
+def list_clients(
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = Query(None, description="Champs à renvoyer, séparés par des virgules"),
+    db: Session = Depends(get_db),
+) -> Response:
+    names = requested_fields(ClientOut, fields)
+    keys = (Client.created_at, Client.id)
+    query = created_between(projection(Client, names, keys), Client.created_at, start, end)
+    return fast_keyset_page(db, query, keys, limit, cursor, names)
 
 
 @app.post("/contacts", response_model=ContactOut)
@@ -107,6 +235,7 @@ def create_contact(payload: ContactCreate, db: Session = Depends(get_db)) -> Con
 
 
 @app.get("/clients/{client_id}/contacts", response_model=list[ContactOut])
+@versioned("contacts")
 def list_client_contacts(client_id: int, db: Session = Depends(get_db)) -> list[Contact]:
     return db.query(Contact).filter(Contact.client_id == client_id).all()
 
@@ -120,9 +249,23 @@ def create_prospect(payload: ProspectCreate, db: Session = Depends(get_db)) -> P
     return prospect
 
 
-@app.get("/prospects", response_model=list[ProspectOut])
-def list_prospects(db: Session = Depends(get_db)) -> list[Prospect]:
-    return db.query(Prospect).all()
+@app.get("/prospects", response_model=Page[ProspectOut])
+@versioned("prospects")
+def list_prospects(
+    status: ProspectStatus | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = Query(None, description="Champs à renvoyer, séparés par des virgules"),
+    db: Session = Depends(get_db),
+) -> Response:
+    names = requested_fields(ProspectOut, fields)
+    keys = (Prospect.created_at, Prospect.id)
+    query = created_between(projection(Prospect, names, keys), Prospect.created_at, start, end)
+    if status is not None:
+        query = query.where(Prospect.status == status)
+    return fast_keyset_page(db, query, keys, limit, cursor, names)
 
 
 @app.post("/opportunities", response_model=OpportunityOut)
@@ -144,6 +287,7 @@ def create_technician(payload: TechnicianCreate, db: Session = Depends(get_db))
 
 
 @app.get("/technicians", response_model=list[TechnicianOut])
+@versioned("technicians")
 def list_technicians(db: Session = Depends(get_db)) -> list[Technician]:
     return db.query(Technician).all()
 
@@ -153,12 +297,15 @@ def create_contract(payload: ContractCreate, db: Session = Depends(get_db)) -> C
     remaining = payload.total_hours if payload.type == ContractType.HOURS_BANK else None
     contract = Contract(**payload.model_dump(), remaining_hours=remaining)
     db.add(contract)
+    db.flush()
+    open_hours_ledger(db, contract)
     db.commit()
     db.refresh(contract)
     return contract
 
 
 @app.get("/contracts/{contract_id}", response_model=ContractOut)
+@versioned("contracts")
 def get_contract(contract_id: int, db: Session = Depends(get_db)) -> Contract:
     contract = db.get(Contract, contract_id)
     if not contract:
@@ -166,17 +313,72 @@ def get_contract(contract_id: int, db: Session = Depends(get_db)) -> Contract:
     return contract
 
 
+@app.get("/contracts/{contract_id}/hours", response_model=HoursBalanceOut)
+@versioned("hours_ledger")
+def get_hours_balance(contract_id: int, db: Session = Depends(get_db)) -> dict:
+    if not db.get(Contract, contract_id):
+        raise HTTPException(status_code=404, detail="Contrat introuvable")
+    return hours_balance(db, contract_id)
+
+
+@app.get("/contracts/{contract_id}/hours/ledger", response_model=Page[HoursLedgerEntryOut])
+@versioned("hours_ledger")
+def list_hours_ledger(
+    contract_id: int,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+) -> Response:
+    names = list(HoursLedgerEntryOut.model_fields)
+    query = select(*model_columns(HoursLedgerEntry, names)).where(HoursLedgerEntry.contract_id == contract_id)
+    return fast_keyset_page(db, query, (HoursLedgerEntry.id,), limit, cursor, names)
+
+
 @app.post("/billing/subscription", response_model=InvoiceOut)
 def bill_subscription(payload: SubscriptionBillingRequest, db: Session = Depends(get_db)) -> Invoice:
     contract = db.get(Contract, payload.contract_id)
     if not contract:
         raise HTTPException(status_code=404, detail="Contrat introuvable")
-    invoice = generate_subscription_invoice(db, contract)
+    invoice = generate_subscription_invoice(db, contract, payload.period)
     db.commit()
     db.refresh(invoice)
     return invoice
 
 
+@app.post("/billing/runs", response_model=BillingRunOut, status_code=202)
+def start_subscription_billing_run(
+    payload: BillingRunCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
+) -> BillingRun:
+    """Bill every due subscription contract for the period; an unfinished run for it resumes."""
+    run = start_billing_run(db, payload.period)
+    background_tasks.add_task(run_in_background, db.get_bind(), run.id)
+    return run
+
+
+@app.get("/billing/prebilling", response_model=list[PrebillingBucketOut])
+@versioned("prebilling_buckets")
+def list_prebilling(client_id: int | None = None, db: Session = Depends(get_db)) -> list[PrebillingBucket]:
+    """Open buckets: billable time not invoiced yet."""
+    query = select(PrebillingBucket).where(PrebillingBucket.invoice_id.is_(None))
+    if client_id is not None:
+        query = query.where(PrebillingBucket.client_id == client_id)
+    return list(db.scalars(query.order_by(PrebillingBucket.period, PrebillingBucket.id)))
+
+
+@app.post("/billing/prebilling/consolidate", response_model=PrebillingConsolidationOut)
+def consolidate_prebilling_buckets(payload: PrebillingConsolidate, db: Session = Depends(get_db)) -> dict[str, int]:
+    return {"invoices": consolidate_prebilling(db, payload.period)}
+
+
+@app.get("/billing/runs/{run_id}", response_model=BillingRunOut)
+@versioned("billing_runs")
+def get_billing_run(run_id: int, db: Session = Depends(get_db)) -> BillingRun:
+    run = db.get(BillingRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Facturation introuvable")
+    return run
+
+
 @app.post("/machines", response_model=MachineOut)
 def create_machine(payload: MachineCreate, db: Session = Depends(get_db)) -> Machine:
     machine = Machine(**payload.model_dump())
@@ -186,64 +388,323 @@ def create_machine(payload: MachineCreate, db: Session = Depends(get_db)) -> Mac
     return machine
 
 
-@app.get("/machines", response_model=list[MachineOut])
-def list_machines(db: Session = Depends(get_db)) -> list[Machine]:
-    return db.query(Machine).all()
+@app.get("/machines", response_model=Page[MachineOut])
+@versioned("machines", "heartbeats")
+def list_machines(
+    client_id: int | None = None,
+    os_name: str | None = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+    tracker: HeartbeatTracker = Depends(get_heartbeat_tracker),
+) -> dict:
+    query = select(Machine)
+    if client_id is not None:
+        query = query.where(Machine.client_id == client_id)
+    if os_name is not None:
+        query = query.where(Machine.os_name == os_name)
+    page = keyset_page(db, query, (Machine.id,), limit, cursor, descending=False)
+    return {**page, "items": [tracker.merge(machine) for machine in page["items"]]}
 
 
 @app.post("/machines/{machine_id}/heartbeat", response_model=MachineOut)
-def machine_heartbeat(machine_id: int, payload: HeartbeatCreate, db: Session = Depends(get_db)) -> Machine:
-    machine = db.get(Machine, machine_id)
-    if not machine:
+def machine_heartbeat(
+    machine_id: int,
+    payload: HeartbeatCreate,
+    db: Session = Depends(get_db),
+    tracker: HeartbeatTracker = Depends(get_heartbeat_tracker),
+) -> MachineOut:
+    if not tracker.known(machine_id):
+        machine = db.get(Machine, machine_id)
+        if not machine:
+            raise HTTPException(status_code=404, detail="Machine introuvable")
+        tracker.remember(machine)
+    tracker.record(machine_id, datetime.utcnow(), payload.agent_version)
+    return tracker.current(machine_id)
+
+
+@app.post(
+    "/machines/{machine_id}/metrics",
+    response_model=MetricOut,
+    responses={202: {"model": MetricQueuedOut, "description": "Échantillon mis en file d'ingestion"}},
+)
+def push_metrics(
+    machine_id: int,
+    payload: MetricCreate,
+    db: Session = Depends(get_db),
+    queue: IngestQueue | None = Depends(get_ingest_queue),
+    buffer: RecentMetricsBuffer = Depends(get_metric_buffer),
+    rules: AlertRuleEngine = Depends(get_alert_rule_engine),
+    dedup: AlertDeduplicator = Depends(get_alert_deduplicator),
+) -> MetricSample | JSONResponse:
+    if not db.get(Machine, machine_id):
         raise HTTPException(status_code=404, detail="Machine introuvable")
-    machine.heartbeat_at = datetime.utcnow()
-    if payload.agent_version:
-        machine.agent_version = payload.agent_version
-    db.add(machine)
-    db.commit()
-    db.refresh(machine)
-    return machine
+    row = {"machine_id": machine_id, **payload.model_dump(), "created_at": datetime.utcnow()}
+    metric = record_metric(db, row, queue, buffer, rules, dedup)
+    if metric is None:
+        return JSONResponse(status_code=202, content=MetricQueuedOut(machine_id=machine_id).model_dump())
+    return metric
 
 
-@app.post("/machines/{machine_id}/metrics", response_model=MetricOut)
-def push_metrics(machine_id: int, payload: MetricCreate, db: Session = Depends(get_db)) -> MetricSample:
+@app.get("/machines/{machine_id}/metrics", response_model=MetricSeriesOut)
+def get_machine_metrics(
+    machine_id: int,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    resolution: Literal["auto", "raw", "1m", "5m", "1h"] = "auto",
+    db: Session = Depends(get_db),
+) -> dict:
     if not db.get(Machine, machine_id):
         raise HTTPException(status_code=404, detail="Machine introuvable")
-    metric = MetricSample(machine_id=machine_id, **payload.model_dump())
-    db.add(metric)
-    db.commit()
-    db.refresh(metric)
-    return metric
+    now = datetime.utcnow()
+    end = end or now
+    start = start or end - timedelta(hours=1)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="La date de fin doit être après le début")
+    if resolution == "auto":
+        resolution = choose_resolution(start, end, now)
+    return {
+        "machine_id": machine_id,
+        "resolution": resolution,
+        "start": start,
+        "end": end,
+        "points": metric_series(db, machine_id, start, end, resolution),
+    }
+
+
+@app.get("/fleet/metrics/stats", response_model=list[MachineMetricStatsOut])
+def fleet_metric_stats(
+    samples: int = Query(60, ge=1),
+    percentile: float = Query(95, ge=0, le=100),
+    order_by: Literal["cpu_percent", "ram_percent", "disk_percent"] = "cpu_percent",
+    limit: int = Query(100, ge=1, le=10_000),
+    buffer: RecentMetricsBuffer = Depends(get_metric_buffer),
+) -> list[dict]:
+    return buffer.top_machines(order_by, limit, samples, percentile)
+
+
+@app.post("/metrics/batch", response_model=MetricBatchOut)
+def push_metrics_batch(
+    payload: MetricBatchCreate,
+    response: Response,
+    db: Session = Depends(get_db),
+    queue: IngestQueue | None = Depends(get_ingest_queue),
+    buffer: RecentMetricsBuffer = Depends(get_metric_buffer),
+    rules: AlertRuleEngine = Depends(get_alert_rule_engine),
+    dedup: AlertDeduplicator = Depends(get_alert_deduplicator),
+) -> dict:
+    results, rows = prepare_metric_batch(db, payload.samples)
+    if store_metric_rows(db, rows, queue, buffer, rules, dedup):
+        response.status_code = 202
+    accepted = sum(1 for result in results if result["accepted"])
+    return {"accepted": accepted, "rejected": len(results) - accepted, "results": results}
+
+
+@app.post(
+    "/metrics/stream",
+    response_model=MetricStreamOut,
+    openapi_extra={"requestBody": {"content": {"application/x-ndjson": {"schema": {"type": "string"}}}}},
+)
+async def push_metrics_stream(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    queue: IngestQueue | None = Depends(get_ingest_queue),
+    buffer: RecentMetricsBuffer = Depends(get_metric_buffer),
+    rules: AlertRuleEngine = Depends(get_alert_rule_engine),
+    dedup: AlertDeduplicator = Depends(get_alert_deduplicator),
+) -> dict:
+    """NDJSON upload, one ``MetricBatchItem`` per line, stored every ``ingest_batch_size`` lines."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in ("application/x-ndjson", "application/jsonl"):
+        raise HTTPException(status_code=415, detail="Content-Type attendu : application/x-ndjson")
+
+    totals = {"accepted": 0, "rejected": 0}
+    errors: list[dict] = []
+    chunk: list[dict] = []
+    offsets: list[int] = []
+
+    def reject(result: dict) -> None:
+        totals["rejected"] += 1
+        if len(errors) < MAX_STREAM_ERRORS:
+            errors.append(result)
+
+    def store_chunk() -> None:
+        results, rows = prepare_metric_batch(db, chunk)
+        if rows and store_metric_rows(db, rows, queue, buffer, rules, dedup):
+            response.status_code = 202
+        for result in results:
+            if result["accepted"]:
+                totals["accepted"] += 1
+            else:
+                reject({**result, "index": offsets[result["index"]]})
+        chunk.clear()
+        offsets.clear()
+
+    async for index, value, error in iter_ndjson(request.stream()):
+        if error is not None or not isinstance(value, dict):
+            reject({"index": index, "machine_id": None, "accepted": False, "error": error or "Objet JSON attendu"})
+            continue
+        chunk.append(value)
+        offsets.append(index)
+        if len(chunk) >= settings.ingest_batch_size:
+            await run_in_threadpool(store_chunk)
+    if chunk:
+        await run_in_threadpool(store_chunk)
+    return {**totals, "errors": errors}
+
+
+@app.get("/alerts/stats", response_model=AlertDedupStatsOut)
+def alert_dedup_stats(dedup: AlertDeduplicator = Depends(get_alert_deduplicator)) -> dict[str, int]:
+    return dedup.stats()
 
 
 @app.post("/machines/{machine_id}/alerts", response_model=AlertOut)
-def create_alert(machine_id: int, payload: AlertCreate, db: Session = Depends(get_db)) -> Alert:
+def create_alert(
+    machine_id: int,
+    payload: AlertCreate,
+    db: Session = Depends(get_db),
+    dedup: AlertDeduplicator = Depends(get_alert_deduplicator),
+) -> Alert:
     machine = db.get(Machine, machine_id)
     if not machine:
         raise HTTPException(status_code=404, detail="Machine introuvable")
 
-    alert = Alert(machine_id=machine_id, severity=payload.severity, title=payload.title, details=payload.details)
-    db.add(alert)
-    db.flush()
-    if payload.auto_create_ticket:
-        create_ticket_from_alert(db, machine, alert)
+    try:
+        alert = open_alert(
+            db, machine, payload.severity, payload.title, dedup, payload.details, payload.auto_create_ticket
+        )
+    except AlertStormError as exc:
+        raise HTTPException(status_code=429, detail=f"Tempête d'alertes: {exc}", headers={"Retry-After": "1"}) from exc
     db.commit()
     db.refresh(alert)
     return alert
 
 
+@app.get("/alerts", response_model=Page[AlertListItemOut])
+@versioned("alerts")
+def list_alerts(
+    machine_id: int | None = None,
+    severity: AlertSeverity | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = Query(None, description="Champs à renvoyer, séparés par des virgules"),
+    db: Session = Depends(get_db),
+) -> Response:
+    """Alert list; ``details`` is only read when named in ``fields``."""
+    query, names = alerts_query(fields, machine_id, severity, start, end)
+    return fast_keyset_page(db, query, ALERT_KEYS, limit, cursor, names)
+
+
+@app.get("/alert-rules", response_model=list[AlertRuleOut])
+@versioned("metric_alert_rules")
+def list_alert_rules(db: Session = Depends(get_db)) -> list[MetricAlertRule]:
+    return db.query(MetricAlertRule).order_by(MetricAlertRule.id).all()
+
+
+@app.post("/alert-rules", response_model=AlertRuleOut)
+def create_alert_rule(
+    payload: AlertRuleCreate, db: Session = Depends(get_db), rules: AlertRuleEngine = Depends(get_alert_rule_engine)
+) -> MetricAlertRule:
+    rule = MetricAlertRule(**payload.model_dump())
+    db.add(rule)
+    db.commit()
+    db.refresh(rule)
+    rules.load(db)
+    return rule
+
+
+@app.delete("/alert-rules/{rule_id}", status_code=204)
+def delete_alert_rule(
+    rule_id: int, db: Session = Depends(get_db), rules: AlertRuleEngine = Depends(get_alert_rule_engine)
+) -> Response:
+    rule = db.get(MetricAlertRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=404, detail="Règle introuvable")
+    db.delete(rule)
+    db.commit()
+    rules.load(db)
+    return Response(status_code=204)
+
+
 @app.post("/machines/{machine_id}/inventory", response_model=InventoryOut)
-def create_inventory(machine_id: int, payload: InventoryCreate, db: Session = Depends(get_db)) -> InventorySnapshot:
+def create_inventory(machine_id: int, payload: InventoryCreate, db: Session = Depends(get_db)) -> dict:
     machine = db.get(Machine, machine_id)
     if not machine:
         raise HTTPException(status_code=404, detail="Machine introuvable")
 
-    snapshot = InventorySnapshot(machine_id=machine_id, raw_json=payload.raw_json)
-    machine.last_inventory_at = datetime.utcnow()
-    db.add_all([snapshot, machine])
+    snapshot, storage = store_inventory(db, machine, payload.raw_json, settings.inventory_keyframe_interval)
+    if storage != "unchanged":
+        db.flush()
+        index_inventory(db, machine_id, snapshot, payload.raw_json)
     db.commit()
     db.refresh(snapshot)
-    return snapshot
+    return {
+        "id": snapshot.id,
+        "machine_id": machine_id,
+        "raw_json": payload.raw_json,
+        "created_at": snapshot.created_at,
+        "storage": storage,
+    }
+
+
+@app.get("/machines/{machine_id}/inventory", response_model=InventoryOut)
+def get_inventory(
+    machine_id: int,
+    at: datetime | None = None,
+    fields: str | None = Query(None, description="Champs à renvoyer, séparés par des virgules"),
+    db: Session = Depends(get_db),
+) -> Response | dict:
+    """Without ``raw_json`` in ``fields``, neither the document nor its deltas are read."""
+    names = requested_fields(InventoryOut, fields)
+    options = []
+    if "raw_json" not in names:
+        options.append(load_only(InventorySnapshot.id, InventorySnapshot.created_at, InventorySnapshot.keyframe_id))
+    snapshot = snapshot_at(db, machine_id, at, *options) if at else latest_snapshot(db, machine_id, *options)
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="Inventaire introuvable")
+    inventory = {
+        "id": snapshot.id,
+        "machine_id": machine_id,
+        "raw_json": reconstruct(db, snapshot) if "raw_json" in names else None,
+        "created_at": snapshot.created_at,
+        "storage": "full" if snapshot.keyframe_id is None else "delta",
+    }
+    if fields is None:
+        return inventory
+    return json_response({name: inventory[name] for name in names})
+
+
+@app.get("/inventory/search", response_model=list[InventorySearchHitOut])
+def search_inventory_endpoint(
+    where: list[str] = Query(default=[]),
+    software: str | None = None,
+    version: str | None = None,
+    client_id: int | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+) -> list[dict]:
+    if not where and not software:
+        raise HTTPException(status_code=422, detail="Au moins un filtre (where ou software) est requis")
+    try:
+        conditions = [parse_condition(expression) for expression in where]
+        return search_inventory(db, conditions, software, version, client_id, limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+
+@app.get("/machines/{machine_id}/inventory/changes", response_model=list[InventoryChangeOut])
+def list_inventory_changes(
+    machine_id: int,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    db: Session = Depends(get_db),
+) -> list[dict]:
+    if not db.get(Machine, machine_id):
+        raise HTTPException(status_code=404, detail="Machine introuvable")
+    return inventory_changes(db, machine_id, start, end)
 
 
 @app.post("/tickets", response_model=TicketOut)
@@ -269,9 +730,23 @@ def update_ticket(ticket_id: int, payload: TicketUpdate, db: Session = Depends(g
     return ticket
 
 
-@app.get("/tickets", response_model=list[TicketOut])
-def list_tickets(db: Session = Depends(get_db)) -> list[Ticket]:
-    return db.query(Ticket).order_by(Ticket.created_at.desc()).all()
+@app.get("/tickets", response_model=Page[TicketOut])
+@versioned("tickets")
+def list_tickets(
+    status: TicketStatus | None = None,
+    priority: TicketPriority | None = None,
+    client_id: int | None = None,
+    technician_id: int | None = None,
+    machine_id: int | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = Query(None, description="Champs à renvoyer, séparés par des virgules"),
+    db: Session = Depends(get_db),
+) -> Response:
+    query, names = tickets_query(fields, status, priority, client_id, technician_id, machine_id, start, end)
+    return fast_keyset_page(db, query, TICKET_KEYS, limit, cursor, names)
 
 
 @app.post("/time-entries", response_model=TimeEntryOut)
@@ -283,7 +758,7 @@ def create_time_entry(payload: TimeEntryCreate, db: Session = Depends(get_db)) -
     entry = TimeEntry(**payload.model_dump())
     db.add(entry)
     consume_hours_bank_if_needed(db, ticket, entry)
-    generate_invoice_from_time_entry(db, ticket, entry)
+    accumulate_time_entry(db, ticket, entry)
     db.commit()
     db.refresh(entry)
     return entry
@@ -314,9 +789,100 @@ def create_invoice(payload: InvoiceCreate, db: Session = Depends(get_db)) -> Inv
     return invoice
 
 
-@app.get("/invoices", response_model=list[InvoiceOut])
-def list_invoices(db: Session = Depends(get_db)) -> list[Invoice]:
-    return db.query(Invoice).order_by(Invoice.created_at.desc()).all()
+@app.get("/invoices", response_model=Page[InvoiceOut])
+@versioned("invoices")
+def list_invoices(
+    status: InvoiceStatus | None = None,
+    client_id: int | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = Query(None, description="Champs à renvoyer, séparés par des virgules"),
+    db: Session = Depends(get_db),
+) -> Response:
+    names = requested_fields(InvoiceOut, fields)
+    keys = (Invoice.created_at, Invoice.id)
+    query = created_between(projection(Invoice, names, keys), Invoice.created_at, start, end)
+    if status is not None:
+        query = query.where(Invoice.status == status)
+    if client_id is not None:
+        query = query.where(Invoice.client_id == client_id)
+    return fast_keyset_page(db, query, keys, limit, cursor, names)
+
+
+@app.get("/invoices/{invoice_id}/lines", response_model=list[InvoiceLineOut])
+@versioned("invoices", "invoice_lines")
+def list_invoice_lines(invoice_id: int, db: Session = Depends(get_db)) -> list[InvoiceLine]:
+    if not db.get(Invoice, invoice_id):
+        raise HTTPException(status_code=404, detail="Facture introuvable")
+    return list(db.scalars(select(InvoiceLine).where(InvoiceLine.invoice_id == invoice_id).order_by(InvoiceLine.id)))
+
+
+@app.get(
+    "/export/{entity}",
+    response_class=StreamingResponse,
+    responses={200: {"content": {media: {} for media in EXPORT_MEDIA_TYPES.values()}}},
+)
+def export_entity(
+    entity: Literal["tickets", "invoices", "metrics"],
+    format: Literal["ndjson", "csv"] = "ndjson",
+    client_id: int | None = None,
+    machine_id: int | None = None,
+    technician_id: int | None = None,
+    status: str | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    db: Session = Depends(get_db),
+) -> StreamingResponse:
+    filters = {"client_id": client_id, "machine_id": machine_id, "technician_id": technician_id, "status": status}
+    unsupported = [name for name, value in filters.items() if value is not None and name not in EXPORTS[entity].filters]
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Filtre non supporté pour {entity} : {', '.join(unsupported)}")
+    if status is not None:
+        try:
+            filters["status"] = (TicketStatus if entity == "tickets" else InvoiceStatus)(status)
+        except ValueError as exc:
+            raise HTTPException(status_code=422, detail=f"Statut inconnu : {status}") from exc
+    return StreamingResponse(
+        iter_export(db, entity, format, filters, start, end),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{entity}.{format}"'},
+    )
+
+
+@app.post(
+    "/import/{entity}",
+    response_model=ImportResultOut,
+    openapi_extra={
+        "requestBody": {"content": {media: {"schema": {"type": "string"}} for media in ("text/csv", "application/x-ndjson")}}
+    },
+)
+async def import_entity(
+    entity: Literal["clients", "contacts", "machines"], request: Request, db: Session = Depends(get_db)
+) -> dict:
+    """CSV (header line) or NDJSON upload, committed every ``IMPORT_CHUNK_ROWS`` rows.
+
+    Contacts and machines name their client by ``client_id`` or ``client_email``.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in IMPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=415, detail="Content-Type attendu : text/csv ou application/x-ndjson")
+    rows = iter_csv(request.stream()) if IMPORT_MEDIA_TYPES[content_type] == "csv" else iter_ndjson(request.stream())
+
+    importer = BulkImporter(db, entity)
+    chunk: list[tuple[int, dict]] = []
+    async for index, value, error in rows:
+        if error is not None or not isinstance(value, dict):
+            importer.reject(index, error or "Objet JSON attendu")
+            continue
+        chunk.append((index, value))
+        if len(chunk) >= IMPORT_CHUNK_ROWS:
+            await run_in_threadpool(importer.add_chunk, chunk)
+            chunk = []
+    if chunk:
+        await run_in_threadpool(importer.add_chunk, chunk)
+    return importer.result()
 
 
 @app.post("/playbooks", response_model=PlaybookOut)
@@ -344,3 +910,25 @@ def run_playbook(payload: PlaybookRunCreate, db: Session = Depends(get_db)) -> P
     db.commit()
     db.refresh(run)
     return run
+
+
+@app.get("/playbook-runs", response_model=Page[PlaybookRunListItemOut])
+@versioned("playbook_runs")
+def list_playbook_runs(
+    machine_id: int | None = None,
+    playbook_id: int | None = None,
+    status: str | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = Query(None, description="Champs à renvoyer, séparés par des virgules"),
+    db: Session = Depends(get_db),
+) -> Response:
+    """Run history; ``output_log`` is only read when named in ``fields``."""
+    names = requested_fields(PlaybookRunListItemOut, fields, deferred=("output_log",))
+    keys = (PlaybookRun.created_at, PlaybookRun.id)
+    query = created_between(projection(PlaybookRun, names, keys), PlaybookRun.created_at, start, end)
+    filters = {PlaybookRun.machine_id: machine_id, PlaybookRun.playbook_id: playbook_id, PlaybookRun.status: status}
+    query = query.where(*(column == value for column, value in filters.items() if value is not None))
+    return fast_keyset_page(db, query, keys, limit, cursor, names)
@@ -0,0 +1,174 @@
+import threading
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from typing import Any
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import MetricSample
+
+METRIC_COLUMNS = ("cpu_percent", "ram_percent", "disk_percent")
+TIME_ORIGIN = datetime(2020, 1, 1)
+
+
+class RecentMetricsBuffer:
+    """Fixed-size ring buffer of the last ``window`` samples of every machine.
+
+    All machines share three ``float32`` matrices (one per metric) and one
+    ``int32`` matrix of timestamps, one row per machine, so memory is
+    ``window * 16`` bytes per machine and fleet-wide statistics are single
+    NumPy reductions instead of database queries.
+    """
+
+    def __init__(self, window: int = 60, initial_capacity: int = 1024) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._slots: dict[int, int] = {}
+        self._allocate(initial_capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        self._machine_ids = np.zeros(capacity, dtype=np.int64)
+        self._values = np.full((len(METRIC_COLUMNS), capacity, self.window), np.nan, dtype=np.float32)
+        self._times = np.zeros((capacity, self.window), dtype=np.int32)
+        self._heads = np.zeros(capacity, dtype=np.int32)
+        self._counts = np.zeros(capacity, dtype=np.int32)
+
+    def _grow(self) -> None:
+        old = (self._machine_ids, self._values, self._times, self._heads, self._counts)
+        size = len(self._machine_ids)
+        self._allocate(size * 2)
+        self._machine_ids[:size] = old[0]
+        self._values[:, :size] = old[1]
+        self._times[:size] = old[2]
+        self._heads[:size] = old[3]
+        self._counts[:size] = old[4]
+
+    def _slot(self, machine_id: int) -> int:
+        slot = self._slots.get(machine_id)
+        if slot is None:
+            slot = len(self._slots)
+            if slot == len(self._machine_ids):
+                self._grow()
+            self._slots[machine_id] = slot
+            self._machine_ids[slot] = machine_id
+        return slot
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self._machine_ids, self._values, self._times, self._heads, self._counts)
+        return sum(array.nbytes for array in arrays)
+
+    def append(self, machine_id: int, created_at: datetime, cpu: float, ram: float, disk: float) -> None:
+        with self._lock:
+            self._write(self._slot(machine_id), created_at, (cpu, ram, disk))
+
+    def extend(self, rows: Iterable[dict[str, Any]]) -> None:
+        with self._lock:
+            for row in rows:
+                values = tuple(row[column] for column in METRIC_COLUMNS)
+                self._write(self._slot(row["machine_id"]), row["created_at"], values)
+
+    def _write(self, slot: int, created_at: datetime, values: tuple[float, float, float]) -> None:
+        head = self._heads[slot]
+        self._values[:, slot, head] = values
+        self._times[slot, head] = int((created_at - TIME_ORIGIN).total_seconds())
+        self._heads[slot] = (head + 1) % self.window
+        self._counts[slot] = min(self._counts[slot] + 1, self.window)
+
+    def load_recent(self, db: Session, since: timedelta = timedelta(hours=1)) -> int:
+        """Warm the buffer from the database after a restart."""
+        rows = db.execute(
+            select(MetricSample.machine_id, MetricSample.created_at, *(getattr(MetricSample, c) for c in METRIC_COLUMNS))
+            .where(MetricSample.created_at >= datetime.utcnow() - since)
+            .order_by(MetricSample.created_at)
+        ).mappings()
+        count = 0
+        for chunk in rows.partitions(5000):
+            self.extend(chunk)
+            count += len(chunk)
+        return count
+
+    def window_stats(self, samples: int | None = None, percentile: float = 95.0) -> dict[str, np.ndarray]:
+        """Per-machine mean/max/percentile/slope over the last ``samples`` points.
+
+        Returns parallel arrays indexed like ``machine_ids``; slopes are in
+        percent per minute from a least-squares fit against sample time.
+        """
+        samples = min(samples or self.window, self.window)
+        with self._lock:
+            used = len(self._slots)
+            active = np.flatnonzero(self._counts[:used])
+            counts = np.minimum(self._counts[active], samples)
+            machine_ids = self._machine_ids[active]
+            if samples == self.window:
+                # Statistics are order independent, so the whole ring is used as is.
+                values = self._values[:, active]
+                times = self._times[active]
+                valid = np.arange(self.window)[None, :] < counts[:, None]
+            else:
+                # Column j holds the j-th most recent sample of each machine.
+                back = np.arange(samples)
+                positions = (self._heads[active][:, None] - 1 - back[None, :]) % self.window
+                values = self._values[:, active[:, None], positions]
+                times = self._times[active[:, None], positions]
+                valid = back[None, :] < counts[:, None]
+
+        # Slots that were never written still hold NaN, only timestamps need masking.
+        minutes = np.where(valid, times / 60.0, np.nan)
+        result: dict[str, np.ndarray] = {"machine_ids": machine_ids, "samples": counts}
+        if not len(active):
+            for column in METRIC_COLUMNS:
+                for stat in ("mean", "max", "percentile", "slope"):
+                    result[f"{column}_{stat}"] = np.empty(0)
+            return result
+
+        x_centered = minutes - np.nanmean(minutes, axis=1, keepdims=True)
+        x_var = np.nansum(x_centered**2, axis=1)
+        # Nearest-rank percentile, as for rollups: NaN padding sorts last, so the
+        # rank is taken among each machine's own samples only.
+        ranks = np.maximum(np.ceil(percentile / 100 * counts).astype(np.int64), 1) - 1
+        for index, column in enumerate(METRIC_COLUMNS):
+            series = values[index]
+            mean = np.nansum(series, axis=1, dtype=np.float64) / counts
+            covariance = np.nansum(x_centered * (series - mean[:, None]), axis=1)
+            result[f"{column}_mean"] = mean
+            result[f"{column}_max"] = np.nanmax(series, axis=1)
+            result[f"{column}_percentile"] = np.take_along_axis(np.sort(series, axis=1), ranks[:, None], axis=1)[:, 0]
+            result[f"{column}_slope"] = np.divide(covariance, x_var, out=np.zeros_like(covariance), where=x_var > 0)
+        return result
+
+    def top_machines(
+        self, order_by: str = "cpu_percent", limit: int = 100, samples: int | None = None, percentile: float = 95.0
+    ) -> list[dict[str, Any]]:
+        stats = self.window_stats(samples, percentile)
+        means = stats[f"{order_by}_mean"]
+        order = np.argsort(-means, kind="stable")[:limit]
+        return [
+            {
+                "machine_id": int(stats["machine_ids"][i]),
+                "samples": int(stats["samples"][i]),
+                **{
+                    column.removesuffix("_percent"): {
+                        "mean": float(stats[f"{column}_mean"][i]),
+                        "max": float(stats[f"{column}_max"][i]),
+                        "percentile": float(stats[f"{column}_percentile"][i]),
+                        "slope_per_minute": float(stats[f"{column}_slope"][i]),
+                    }
+                    for column in METRIC_COLUMNS
+                },
+            }
+            for i in order
+        ]
+
+
+metric_buffer = RecentMetricsBuffer(settings.metrics_buffer_window)
+
+
+def get_metric_buffer() -> RecentMetricsBuffer:
+    return metric_buffer
@@ -0,0 +1,237 @@
+"""Versioned schema migrations, applied at startup by ``migrate``.
+
+Each migration runs once, in order and in its own transaction, and is
+recorded in ``schema_migrations``. Steps check the live schema before
+changing it: a fresh database gets every table and index from the first
+migration and walks through the later ones as no-ops, while a database
+created by an older version gains only what it lacks. Later migrations
+name the tables and indexes they add, so replaying them does not depend
+on the rest of the current models.
+"""
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Engine,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    exists,
+    func,
+    insert,
+    inspect,
+    literal,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateTable
+
+from app.database import Base
+from app import models  # noqa: F401  (registers the tables on Base.metadata)
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    steps: tuple[Callable[[Connection], None], ...]
+
+
+def create_tables(*names: str) -> Callable[[Connection], None]:
+    """Create the named model tables (every table when none is named) that do not exist yet, with their indexes."""
+
+    def step(connection: Connection) -> None:
+        tables = [Base.metadata.tables[name] for name in names] if names else None
+        Base.metadata.create_all(connection, tables=tables)
+
+    return step
+
+
+def add_columns(table_name: str, *names: str) -> Callable[[Connection], None]:
+    """Add model columns missing from an existing table, with their scalar default for existing rows."""
+
+    def step(connection: Connection) -> None:
+        existing = {column["name"] for column in inspect(connection).get_columns(table_name)}
+        quote = connection.dialect.identifier_preparer.quote
+        for name in names:
+            if name in existing:
+                continue
+            column = Base.metadata.tables[table_name].c[name]
+            ddl = f"ALTER TABLE {quote(table_name)} ADD COLUMN {quote(name)} {column.type.compile(connection.dialect)}"
+            if column.default is not None and column.default.is_scalar:
+                ddl += f" DEFAULT {column.default.arg!r}"
+            connection.execute(text(ddl))
+
+    return step
+
+
+def drop_not_null(table_name: str, column_name: str) -> Callable[[Connection], None]:
+    def step(connection: Connection) -> None:
+        columns = {column["name"]: column for column in inspect(connection).get_columns(table_name)}
+        if columns[column_name]["nullable"]:
+            return
+        if connection.dialect.name == "sqlite":
+            _rebuild_sqlite_table(connection, table_name, list(columns))
+        else:
+            connection.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} DROP NOT NULL"))
+
+    return step
+
+
+def _rebuild_sqlite_table(connection: Connection, table_name: str, columns: list[str]) -> None:
+    """SQLite cannot alter a column: copy the rows into a table created from the model, then swap.
+
+    Indexes go with the old table; the index migration recreates them.
+    """
+    temporary = f"{table_name}__rebuild"
+    ddl = str(CreateTable(Base.metadata.tables[table_name]).compile(dialect=connection.dialect))
+    connection.execute(text(ddl.replace(f"CREATE TABLE {table_name} ", f"CREATE TABLE {temporary} ", 1)))
+    names = ", ".join(columns)
+    connection.execute(text(f"INSERT INTO {temporary} ({names}) SELECT {names} FROM {table_name}"))
+    connection.execute(text(f"DROP TABLE {table_name}"))
+    connection.execute(text(f"ALTER TABLE {temporary} RENAME TO {table_name}"))
+
+
+def create_indexes(*names: str) -> Callable[[Connection], None]:
+    """Create the named model indexes that do not exist yet.
+
+    A migration lists the indexes of its own version, so replaying the
+    history never builds an index before the migration adding its columns.
+    """
+
+    def step(connection: Connection) -> None:
+        indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+        for name in names:
+            indexes[name].create(connection, checkfirst=True)
+
+    return step
+
+
+def open_hours_ledgers(connection: Connection) -> None:
+    """Opening ledger row, at the current balance, for every hours bank without one."""
+    contracts = models.Contract.__table__
+    ledger = models.HoursLedgerEntry.__table__
+    opening = select(
+        contracts.c.id,
+        contracts.c.client_id,
+        literal(0.0),
+        literal(0.0),
+        contracts.c.remaining_hours,
+        contracts.c.remaining_hours,
+        literal(datetime.utcnow()),
+    ).where(
+        contracts.c.type == models.ContractType.HOURS_BANK,
+        contracts.c.remaining_hours.is_not(None),
+        ~exists().where(ledger.c.contract_id == contracts.c.id),
+    )
+    columns = ["contract_id", "client_id", "requested_hours", "applied_hours", "before_hours", "after_hours", "created_at"]
+    connection.execute(insert(ledger).from_select(columns, opening))
+
+
+def open_latest_alerts(connection: Connection) -> None:
+    """Mark the newest alert of each fingerprint as the open one repeats fold into."""
+    alerts = models.Alert.__table__
+    latest = select(func.max(alerts.c.id)).where(alerts.c.fingerprint.is_not(None)).group_by(alerts.c.fingerprint)
+    connection.execute(update(alerts).where(alerts.c.id.in_(latest)).values(is_open=True))
+
+
+# Every index of the schema at version 4, including those lost by the inventory_snapshots rebuild.
+LIST_AND_SERIES_INDEXES = (
+    "ix_alerts_created_at", "ix_alerts_fingerprint", "ix_alerts_id", "ix_alerts_machine_created", "ix_alerts_machine_id",
+    "ix_clients_created", "ix_clients_id",
+    "ix_contacts_client_id", "ix_contacts_id",
+    "ix_contracts_client_id", "ix_contracts_id",
+    "ix_installed_software_machine_id", "ix_installed_software_name_version",
+    "ix_interventions_id", "ix_interventions_technician_id", "ix_interventions_ticket_id",
+    "ix_inventory_facts_machine_id", "ix_inventory_facts_path_num", "ix_inventory_facts_path_text",
+    "ix_inventory_snapshots_id", "ix_inventory_snapshots_keyframe_id", "ix_inventory_snapshots_machine_created",
+    "ix_inventory_snapshots_machine_id",
+    "ix_invoices_client_created", "ix_invoices_created", "ix_invoices_id", "ix_invoices_status_created",
+    "ix_machines_client_id", "ix_machines_id", "ix_machines_os_name",
+    "ix_metric_alert_rules_id",
+    "ix_metric_rollups_machine_resolution_bucket", "ix_metric_rollups_resolution_bucket",
+    "ix_metric_samples_created", "ix_metric_samples_id", "ix_metric_samples_machine_created", "ix_metric_samples_machine_id",
+    "ix_opportunities_id", "ix_opportunities_prospect_id",
+    "ix_playbook_runs_created", "ix_playbook_runs_id", "ix_playbook_runs_machine_created", "ix_playbook_runs_machine_id",
+    "ix_playbook_runs_playbook_created", "ix_playbook_runs_playbook_id",
+    "ix_playbooks_id",
+    "ix_prospects_created", "ix_prospects_id", "ix_prospects_status_created",
+    "ix_technicians_id",
+    "ix_tickets_client_created", "ix_tickets_created", "ix_tickets_id", "ix_tickets_machine_created",
+    "ix_tickets_priority_created", "ix_tickets_status_created", "ix_tickets_technician_created",
+    "ix_time_entries_id", "ix_time_entries_ticket_id",
+)
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, "schéma initial", (create_tables(),)),
+    Migration(
+        2,
+        "déduplication des alertes",
+        (
+            add_columns("alerts", "fingerprint", "occurrences", "last_seen_at"),
+            add_columns("tickets", "alert_occurrences", "last_alert_at"),
+        ),
+    ),
+    Migration(
+        3,
+        "inventaires en deltas",
+        (
+            add_columns("inventory_snapshots", "delta_json", "content_hash", "keyframe_id", "chain_position"),
+            drop_not_null("inventory_snapshots", "raw_json"),
+        ),
+    ),
+    Migration(4, "index des listes, filtres et séries", (create_indexes(*LIST_AND_SERIES_INDEXES),)),
+    Migration(
+        5,
+        "facturation groupée des abonnements",
+        (
+            create_tables("billing_runs"),
+            add_columns("invoices", "contract_id", "period", "idempotency_key"),
+            create_indexes("ix_contracts_type", "ux_invoices_idempotency_key"),
+        ),
+    ),
+    Migration(6, "préfacturation consolidée", (create_tables("prebilling_buckets", "invoice_lines"),)),
+    Migration(7, "journal des banques d'heures", (create_tables("hours_ledger"), open_hours_ledgers)),
+    Migration(
+        8,
+        "alertes ouvertes uniques par empreinte",
+        (add_columns("alerts", "is_open"), open_latest_alerts, create_indexes("ux_alerts_fingerprint_open")),
+    ),
+)
+
+
+def migrate(engine: Engine, migrations: tuple[Migration, ...] = MIGRATIONS) -> list[int]:
+    """Apply pending migrations; returns the versions applied."""
+    with engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+        applied = set(connection.scalars(select(schema_migrations.c.version)))
+
+    done = []
+    for migration in migrations:
+        if migration.version in applied:
+            continue
+        with engine.begin() as connection:
+            for step in migration.steps:
+                step(connection)
+            connection.execute(
+                insert(schema_migrations).values(
+                    version=migration.version, name=migration.name, applied_at=datetime.utcnow()
+                )
+            )
+        done.append(migration.version)
+    return done
@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from enum import Enum
 
-from sqlalchemy import JSON, Boolean, DateTime, Enum as SAEnum, Float, ForeignKey, Integer, String, Text
+from sqlalchemy import JSON, Boolean, DateTime, Enum as SAEnum, Float, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -49,6 +49,12 @@ class InvoiceStatus(str, Enum):
     PAID = "paid"
 
 
+class BillingRunStatus(str, Enum):
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class AlertSeverity(str, Enum):
     INFO = "info"
     WARNING = "warning"
@@ -63,6 +69,7 @@ class TriggerType(str, Enum):
 
 class Client(Base):
     __tablename__ = "clients"
+    __table_args__ = (Index("ix_clients_created", "created_at", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -84,6 +91,10 @@ class Contact(Base):
 
 class Prospect(Base):
     __tablename__ = "prospects"
+    __table_args__ = (
+        Index("ix_prospects_created", "created_at", "id"),
+        Index("ix_prospects_status_created", "status", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     company_name: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -113,6 +124,7 @@ class Technician(Base):
 
 class Contract(Base):
     __tablename__ = "contracts"
+    __table_args__ = (Index("ix_contracts_type", "type", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), nullable=False, index=True)
@@ -127,6 +139,7 @@ class Contract(Base):
 
 class Machine(Base):
     __tablename__ = "machines"
+    __table_args__ = (Index("ix_machines_os_name", "os_name", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), nullable=False, index=True)
@@ -141,6 +154,11 @@ class Machine(Base):
 
 class MetricSample(Base):
     __tablename__ = "metric_samples"
+    __table_args__ = (
+        Index("ix_metric_samples_machine_created", "machine_id", "created_at"),
+        # Retention purge and unfiltered exports walk samples by date.
+        Index("ix_metric_samples_created", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     machine_id: Mapped[int] = mapped_column(ForeignKey("machines.id"), nullable=False, index=True)
@@ -150,8 +168,46 @@ class MetricSample(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
+class MetricRollup(Base):
+    __tablename__ = "metric_rollups"
+    __table_args__ = (
+        Index("ix_metric_rollups_machine_resolution_bucket", "machine_id", "resolution", "bucket_start", unique=True),
+        Index("ix_metric_rollups_resolution_bucket", "resolution", "bucket_start"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    machine_id: Mapped[int] = mapped_column(ForeignKey("machines.id"), nullable=False)
+    resolution: Mapped[int] = mapped_column(Integer, nullable=False)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    samples: Mapped[int] = mapped_column(Integer, nullable=False)
+    cpu_min: Mapped[float] = mapped_column(Float)
+    cpu_max: Mapped[float] = mapped_column(Float)
+    cpu_avg: Mapped[float] = mapped_column(Float)
+    cpu_p95: Mapped[float] = mapped_column(Float)
+    ram_min: Mapped[float] = mapped_column(Float)
+    ram_max: Mapped[float] = mapped_column(Float)
+    ram_avg: Mapped[float] = mapped_column(Float)
+    ram_p95: Mapped[float] = mapped_column(Float)
+    disk_min: Mapped[float] = mapped_column(Float)
+    disk_max: Mapped[float] = mapped_column(Float)
+    disk_avg: Mapped[float] = mapped_column(Float)
+    disk_p95: Mapped[float] = mapped_column(Float)
+
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    last_sample_id: Mapped[int] = mapped_column(Integer, default=0)
+    ran_at: Mapped[datetime | None] = mapped_column(DateTime)
+
+
 class Alert(Base):
     __tablename__ = "alerts"
+    __table_args__ = (
+        Index("ix_alerts_machine_created", "machine_id", "created_at", "id"),
+        Index("ux_alerts_fingerprint_open", "fingerprint", "is_open", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     machine_id: Mapped[int] = mapped_column(ForeignKey("machines.id"), nullable=False, index=True)
@@ -159,20 +215,89 @@ class Alert(Base):
     title: Mapped[str] = mapped_column(String(255), nullable=False)
     details: Mapped[str] = mapped_column(Text, default="")
     ticket_id: Mapped[int | None] = mapped_column(ForeignKey("tickets.id"))
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    fingerprint: Mapped[str | None] = mapped_column(String(64), index=True)
+    # True on the alert repeats of its fingerprint fold into, NULL (not False)
+    # once superseded, so the unique index admits any number of closed ones.
+    is_open: Mapped[bool | None] = mapped_column(Boolean)
+    occurrences: Mapped[int] = mapped_column(Integer, default=1)
+    last_seen_at: Mapped[datetime | None] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+
+class MetricAlertRule(Base):
+    __tablename__ = "metric_alert_rules"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    metric: Mapped[str] = mapped_column(String(50), nullable=False)
+    operator: Mapped[str] = mapped_column(String(2), nullable=False)
+    threshold: Mapped[float] = mapped_column(Float, nullable=False)
+    consecutive: Mapped[int] = mapped_column(Integer, default=1)
+    severity: Mapped[AlertSeverity] = mapped_column(SAEnum(AlertSeverity), default=AlertSeverity.WARNING)
+    auto_create_ticket: Mapped[bool] = mapped_column(Boolean, default=False)
 
 
 class InventorySnapshot(Base):
     __tablename__ = "inventory_snapshots"
+    __table_args__ = (Index("ix_inventory_snapshots_machine_created", "machine_id", "created_at"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     machine_id: Mapped[int] = mapped_column(ForeignKey("machines.id"), nullable=False, index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    raw_json: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # Keyframes carry the full document in raw_json; other snapshots only carry
+    # delta_json, the structural diff against the previous snapshot.
+    raw_json: Mapped[dict | None] = mapped_column(JSON)
+    delta_json: Mapped[list | None] = mapped_column(JSON)
+    content_hash: Mapped[str | None] = mapped_column(String(64))
+    keyframe_id: Mapped[int | None] = mapped_column(ForeignKey("inventory_snapshots.id"), index=True)
+    chain_position: Mapped[int] = mapped_column(Integer, default=0)
+
+    @property
+    def is_keyframe(self) -> bool:
+        return self.delta_json is None
+
+
+class InventoryFact(Base):
+    """Scalar leaf of a machine's latest inventory, e.g. ``disks.*.smart_errors = 2``."""
+
+    __tablename__ = "inventory_facts"
+    __table_args__ = (
+        Index("ix_inventory_facts_path_text", "path", "value_text", "machine_id"),
+        Index("ix_inventory_facts_path_num", "path", "value_num", "machine_id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    machine_id: Mapped[int] = mapped_column(ForeignKey("machines.id"), nullable=False, index=True)
+    snapshot_id: Mapped[int] = mapped_column(ForeignKey("inventory_snapshots.id"), nullable=False)
+    path: Mapped[str] = mapped_column(String(255), nullable=False)
+    value_text: Mapped[str | None] = mapped_column(String(255))
+    value_num: Mapped[float | None] = mapped_column(Float)
+
+
+class InstalledSoftware(Base):
+    __tablename__ = "installed_software"
+    __table_args__ = (Index("ix_installed_software_name_version", "name", "version_key", "machine_id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    machine_id: Mapped[int] = mapped_column(ForeignKey("machines.id"), nullable=False, index=True)
+    snapshot_id: Mapped[int] = mapped_column(ForeignKey("inventory_snapshots.id"), nullable=False)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    version: Mapped[str] = mapped_column(String(100), default="")
+    version_key: Mapped[str] = mapped_column(String(255), default="")
 
 
 class Ticket(Base):
     __tablename__ = "tickets"
+    # Every list filter has an index ending in (created_at, id), so a filtered
+    # page is still a single range scan in keyset order.
+    __table_args__ = (
+        Index("ix_tickets_created", "created_at", "id"),
+        Index("ix_tickets_status_created", "status", "created_at", "id"),
+        Index("ix_tickets_priority_created", "priority", "created_at", "id"),
+        Index("ix_tickets_client_created", "client_id", "created_at", "id"),
+        Index("ix_tickets_technician_created", "technician_id", "created_at", "id"),
+        Index("ix_tickets_machine_created", "machine_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), nullable=False)
@@ -182,6 +307,8 @@ class Ticket(Base):
     status: Mapped[TicketStatus] = mapped_column(SAEnum(TicketStatus), default=TicketStatus.OPEN)
     priority: Mapped[TicketPriority] = mapped_column(SAEnum(TicketPriority), default=TicketPriority.NORMAL)
     description: Mapped[str] = mapped_column(String(1000), nullable=False)
+    alert_occurrences: Mapped[int] = mapped_column(Integer, default=0)
+    last_alert_at: Mapped[datetime | None] = mapped_column(DateTime)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     time_entries: Mapped[list[TimeEntry]] = relationship(back_populates="ticket")
@@ -201,6 +328,29 @@ class TimeEntry(Base):
     ticket: Mapped[Ticket] = relationship(back_populates="time_entries")
 
 
+class HoursLedgerEntry(Base):
+    """Append-only movements of an hours bank; the balance is the last ``after_hours``.
+
+    The first row of a contract opens the ledger with its balance; each
+    consumption then records the hours asked for, the hours actually taken
+    (never more than the balance) and the balance on both sides.
+    """
+
+    __tablename__ = "hours_ledger"
+    __table_args__ = (Index("ix_hours_ledger_contract", "contract_id", "id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    contract_id: Mapped[int] = mapped_column(ForeignKey("contracts.id"), nullable=False)
+    client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), nullable=False)
+    # None on the opening row.
+    time_entry_id: Mapped[int | None] = mapped_column(ForeignKey("time_entries.id"))
+    requested_hours: Mapped[float] = mapped_column(Float, default=0)
+    applied_hours: Mapped[float] = mapped_column(Float, default=0)
+    before_hours: Mapped[float] = mapped_column(Float, nullable=False)
+    after_hours: Mapped[float] = mapped_column(Float, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 class Intervention(Base):
     __tablename__ = "interventions"
 
@@ -214,6 +364,12 @@ class Intervention(Base):
 
 class Invoice(Base):
     __tablename__ = "invoices"
+    __table_args__ = (
+        Index("ix_invoices_created", "created_at", "id"),
+        Index("ix_invoices_status_created", "status", "created_at", "id"),
+        Index("ix_invoices_client_created", "client_id", "created_at", "id"),
+        Index("ux_invoices_idempotency_key", "idempotency_key", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), nullable=False)
@@ -221,6 +377,73 @@ class Invoice(Base):
     amount: Mapped[float] = mapped_column(Float, nullable=False)
     description: Mapped[str] = mapped_column(String(1000), default="")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    contract_id: Mapped[int | None] = mapped_column(ForeignKey("contracts.id"))
+    # Billing period, "YYYY-MM", for subscription invoices.
+    period: Mapped[str | None] = mapped_column(String(7))
+    # One invoice per (contract, period): a second billing attempt conflicts on this key.
+    idempotency_key: Mapped[str | None] = mapped_column(String(64))
+
+
+class PrebillingBucket(Base):
+    """Billable time accumulated for one (client, contract, period) until it is invoiced."""
+
+    __tablename__ = "prebilling_buckets"
+    __table_args__ = (
+        Index("ux_prebilling_buckets_key", "bucket_key", unique=True),
+        Index("ix_prebilling_buckets_open", "invoice_id", "period", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    # "client:contract:period" while the bucket is open, cleared once invoiced so later entries open a new one.
+    bucket_key: Mapped[str | None] = mapped_column(String(64))
+    client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), nullable=False)
+    contract_id: Mapped[int | None] = mapped_column(ForeignKey("contracts.id"))
+    period: Mapped[str] = mapped_column(String(7), nullable=False)
+    hours: Mapped[float] = mapped_column(Float, default=0)
+    amount: Mapped[float] = mapped_column(Float, default=0)
+    entry_count: Mapped[int] = mapped_column(Integer, default=0)
+    invoice_id: Mapped[int | None] = mapped_column(ForeignKey("invoices.id"))
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class InvoiceLine(Base):
+    """One ticket's billable time within a bucket; attached to the invoice at consolidation."""
+
+    __tablename__ = "invoice_lines"
+    __table_args__ = (
+        Index("ux_invoice_lines_bucket_ticket", "bucket_id", "ticket_id", unique=True),
+        Index("ix_invoice_lines_invoice", "invoice_id", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    bucket_id: Mapped[int] = mapped_column(ForeignKey("prebilling_buckets.id"), nullable=False)
+    invoice_id: Mapped[int | None] = mapped_column(ForeignKey("invoices.id"))
+    ticket_id: Mapped[int] = mapped_column(ForeignKey("tickets.id"), nullable=False)
+    description: Mapped[str] = mapped_column(String(1000), default="")
+    hours: Mapped[float] = mapped_column(Float, default=0)
+    unit_price: Mapped[float] = mapped_column(Float, nullable=False)
+    amount: Mapped[float] = mapped_column(Float, default=0)
+
+
+class BillingRun(Base):
+    __tablename__ = "billing_runs"
+    __table_args__ = (Index("ix_billing_runs_period", "period", "id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    period: Mapped[str] = mapped_column(String(7), nullable=False)
+    status: Mapped[BillingRunStatus] = mapped_column(SAEnum(BillingRunStatus), default=BillingRunStatus.RUNNING)
+    total_contracts: Mapped[int] = mapped_column(Integer, default=0)
+    processed: Mapped[int] = mapped_column(Integer, default=0)
+    invoiced: Mapped[int] = mapped_column(Integer, default=0)
+    already_billed: Mapped[int] = mapped_column(Integer, default=0)
+    skipped: Mapped[int] = mapped_column(Integer, default=0)
+    # Highest contract id committed so far: a resumed run continues after it.
+    last_contract_id: Mapped[int] = mapped_column(Integer, default=0)
+    error: Mapped[str | None] = mapped_column(Text)
+    started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime)
 
 
 class Playbook(Base):
@@ -234,6 +457,11 @@ class Playbook(Base):
 
 class PlaybookRun(Base):
     __tablename__ = "playbook_runs"
+    __table_args__ = (
+        Index("ix_playbook_runs_created", "created_at", "id"),
+        Index("ix_playbook_runs_machine_created", "machine_id", "created_at", "id"),
+        Index("ix_playbook_runs_playbook_created", "playbook_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     playbook_id: Mapped[int] = mapped_column(ForeignKey("playbooks.id"), nullable=False, index=True)
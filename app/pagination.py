@@ -0,0 +1,81 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import DateTime, Select, tuple_
+from sqlalchemy.orm import InstrumentedAttribute, Session
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(values: tuple[Any, ...]) -> str:
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: tuple[InstrumentedAttribute, ...]) -> tuple[Any, ...]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(payload, list) or len(payload) != len(columns):
+            raise ValueError(payload)
+        return tuple(
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else int(value)
+            for column, value in zip(columns, payload)
+        )
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursorError("Curseur invalide") from exc
+
+
+def _page_query(
+    query: Select, columns: tuple[InstrumentedAttribute, ...], limit: int, cursor: str | None, descending: bool
+) -> Select:
+    key = tuple_(*columns)
+    if cursor is not None:
+        position = tuple_(*decode_cursor(cursor, columns))
+        query = query.where(key < position if descending else key > position)
+    order = [column.desc() if descending else column.asc() for column in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+
+def paginate(
+    db: Session,
+    query: Select,
+    columns: tuple[InstrumentedAttribute, ...],
+    limit: int,
+    cursor: str | None = None,
+    descending: bool = True,
+) -> tuple[list[Any], str | None]:
+    """Keyset pagination on ``columns`` (e.g. ``created_at, id``), newest first by default.
+
+    Each page is one indexed range scan from the cursor position, so deep
+    pages cost the same as the first one.
+    """
+    rows = db.scalars(_page_query(query, columns, limit, cursor, descending)).all()
+    if len(rows) <= limit:
+        return list(rows), None
+    rows = rows[:limit]
+    return list(rows), encode_cursor(tuple(getattr(rows[-1], column.key) for column in columns))
+
+
+def paginate_columns(
+    db: Session,
+    query: Select,
+    columns: tuple[InstrumentedAttribute, ...],
+    limit: int,
+    cursor: str | None = None,
+    descending: bool = True,
+) -> tuple[list[dict[str, Any]], str | None]:
+    """``paginate`` for a select of plain columns: rows come back as dicts, no ORM instances."""
+    result = db.execute(_page_query(query, columns, limit, cursor, descending))
+    keys = list(result.keys())
+    rows = [dict(zip(keys, row)) for row in result]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(tuple(rows[-1][column.key] for column in columns))
@@ -0,0 +1,170 @@
+"""Pre-billing ledger: billable time accumulated per (client, contract, period), invoiced once.
+
+Each billable time entry adds its hours and amount to the open bucket of
+its client, contract and month, and to that bucket's line for the ticket,
+with two upserts: no invoice is written per entry. Consolidation turns
+each open bucket into one draft invoice and attaches its lines, a few
+statements per chunk of buckets, so month-end work grows with the number
+of clients rather than with the number of time entries.
+"""
+
+import functools
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.database import UPSERT_INSERTS
+from app.models import (
+    Contract,
+    ContractType,
+    Invoice,
+    InvoiceLine,
+    InvoiceStatus,
+    PrebillingBucket,
+    Ticket,
+    TimeEntry,
+)
+from app.services import billing_period
+
+DEFAULT_HOURLY_RATE = 120
+PREBILLING_CHUNK_BUCKETS = 1000
+
+
+def hourly_rate(db: Session, ticket: Ticket) -> float:
+    """Rate billed for the ticket's time; 0 when it is not billed per hour (hours bank)."""
+    if not ticket.contract_id:
+        return DEFAULT_HOURLY_RATE
+    contract = db.get(Contract, ticket.contract_id)
+    if not contract or contract.type == ContractType.HOURS_BANK:
+        return 0
+    return contract.hourly_rate
+
+
+@functools.cache
+def ledger_upserts(dialect: str) -> tuple[Any, Any]:
+    """Bucket and line upserts, built once per dialect; they take their values as bind parameters."""
+    bucket = UPSERT_INSERTS[dialect](PrebillingBucket).values(
+        bucket_key=bindparam("bucket_key"),
+        client_id=bindparam("client_id"),
+        contract_id=bindparam("contract_id"),
+        period=bindparam("period"),
+        hours=bindparam("hours"),
+        amount=bindparam("amount"),
+        entry_count=1,
+        created_at=bindparam("now"),
+        updated_at=bindparam("now"),
+    )
+    bucket = bucket.on_conflict_do_update(
+        index_elements=["bucket_key"],
+        set_={
+            "hours": PrebillingBucket.hours + bucket.excluded.hours,
+            "amount": PrebillingBucket.amount + bucket.excluded.amount,
+            "entry_count": PrebillingBucket.entry_count + 1,
+            "updated_at": bucket.excluded.updated_at,
+        },
+    ).returning(PrebillingBucket.id)
+
+    line = UPSERT_INSERTS[dialect](InvoiceLine).values(
+        bucket_id=bindparam("bucket_id"),
+        ticket_id=bindparam("ticket_id"),
+        description=bindparam("description"),
+        hours=bindparam("hours"),
+        unit_price=bindparam("unit_price"),
+        amount=bindparam("amount"),
+    )
+    line = line.on_conflict_do_update(
+        index_elements=["bucket_id", "ticket_id"],
+        set_={"hours": InvoiceLine.hours + line.excluded.hours, "amount": InvoiceLine.amount + line.excluded.amount},
+    )
+    return bucket, line
+
+
+def accumulate_time_entry(db: Session, ticket: Ticket, entry: TimeEntry) -> int | None:
+    """Add a billable entry to its bucket and ticket line; returns the bucket id, None if nothing is billed."""
+    if not entry.billable:
+        return None
+    rate = hourly_rate(db, ticket)
+    if rate <= 0:
+        return None
+
+    now = datetime.utcnow()
+    period = billing_period(entry.created_at or now)
+    amount = round(rate * entry.duration_hours, 2)
+    bucket, line = ledger_upserts(db.get_bind().dialect.name)
+    bucket_id = db.scalar(
+        bucket,
+        {
+            "bucket_key": f"{ticket.client_id}:{ticket.contract_id or '-'}:{period}",
+            "client_id": ticket.client_id,
+            "contract_id": ticket.contract_id,
+            "period": period,
+            "hours": entry.duration_hours,
+            "amount": amount,
+            "now": now,
+        },
+    )
+    db.execute(
+        line,
+        {
+            "bucket_id": bucket_id,
+            "ticket_id": ticket.id,
+            "description": f"Ticket #{ticket.id}",
+            "hours": entry.duration_hours,
+            "unit_price": rate,
+            "amount": amount,
+        },
+    )
+    return bucket_id
+
+
+def consolidate_prebilling(db: Session, period: str | None = None, chunk_size: int = PREBILLING_CHUNK_BUCKETS) -> int:
+    """Invoice the open buckets of ``period``, or of every closed period (before this month); returns the invoice count."""
+    closed = PrebillingBucket.period == period if period else PrebillingBucket.period < billing_period()
+    query = (
+        select(
+            PrebillingBucket.id,
+            PrebillingBucket.client_id,
+            PrebillingBucket.contract_id,
+            PrebillingBucket.period,
+            PrebillingBucket.amount,
+        )
+        .where(PrebillingBucket.invoice_id.is_(None), closed)
+        .order_by(PrebillingBucket.id)
+        .limit(chunk_size)
+        # Entries for these buckets wait until they are closed (PostgreSQL; SQLite has one writer anyway).
+        .with_for_update()
+    )
+    attach_lines = (
+        update(InvoiceLine.__table__)
+        .where(InvoiceLine.__table__.c.bucket_id == bindparam("b_bucket_id"))
+        .values(invoice_id=bindparam("b_invoice_id"))
+    )
+    invoiced = 0
+    while buckets := db.execute(query).all():
+        now = datetime.utcnow()
+        rows = [
+            {
+                "client_id": bucket.client_id,
+                "amount": round(bucket.amount, 2),
+                "description": f"Prestations {bucket.period}"
+                + (f" contrat #{bucket.contract_id}" if bucket.contract_id else ""),
+                "status": InvoiceStatus.DRAFT,
+                "created_at": now,
+                "contract_id": bucket.contract_id,
+                "period": bucket.period,
+                "idempotency_key": f"prebilling:{bucket.id}",
+            }
+            for bucket in buckets
+        ]
+        invoice_ids = db.scalars(insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True), rows).all()
+        closing = [
+            {"id": bucket.id, "invoice_id": invoice_id, "bucket_key": None, "updated_at": now}
+            for bucket, invoice_id in zip(buckets, invoice_ids)
+        ]
+        db.execute(update(PrebillingBucket), closing)
+        db.execute(attach_lines, [{"b_bucket_id": row["id"], "b_invoice_id": row["invoice_id"]} for row in closing])
+        db.commit()
+        invoiced += len(rows)
+    return invoiced
@@ -0,0 +1,238 @@
+import codecs
+import csv
+import json
+import zlib
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import Any
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# What a corrupt compressed body raises while it is being decoded.
+DECODE_ERRORS: tuple[type[Exception], ...] = (zlib.error,) if zstandard is None else (zlib.error, zstandard.ZstdError)
+
+# Decoded bodies are handed to the application in pieces of at most this size,
+# so a compressed upload never has to be inflated in one go.
+OUTPUT_CHUNK = 64 * 1024
+ZSTD_INPUT_CHUNK = 8 * 1024
+MAX_NDJSON_LINE_BYTES = 1024 * 1024
+
+Decoder = tuple[Callable[[bytes], Iterator[bytes]], Callable[[], bytes]]
+
+
+def _zlib_decoder(wbits: int) -> Decoder:
+    decompressor = zlib.decompressobj(wbits)
+
+    def decode(data: bytes) -> Iterator[bytes]:
+        while data:
+            out = decompressor.decompress(data, OUTPUT_CHUNK)
+            data = decompressor.unconsumed_tail
+            if out:
+                yield out
+
+    def finish() -> bytes:
+        tail = decompressor.flush()
+        if not decompressor.eof:
+            raise zlib.error("truncated compressed body")
+        return tail
+
+    return decode, finish
+
+
+def _zstd_decoder() -> Decoder:
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def decode(data: bytes) -> Iterator[bytes]:
+        for start in range(0, len(data), ZSTD_INPUT_CHUNK):
+            out = decompressor.decompress(data[start:start + ZSTD_INPUT_CHUNK])
+            if out:
+                yield out
+
+    def finish() -> bytes:
+        # A truncated frame decodes without error; only the missing end tells.
+        if not decompressor.eof:
+            raise zstandard.ZstdError("truncated zstd frame")
+        return b""
+
+    return decode, finish
+
+
+def make_decoder(encoding: str) -> Decoder | None:
+    if encoding in ("gzip", "x-gzip"):
+        return _zlib_decoder(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return _zlib_decoder(zlib.MAX_WBITS)
+    if encoding == "zstd" and zstandard is not None:
+        return _zstd_decoder()
+    return None
+
+
+def body_too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Corps de requête trop volumineux (max {limit} octets)")
+
+
+class _DecodingReceive:
+    """Wraps ``receive`` to inflate the body piece by piece and enforce the size limit."""
+
+    def __init__(self, receive: Receive, decoder: Decoder | None, limit: int) -> None:
+        self._receive = receive
+        self._decoder = decoder
+        self._limit = limit
+        self._pieces: Iterator[bytes] = iter(())
+        self._size = 0
+        self._ended = False
+        self._last_sent = False
+
+    async def __call__(self) -> Message:
+        if self._last_sent:
+            return await self._receive()
+        while True:
+            try:
+                piece = next(self._pieces, None)
+            except DECODE_ERRORS as exc:
+                raise HTTPException(status_code=400, detail="Corps compressé invalide") from exc
+            if piece is not None:
+                return self._message(piece, more_body=True)
+            if self._ended:
+                self._last_sent = True
+                return self._message(b"", more_body=False)
+
+            message = await self._receive()
+            if message["type"] != "http.request":
+                return message
+            body = message.get("body", b"")
+            self._ended = not message.get("more_body", False)
+            if self._decoder is None:
+                self._pieces = iter((body,))
+            else:
+                decode, finish = self._decoder
+                self._pieces = decode(body)
+                if self._ended:
+                    self._pieces = _chain(self._pieces, finish)
+
+    def _message(self, body: bytes, more_body: bool) -> Message:
+        self._size += len(body)
+        if self._size > self._limit:
+            raise body_too_large(self._limit)
+        return {"type": "http.request", "body": body, "more_body": more_body}
+
+
+def _chain(pieces: Iterator[bytes], finish: Callable[[], bytes]) -> Iterator[bytes]:
+    yield from pieces
+    tail = finish()
+    if tail:
+        yield tail
+
+
+class RequestBodyMiddleware:
+    """Decodes ``Content-Encoding: gzip/deflate/zstd`` request bodies as they stream in.
+
+    Bodies are capped at ``max_body_bytes`` after decoding (413); unknown
+    encodings, or zstd without the ``zstandard`` package, are refused (415).
+    """
+
+    def __init__(self, app: ASGIApp, max_body_bytes: int) -> None:
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = headers.get("content-encoding", "identity").strip().lower()
+        length = headers.get("content-length")
+        if length and length.isdigit() and int(length) > self.max_body_bytes:
+            error = body_too_large(self.max_body_bytes)
+            await JSONResponse({"detail": error.detail}, status_code=413)(scope, receive, send)
+            return
+
+        decoder = None
+        if encoding != "identity":
+            decoder = make_decoder(encoding)
+            if decoder is None:
+                detail = f"Content-Encoding non supporté : {encoding}"
+                await JSONResponse({"detail": detail}, status_code=415)(scope, receive, send)
+                return
+            # Downstream sees a plain body of unknown length.
+            scope = dict(scope)
+            scope["headers"] = [
+                (key, value) for key, value in scope["headers"] if key not in (b"content-encoding", b"content-length")
+            ]
+        await self.app(scope, _DecodingReceive(receive, decoder, self.max_body_bytes), send)
+
+
+async def iter_ndjson(
+    chunks: AsyncIterator[bytes], max_line_bytes: int = MAX_NDJSON_LINE_BYTES
+) -> AsyncIterator[tuple[int, Any, str | None]]:
+    """Yield ``(index, value, error)`` for each non-blank line of an NDJSON stream."""
+    pending = bytearray()
+    index = 0
+    async for chunk in chunks:
+        pending += chunk
+        start = 0
+        while (end := pending.find(b"\n", start)) != -1:
+            line = bytes(pending[start:end])
+            start = end + 1
+            if line.strip():
+                yield index, *_parse_line(line)
+                index += 1
+        del pending[:start]
+        if len(pending) > max_line_bytes:
+            raise HTTPException(status_code=413, detail=f"Ligne NDJSON trop longue (max {max_line_bytes} octets)")
+    if pending.strip():
+        yield index, *_parse_line(bytes(pending))
+
+
+def _parse_line(line: bytes) -> tuple[Any, str | None]:
+    try:
+        return json.loads(line), None
+    except ValueError as exc:
+        return None, f"JSON invalide : {exc}"
+
+
+async def _csv_records(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[list[str]]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        # Cut after the last newline that is outside quotes (even number of quotes before it).
+        end = pending.rfind("\n")
+        while end != -1 and pending.count('"', 0, end) % 2:
+            end = pending.rfind("\n", 0, end)
+        if end == -1:
+            if len(pending) > max_line_bytes:
+                raise HTTPException(status_code=413, detail=f"Ligne CSV trop longue (max {max_line_bytes} octets)")
+            continue
+        complete, pending = pending[: end + 1], pending[end + 1 :]
+        for record in csv.reader(complete.splitlines(keepends=True)):
+            if record:
+                yield record
+    for record in csv.reader((pending + decoder.decode(b"", final=True)).splitlines(keepends=True)):
+        if record:
+            yield record
+
+
+async def iter_csv(
+    chunks: AsyncIterator[bytes], max_line_bytes: int = MAX_NDJSON_LINE_BYTES
+) -> AsyncIterator[tuple[int, dict[str, str] | None, str | None]]:
+    """Yield ``(index, row, error)`` for each record of a CSV stream with a header line."""
+    header: list[str] | None = None
+    index = 0
+    async for record in _csv_records(chunks, max_line_bytes):
+        if header is None:
+            header = [name.strip() for name in record]
+        elif len(record) != len(header):
+            yield index, None, f"{len(record)} colonnes au lieu de {len(header)}"
+            index += 1
+        else:
+            yield index, dict(zip(header, record)), None
+            index += 1
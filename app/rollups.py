@@ -0,0 +1,247 @@
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import bindparam, delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.config import Settings, settings
+from app.models import MetricRollup, MetricSample, RollupWatermark
+
+EPOCH = datetime(1970, 1, 1)
+METRICS = (("cpu", "cpu_percent"), ("ram", "ram_percent"), ("disk", "disk_percent"))
+RAW = "raw"
+# Agents report every 1 to 5 minutes; raw reads are costed as one point per minute.
+RAW_STEP_SECONDS = 60
+MAX_POINTS = 720
+ROLLUP_BATCH_SIZE = 100_000
+
+
+@dataclass(frozen=True)
+class RollupTier:
+    name: str
+    seconds: int
+    retention: timedelta
+
+
+def rollup_tiers(config: Settings = settings) -> tuple[RollupTier, ...]:
+    return (
+        RollupTier("1m", 60, timedelta(days=config.metrics_1m_retention_days)),
+        RollupTier("5m", 300, timedelta(days=config.metrics_5m_retention_days)),
+        RollupTier("1h", 3600, timedelta(days=config.metrics_1h_retention_days)),
+    )
+
+
+def raw_retention(config: Settings = settings) -> timedelta:
+    # Buckets are recomputed from raw samples, so raw data must outlive the widest bucket.
+    return max(timedelta(hours=config.metrics_raw_retention_hours), timedelta(hours=2))
+
+
+TIERS = rollup_tiers()
+TIERS_BY_NAME = {tier.name: tier for tier in TIERS}
+
+
+def bucket_start(moment: datetime, seconds: int) -> datetime:
+    offset = int((moment - EPOCH).total_seconds()) // seconds * seconds
+    return EPOCH + timedelta(seconds=offset)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def aggregate(machine_id: int, resolution: int, start: datetime, samples: list[Any]) -> dict[str, Any]:
+    row: dict[str, Any] = {
+        "machine_id": machine_id,
+        "resolution": resolution,
+        "bucket_start": start,
+        "samples": len(samples),
+    }
+    for prefix, column in METRICS:
+        values = sorted(getattr(sample, column) for sample in samples)
+        row[f"{prefix}_min"] = values[0]
+        row[f"{prefix}_max"] = values[-1]
+        row[f"{prefix}_avg"] = sum(values) / len(values)
+        row[f"{prefix}_p95"] = percentile(values, 0.95)
+    return row
+
+
+def _watermark(db: Session, tier: RollupTier) -> RollupWatermark:
+    name = f"metric_samples:{tier.name}"
+    watermark = db.get(RollupWatermark, name)
+    if watermark is None:
+        watermark = RollupWatermark(name=name, last_sample_id=0)
+        db.add(watermark)
+        db.flush()
+    return watermark
+
+
+def rollup_lag(db: Session) -> int:
+    """Sample ids re-read behind the watermark on each run.
+
+    SQLite hands out ids under its single write lock, so they follow commit
+    order. PostgreSQL assigns them at insert: a transaction that commits
+    after a run, with ids below the watermark, would be skipped for good.
+    Re-reading the last ``metrics_rollup_lag_ids`` ids folds it in, unless
+    it commits later than that many ids behind.
+    """
+    return 0 if db.get_bind().dialect.name == "sqlite" else settings.metrics_rollup_lag_ids
+
+
+def rollup_tier(db: Session, tier: RollupTier, now: datetime, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """Recompute the buckets touched by samples ingested since the tier's watermark.
+
+    Touched buckets are rebuilt from raw samples, so late or batched samples
+    are folded into the right bucket instead of being lost. Samples within
+    ``rollup_lag`` ids behind the watermark are read again with each batch.
+    """
+    watermark = _watermark(db, tier)
+    columns = (MetricSample.id, MetricSample.machine_id, MetricSample.created_at)
+    new_samples = db.execute(
+        select(*columns).where(MetricSample.id > watermark.last_sample_id).order_by(MetricSample.id).limit(batch_size)
+    ).all()
+    watermark.ran_at = now
+    if not new_samples:
+        return 0
+    lagging = []
+    if lag := rollup_lag(db):
+        lagging = db.execute(
+            select(*columns).where(
+                MetricSample.id > watermark.last_sample_id - lag, MetricSample.id <= watermark.last_sample_id
+            )
+        ).all()
+
+    horizon = now - raw_retention()
+    touched: set[tuple[int, datetime]] = {
+        (sample.machine_id, bucket_start(sample.created_at, tier.seconds))
+        for sample in (*lagging, *new_samples)
+        if sample.created_at >= horizon
+    }
+    watermark.last_sample_id = new_samples[-1].id
+    if not touched:
+        return len(new_samples)
+
+    machine_ids = {machine_id for machine_id, _ in touched}
+    low = min(start for _, start in touched)
+    high = max(start for _, start in touched) + timedelta(seconds=tier.seconds)
+    groups: dict[tuple[int, datetime], list[Any]] = defaultdict(list)
+    for sample in db.execute(
+        select(MetricSample.machine_id, MetricSample.created_at, *(getattr(MetricSample, c) for _, c in METRICS)).where(
+            MetricSample.machine_id.in_(machine_ids),
+            MetricSample.created_at >= low,
+            MetricSample.created_at < high,
+        )
+    ):
+        key = (sample.machine_id, bucket_start(sample.created_at, tier.seconds))
+        if key in touched:
+            groups[key].append(sample)
+
+    table = MetricRollup.__table__
+    db.execute(
+        delete(table).where(
+            table.c.machine_id == bindparam("m"),
+            table.c.resolution == tier.seconds,
+            table.c.bucket_start == bindparam("b"),
+        ),
+        [{"m": machine_id, "b": start} for machine_id, start in touched],
+    )
+    if groups:
+        db.execute(
+            insert(MetricRollup),
+            [aggregate(machine_id, tier.seconds, start, samples) for (machine_id, start), samples in groups.items()],
+        )
+    return len(new_samples)
+
+
+def run_metric_rollups(db: Session, now: datetime | None = None, force: bool = False) -> dict[str, int]:
+    """Advance every tier that is due; coarse tiers only run once per bucket width."""
+    now = now or datetime.utcnow()
+    processed: dict[str, int] = {}
+    for tier in TIERS:
+        watermark = _watermark(db, tier)
+        if not force and watermark.ran_at and now - watermark.ran_at < timedelta(seconds=tier.seconds):
+            continue
+        processed[tier.name] = 0
+        while True:
+            count = rollup_tier(db, tier, now)
+            processed[tier.name] += count
+            if count < ROLLUP_BATCH_SIZE:
+                break
+    db.commit()
+    return processed
+
+
+def apply_metric_retention(db: Session, now: datetime | None = None) -> dict[str, int]:
+    now = now or datetime.utcnow()
+    deleted = {
+        RAW: db.execute(
+            delete(MetricSample).where(MetricSample.created_at < now - raw_retention())
+        ).rowcount
+    }
+    for tier in TIERS:
+        deleted[tier.name] = db.execute(
+            delete(MetricRollup).where(
+                MetricRollup.resolution == tier.seconds,
+                MetricRollup.bucket_start < now - tier.retention,
+            )
+        ).rowcount
+    db.commit()
+    return deleted
+
+
+def maintain_metrics(db: Session) -> None:
+    run_metric_rollups(db)
+    apply_metric_retention(db)
+
+
+def choose_resolution(start: datetime, end: datetime, now: datetime) -> str:
+    """Pick the finest tier that still holds ``start`` and answers in at most MAX_POINTS rows."""
+    span = (end - start).total_seconds()
+    candidates: list[tuple[str, int]] = []
+    if start >= now - raw_retention():
+        candidates.append((RAW, RAW_STEP_SECONDS))
+    candidates += [(tier.name, tier.seconds) for tier in TIERS if start >= now - tier.retention]
+    for name, step in candidates:
+        if span / step <= MAX_POINTS:
+            return name
+    return candidates[-1][0] if candidates else TIERS[-1].name
+
+
+def metric_series(db: Session, machine_id: int, start: datetime, end: datetime, resolution: str) -> list[dict]:
+    if resolution == RAW:
+        rows = db.execute(
+            select(MetricSample.created_at, *(getattr(MetricSample, c) for _, c in METRICS))
+            .where(
+                MetricSample.machine_id == machine_id,
+                MetricSample.created_at >= start,
+                MetricSample.created_at < end,
+            )
+            .order_by(MetricSample.created_at)
+        )
+        points = []
+        for row in rows:
+            point: dict[str, Any] = {"bucket_start": row.created_at, "samples": 1}
+            for prefix, column in METRICS:
+                value = getattr(row, column)
+                point.update({f"{prefix}_min": value, f"{prefix}_max": value, f"{prefix}_avg": value, f"{prefix}_p95": value})
+            points.append(point)
+        return points
+
+    tier = TIERS_BY_NAME[resolution]
+    rollups = db.scalars(
+        select(MetricRollup)
+        .where(
+            MetricRollup.machine_id == machine_id,
+            MetricRollup.resolution == tier.seconds,
+            MetricRollup.bucket_start >= bucket_start(start, tier.seconds),
+            MetricRollup.bucket_start < end,
+        )
+        .order_by(MetricRollup.bucket_start)
+    )
+    return [
+        {column.key: getattr(rollup, column.key) for column in MetricRollup.__table__.columns if column.key != "id"}
+        for rollup in rollups
+    ]
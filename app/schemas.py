@@ -1,9 +1,11 @@
 from datetime import datetime
+from typing import Annotated, Any, Generic, Literal, TypeVar
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 from app.models import (
     AlertSeverity,
+    BillingRunStatus,
     ContractType,
     InvoiceStatus,
     OpportunityStatus,
@@ -13,6 +15,15 @@ from app.models import (
     TriggerType,
 )
 
+T = TypeVar("T")
+BillingPeriod = Annotated[str, Field(pattern=r"^\d{4}-(0[1-9]|1[0-2])$", examples=["2024-06"])]
+
+
+class Page(BaseModel, Generic[T]):
+    items: list[T]
+    # Opaque keyset cursor for the next page, None on the last page.
+    next_cursor: str | None = None
+
 
 class ClientCreate(BaseModel):
     name: str
@@ -50,6 +61,7 @@ class ProspectCreate(BaseModel):
 
 class ProspectOut(ProspectCreate):
     id: int
+    created_at: datetime
 
     model_config = {"from_attributes": True}
 
@@ -100,6 +112,26 @@ class ContractOut(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class HoursBalanceOut(BaseModel):
+    contract_id: int
+    consumed_hours: float
+    remaining_hours: float | None
+    movements: int
+
+
+class HoursLedgerEntryOut(BaseModel):
+    id: int
+    contract_id: int
+    time_entry_id: int | None
+    requested_hours: float
+    applied_hours: float
+    before_hours: float
+    after_hours: float
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
 class MachineCreate(BaseModel):
     client_id: int
     hostname: str
@@ -117,6 +149,46 @@ class MachineOut(MachineCreate):
     model_config = {"from_attributes": True}
 
 
+class ClientRef(BaseModel):
+    """Imported row attached to a client, by id or by the client's email."""
+
+    client_id: int | None = None
+    client_email: str | None = None
+
+    @model_validator(mode="after")
+    def _client_given(self) -> "ClientRef":
+        if self.client_id is None and self.client_email is None:
+            raise ValueError("client_id ou client_email requis")
+        return self
+
+
+class ContactImport(ClientRef):
+    name: str
+    email: str | None = None
+    role: str | None = None
+
+
+class MachineImport(ClientRef):
+    hostname: str
+    os_name: str
+    cpu_model: str | None = None
+    ram_total_gb: float | None = None
+    agent_version: str | None = None
+
+
+class ImportErrorOut(BaseModel):
+    index: int
+    error: str
+
+
+class ImportResultOut(BaseModel):
+    entity: str
+    inserted: int
+    rejected: int
+    # Only the first rejected rows are detailed, the counters cover the whole upload.
+    errors: list[ImportErrorOut]
+
+
 class HeartbeatCreate(BaseModel):
     agent_version: str | None = None
 
@@ -135,6 +207,98 @@ class MetricOut(MetricCreate):
     model_config = {"from_attributes": True}
 
 
+class MetricBatchItem(MetricCreate):
+    machine_id: int
+    created_at: datetime | None = None
+
+
+class MetricBatchCreate(BaseModel):
+    # Items are validated one by one so that a bad sample is rejected alone
+    # instead of failing the whole batch with a 422.
+    samples: list[dict[str, Any]] = Field(min_length=1, max_length=5000)
+
+
+class MetricBatchItemResult(BaseModel):
+    index: int
+    machine_id: int | None = None
+    accepted: bool
+    error: str | None = None
+
+
+class MetricBatchOut(BaseModel):
+    accepted: int
+    rejected: int
+    results: list[MetricBatchItemResult]
+
+
+class MetricStreamOut(BaseModel):
+    accepted: int
+    rejected: int
+    # Only the first rejected lines are detailed, the counters cover the whole stream.
+    errors: list[MetricBatchItemResult]
+
+
+class MetricPointOut(BaseModel):
+    bucket_start: datetime
+    samples: int
+    cpu_min: float
+    cpu_max: float
+    cpu_avg: float
+    cpu_p95: float
+    ram_min: float
+    ram_max: float
+    ram_avg: float
+    ram_p95: float
+    disk_min: float
+    disk_max: float
+    disk_avg: float
+    disk_p95: float
+
+
+class MetricSeriesOut(BaseModel):
+    machine_id: int
+    resolution: str
+    start: datetime
+    end: datetime
+    points: list[MetricPointOut]
+
+
+class MetricWindowOut(BaseModel):
+    mean: float
+    max: float
+    percentile: float
+    slope_per_minute: float
+
+
+class MachineMetricStatsOut(BaseModel):
+    machine_id: int
+    samples: int
+    cpu: MetricWindowOut
+    ram: MetricWindowOut
+    disk: MetricWindowOut
+
+
+class MetricQueuedOut(BaseModel):
+    status: str = "queued"
+    machine_id: int
+
+
+class IngestStatsOut(BaseModel):
+    enabled: bool
+    depth: int = 0
+    in_flight: int = 0
+    capacity: int = 0
+    enqueued: int = 0
+    written: int = 0
+    rejected: int = 0
+    failed: int = 0
+    retries: int = 0
+    flushes: int = 0
+    last_flush_ms: float = 0.0
+    max_flush_ms: float = 0.0
+    avg_flush_ms: float = 0.0
+
+
 class AlertCreate(BaseModel):
     severity: AlertSeverity = AlertSeverity.WARNING
     title: str
@@ -149,6 +313,36 @@ class AlertOut(BaseModel):
     title: str
     details: str
     ticket_id: int | None = None
+    occurrences: int = 1
+    last_seen_at: datetime | None = None
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class AlertListItemOut(AlertOut):
+    # Deferred on listings: only present when named in ``fields``.
+    details: str | None = None
+
+
+class AlertDedupStatsOut(BaseModel):
+    tracked: int
+    deduplicated: int
+    suppressed: int
+
+
+class AlertRuleCreate(BaseModel):
+    name: str
+    metric: Literal["cpu_percent", "ram_percent", "disk_percent"]
+    operator: Literal[">", ">=", "<", "<="]
+    threshold: float
+    consecutive: int = Field(1, ge=1, le=1000)
+    severity: AlertSeverity = AlertSeverity.WARNING
+    auto_create_ticket: bool = False
+
+
+class AlertRuleOut(AlertRuleCreate):
+    id: int
 
     model_config = {"from_attributes": True}
 
@@ -162,8 +356,26 @@ class InventoryOut(BaseModel):
     machine_id: int
     raw_json: dict
     created_at: datetime
+    storage: Literal["full", "delta", "unchanged"] | None = None
 
-    model_config = {"from_attributes": True}
+
+class InstalledSoftwareOut(BaseModel):
+    name: str
+    version: str
+
+
+class InventorySearchHitOut(BaseModel):
+    machine_id: int
+    client_id: int
+    hostname: str
+    software: list[InstalledSoftwareOut]
+
+
+class InventoryChangeOut(BaseModel):
+    snapshot_id: int
+    created_at: datetime
+    storage: Literal["full", "delta"]
+    changes: list[list[Any]] | None
 
 
 class TicketCreate(BaseModel):
@@ -190,6 +402,7 @@ class TicketOut(BaseModel):
     status: TicketStatus
     priority: TicketPriority
     description: str
+    created_at: datetime
 
     model_config = {"from_attributes": True}
 
@@ -238,12 +451,72 @@ class InvoiceOut(BaseModel):
     amount: float
     description: str
     status: InvoiceStatus
+    created_at: datetime
+    contract_id: int | None = None
+    period: str | None = None
 
     model_config = {"from_attributes": True}
 
 
 class SubscriptionBillingRequest(BaseModel):
     contract_id: int
+    # Current month when omitted.
+    period: BillingPeriod | None = None
+
+
+class InvoiceLineOut(BaseModel):
+    id: int
+    invoice_id: int | None
+    ticket_id: int
+    description: str
+    hours: float
+    unit_price: float
+    amount: float
+
+    model_config = {"from_attributes": True}
+
+
+class PrebillingBucketOut(BaseModel):
+    id: int
+    client_id: int
+    contract_id: int | None
+    period: str
+    hours: float
+    amount: float
+    entry_count: int
+    updated_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class PrebillingConsolidate(BaseModel):
+    # Every closed period (before the current month) when omitted.
+    period: BillingPeriod | None = None
+
+
+class PrebillingConsolidationOut(BaseModel):
+    invoices: int
+
+
+class BillingRunCreate(BaseModel):
+    period: BillingPeriod
+
+
+class BillingRunOut(BaseModel):
+    id: int
+    period: str
+    status: BillingRunStatus
+    total_contracts: int
+    processed: int
+    invoiced: int
+    already_billed: int
+    skipped: int
+    error: str | None
+    started_at: datetime
+    updated_at: datetime
+    finished_at: datetime | None
+
+    model_config = {"from_attributes": True}
 
 
 class PlaybookCreate(BaseModel):
@@ -271,10 +544,16 @@ class PlaybookRunOut(BaseModel):
     trigger_type: TriggerType
     status: str
     output_log: str
+    created_at: datetime
 
     model_config = {"from_attributes": True}
 
 
+class PlaybookRunListItemOut(PlaybookRunOut):
+    # Deferred on listings: only present when named in ``fields``.
+    output_log: str | None = None
+
+
 class DashboardOut(BaseModel):
     clients: int
     prospects: int
@@ -0,0 +1,65 @@
+import json
+from datetime import date, datetime
+from collections.abc import Iterable
+from enum import Enum
+from typing import Any
+
+from fastapi import Response
+from pydantic import BaseModel
+from sqlalchemy import Column
+from sqlalchemy.orm import DeclarativeBase
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Type non sérialisable : {type(value).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    """JSON bytes, through orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return dumps(value).decode()
+    return value
+
+
+def model_columns(model: type[DeclarativeBase], names: Iterable[str]) -> list[Column]:
+    """Table columns backing response fields (e.g. ``TicketOut.model_fields``)."""
+    return [model.__table__.c[name] for name in names]
+
+
+def select_fields(schema: type[BaseModel], fields: str | None, deferred: Iterable[str] = ()) -> list[str]:
+    """Fields named in a ``fields=a,b`` parameter, or every schema field but the ``deferred`` ones."""
+    if fields is None:
+        return [name for name in schema.model_fields if name not in deferred]
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in schema.model_fields]
+    if unknown:
+        raise ValueError(f"Champ inconnu : {', '.join(unknown)}")
+    if not names:
+        raise ValueError("Aucun champ demandé")
+    return names
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """Already-encoded JSON response; FastAPI skips ``response_model`` validation for it."""
+    return Response(content=dumps(content), status_code=status_code, media_type="application/json")
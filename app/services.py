@@ -1,85 +1,168 @@
 from datetime import datetime, timedelta
+from typing import Any
 
 from fastapi import HTTPException
-from sqlalchemy import func
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.orm import Session
 
+from app.alert_dedup import AlertDeduplicator, AlertStormError, alert_fingerprint
+from app.alert_rules import RuleHit
+from app.database import upsert_insert
 from app.models import (
     Alert,
+    AlertSeverity,
     Client,
     Contract,
     ContractType,
+    HoursLedgerEntry,
     Invoice,
     InvoiceStatus,
     Machine,
+    MetricSample,
     Prospect,
     Ticket,
     TicketPriority,
     TicketStatus,
     TimeEntry,
 )
+from app.schemas import MetricBatchItem
 
+OPEN_TICKET_STATUSES = frozenset({TicketStatus.OPEN, TicketStatus.IN_PROGRESS, TicketStatus.ON_HOLD})
+# Listed rather than ``!= PAID`` so the count can use the status index.
+UNPAID_INVOICE_STATUSES = frozenset(status for status in InvoiceStatus if status != InvoiceStatus.PAID)
+# Execution option and ``session.info`` key: creation times of the alerts
+# ``write_alert`` inserted outside the unit of work, counted on commit.
+INSERTED_ALERTS_KEY = "inserted_alerts"
 
-def consume_hours_bank_if_needed(db: Session, ticket: Ticket, entry: TimeEntry) -> None:
+
+def open_hours_ledger(db: Session, contract: Contract) -> None:
+    """Opening ledger row of a new hours bank (``contract`` must be flushed)."""
+    if contract.type == ContractType.HOURS_BANK and contract.remaining_hours is not None:
+        balance = contract.remaining_hours
+        db.add(
+            HoursLedgerEntry(
+                contract_id=contract.id, client_id=contract.client_id, before_hours=balance, after_hours=balance
+            )
+        )
+
+
+def consume_hours_bank_if_needed(db: Session, ticket: Ticket, entry: TimeEntry) -> HoursLedgerEntry | None:
+    """Take a billable entry's hours from the ticket's hours bank, atomically, and journal the movement.
+
+    The balance is read under the contract's row lock (``FOR UPDATE``; on
+    SQLite the entry's INSERT, flushed first, already holds the write lock),
+    so concurrent entries on the same contract never overwrite each other's
+    consumption and the journaled balance before the movement is the real one.
+    The lock is held until commit, which also orders the ledger rows of a
+    contract.
+    """
     if not entry.billable or not ticket.contract_id:
-        return
+        return None
 
-    contract = db.get(Contract, ticket.contract_id)
-    if not contract:
+    db.flush()
+    contract = db.execute(
+        select(Contract.type, Contract.remaining_hours).where(Contract.id == ticket.contract_id).with_for_update()
+    ).one_or_none()
+    if contract is None:
         raise HTTPException(status_code=404, detail="Contrat introuvable")
-
     if contract.type != ContractType.HOURS_BANK:
-        return
-
+        return None
     if contract.remaining_hours is None:
         raise HTTPException(status_code=400, detail="Le contrat de banque d'heures est invalide")
 
-    contract.remaining_hours = max(0.0, contract.remaining_hours - entry.duration_hours)
-    db.add(contract)
+    hours = entry.duration_hours
+    before = contract.remaining_hours
+    after = max(before - hours, 0.0)
+    db.execute(
+        update(Contract).where(Contract.id == ticket.contract_id).values(remaining_hours=after),
+        execution_options={"synchronize_session": False},
+    )
+    movement = HoursLedgerEntry(
+        contract_id=ticket.contract_id,
+        client_id=ticket.client_id,
+        time_entry_id=entry.id,
+        requested_hours=hours,
+        applied_hours=before - after,
+        before_hours=before,
+        after_hours=after,
+    )
+    db.add(movement)
+    return movement
 
 
-def generate_invoice_from_time_entry(db: Session, ticket: Ticket, entry: TimeEntry) -> Invoice | None:
-    if not entry.billable:
-        return None
+def ledger_balance(db: Session, contract_id: int) -> float | None:
+    return db.scalar(
+        select(HoursLedgerEntry.after_hours)
+        .where(HoursLedgerEntry.contract_id == contract_id)
+        .order_by(HoursLedgerEntry.id.desc())
+        .limit(1)
+    )
 
-    if ticket.contract_id:
-        contract = db.get(Contract, ticket.contract_id)
-        if contract and contract.type == ContractType.HOURS_BANK:
-            return None
-        hourly_rate = contract.hourly_rate if contract else 0
-    else:
-        hourly_rate = 120
 
-    if hourly_rate <= 0:
-        return None
+def hours_balance(db: Session, contract_id: int) -> dict[str, float | int | None]:
+    """Balance of an hours bank derived from its ledger."""
+    consumed, movements = db.execute(
+        select(func.coalesce(func.sum(HoursLedgerEntry.applied_hours), 0.0), func.count()).where(
+            HoursLedgerEntry.contract_id == contract_id
+        )
+    ).one()
+    return {
+        "contract_id": contract_id,
+        "consumed_hours": consumed,
+        "remaining_hours": ledger_balance(db, contract_id),
+        "movements": movements,
+    }
+
+
+def billing_period(moment: datetime | None = None) -> str:
+    return (moment or datetime.utcnow()).strftime("%Y-%m")
 
-    invoice = Invoice(
-        client_id=ticket.client_id,
-        amount=round(hourly_rate * entry.duration_hours, 2),
-        description=f"Facturation automatique ticket #{ticket.id}",
-    )
-    db.add(invoice)
-    return invoice
 
+def subscription_amount(monthly_price: float | None, monthly_units: int | None) -> float:
+    return round((monthly_price or 0) * (monthly_units or 0), 2)
 
-def generate_subscription_invoice(db: Session, contract: Contract) -> Invoice:
+
+def subscription_invoice_key(contract_id: int, period: str) -> str:
+    return f"subscription:{contract_id}:{period}"
+
+
+def generate_subscription_invoice(db: Session, contract: Contract, period: str | None = None) -> Invoice:
+    """Invoice ``contract`` for ``period`` (current month by default); returns the existing invoice if already billed.
+
+    The insert skips an idempotency key already taken, as billing runs do, so
+    concurrent calls for the same contract and period all get the one invoice.
+    """
     if contract.type != ContractType.SUBSCRIPTION:
         raise HTTPException(status_code=400, detail="Le contrat doit être de type abonnement")
 
-    monthly_price = contract.monthly_price or 0
-    monthly_units = contract.monthly_units or 0
-    amount = round(monthly_price * monthly_units, 2)
+    amount = subscription_amount(contract.monthly_price, contract.monthly_units)
     if amount <= 0:
         raise HTTPException(status_code=400, detail="Le montant d'abonnement est invalide")
 
-    invoice = Invoice(
-        client_id=contract.client_id,
-        amount=amount,
-        description=f"Abonnement mensuel contrat #{contract.id}",
-        status=InvoiceStatus.DRAFT,
+    period = period or billing_period()
+    key = subscription_invoice_key(contract.id, period)
+    existing = db.scalar(select(Invoice).where(Invoice.idempotency_key == key))
+    if existing:
+        return existing
+
+    invoice_id = db.scalar(
+        upsert_insert(db, Invoice)
+        .values(
+            client_id=contract.client_id,
+            amount=amount,
+            description=f"Abonnement mensuel contrat #{contract.id} ({period})",
+            status=InvoiceStatus.DRAFT,
+            contract_id=contract.id,
+            period=period,
+            idempotency_key=key,
+        )
+        .on_conflict_do_nothing(index_elements=["idempotency_key"])
+        .returning(Invoice.id)
     )
-    db.add(invoice)
-    return invoice
+    if invoice_id is None:
+        return db.scalar(select(Invoice).where(Invoice.idempotency_key == key))
+    return db.get(Invoice, invoice_id)
 
 
 def create_ticket_from_alert(db: Session, machine: Machine, alert: Alert) -> Ticket:
@@ -90,6 +173,8 @@ def create_ticket_from_alert(db: Session, machine: Machine, alert: Alert) -> Tic
         status=TicketStatus.OPEN,
         priority=priority,
         description=f"[ALERTE] {alert.title} - {alert.details}",
+        alert_occurrences=1,
+        last_alert_at=alert.created_at or datetime.utcnow(),
     )
     db.add(ticket)
     db.flush()
@@ -98,15 +183,201 @@ def create_ticket_from_alert(db: Session, machine: Machine, alert: Alert) -> Tic
     return ticket
 
 
+def write_alert(
+    db: Session,
+    machine: Machine,
+    severity: AlertSeverity,
+    title: str,
+    fingerprint: str,
+    known_id: int | None,
+    window_seconds: float,
+    details: str = "",
+    auto_create_ticket: bool = False,
+) -> tuple[Alert, bool]:
+    """Fold a repeat into the open alert of ``fingerprint`` or insert a new one; True when inserted.
+
+    The open alert is the one the deduplicator knows (``known_id``), else the
+    ``is_open`` row last seen within ``window_seconds``, so repeats still fold
+    after a restart. Concurrent inserts are settled by the unique
+    ``(fingerprint, is_open)`` index: the losing one folds into the winner.
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=window_seconds)
+    is_open = (Alert.fingerprint == fingerprint, Alert.is_open.is_(True))
+    existing = db.get(Alert, known_id) if known_id else None
+    if existing is None or not existing.is_open:
+        existing = db.scalar(select(Alert).where(*is_open, Alert.last_seen_at >= cutoff))
+    if existing is None:
+        db.execute(update(Alert).where(*is_open, Alert.last_seen_at < cutoff).values(is_open=None))
+        alert_id = db.scalar(
+            upsert_insert(db, Alert)
+            .values(
+                machine_id=machine.id,
+                severity=severity,
+                title=title,
+                details=details,
+                fingerprint=fingerprint,
+                is_open=True,
+                last_seen_at=now,
+            )
+            .on_conflict_do_nothing(index_elements=["fingerprint", "is_open"])
+            .returning(Alert.id)
+            .execution_options(**{INSERTED_ALERTS_KEY: True})
+        )
+        if alert_id is not None:
+            alert = db.get(Alert, alert_id)
+            db.info.setdefault(INSERTED_ALERTS_KEY, []).append(alert.created_at)
+            if auto_create_ticket:
+                create_ticket_from_alert(db, machine, alert)
+            return alert, True
+        existing = db.scalar(select(Alert).where(*is_open))
+
+    existing.occurrences = Alert.occurrences + 1
+    existing.last_seen_at = now
+    existing.details = details
+    if existing.ticket_id:
+        db.execute(
+            update(Ticket)
+            .where(Ticket.id == existing.ticket_id)
+            .values(alert_occurrences=Ticket.alert_occurrences + 1, last_alert_at=now)
+        )
+    db.flush()
+    return existing, False
+
+
+def open_alert(
+    db: Session,
+    machine: Machine,
+    severity: AlertSeverity,
+    title: str,
+    dedup: AlertDeduplicator,
+    details: str = "",
+    auto_create_ticket: bool = False,
+) -> Alert:
+    fingerprint = alert_fingerprint(machine.id, title, severity.value)
+    known_id = dedup.reserve(fingerprint)
+    alert, created = write_alert(
+        db, machine, severity, title, fingerprint, known_id, dedup.window_seconds, details, auto_create_ticket
+    )
+    dedup.settle(fingerprint, alert.id, created)
+    return alert
+
+
+def reserve_rule_alerts(hits: list[RuleHit], dedup: AlertDeduplicator) -> list[tuple[RuleHit, str, int | None]]:
+    """In-memory step of ``raise_rule_alerts``: each hit with its fingerprint and ``dedup.reserve`` result."""
+    reserved = []
+    for hit in hits:
+        fingerprint = alert_fingerprint(hit.machine_id, hit.rule.name, hit.rule.severity.value)
+        try:
+            reserved.append((hit, fingerprint, dedup.reserve(fingerprint)))
+        except AlertStormError:
+            # Storm protection: the sample is still stored, only the alert row is dropped.
+            continue
+    return reserved
+
+
+def write_rule_alerts(
+    db: Session, reserved: list[tuple[RuleHit, str, int | None]], window_seconds: float
+) -> list[tuple[str, Alert, bool]]:
+    """Database step of ``raise_rule_alerts``: ``write_alert`` for each reserved hit."""
+    machines = {
+        machine.id: machine
+        for machine in db.scalars(select(Machine).where(Machine.id.in_({hit.machine_id for hit, _, _ in reserved})))
+    }
+    written = []
+    for hit, fingerprint, known_id in reserved:
+        machine = machines.get(hit.machine_id)
+        if machine is None:
+            continue
+        alert, created = write_alert(
+            db,
+            machine,
+            hit.rule.severity,
+            hit.rule.name,
+            fingerprint,
+            known_id,
+            window_seconds,
+            hit.rule.describe(hit.value),
+            hit.rule.auto_create_ticket,
+        )
+        written.append((fingerprint, alert, created))
+    return written
+
+
+def settle_alerts(dedup: AlertDeduplicator, written: list[tuple[str, Alert, bool]]) -> list[Alert]:
+    for fingerprint, alert, created in written:
+        dedup.settle(fingerprint, alert.id, created)
+    return [alert for _, alert, _ in written]
+
+
+def raise_rule_alerts(db: Session, hits: list[RuleHit], dedup: AlertDeduplicator) -> list[Alert]:
+    """Open (or fold) the alert of each rule hit; the deduplicator is only locked outside the queries."""
+    reserved = reserve_rule_alerts(hits, dedup)
+    return settle_alerts(dedup, write_rule_alerts(db, reserved, dedup.window_seconds))
+
+
 def dashboard_counts(db: Session) -> dict[str, int]:
+    """All dashboard counters in a single round trip (one scalar subquery each)."""
     last_24h = datetime.utcnow() - timedelta(hours=24)
-    return {
-        "clients": db.query(func.count()).select_from(Client).scalar(),
-        "prospects": db.query(func.count()).select_from(Prospect).scalar(),
-        "open_tickets": db.query(func.count()).select_from(Ticket).filter(
-            Ticket.status.in_([TicketStatus.OPEN, TicketStatus.IN_PROGRESS, TicketStatus.ON_HOLD])
-        ).scalar(),
-        "machines": db.query(func.count()).select_from(Machine).scalar(),
-        "alerts_24h": db.query(func.count()).select_from(Alert).filter(Alert.created_at >= last_24h).scalar(),
-        "unpaid_invoices": db.query(func.count()).select_from(Invoice).filter(Invoice.status != InvoiceStatus.PAID).scalar(),
-    }
+
+    def count(model: type, *conditions: Any) -> Any:
+        return select(func.count()).select_from(model).where(*conditions).scalar_subquery()
+
+    row = db.execute(
+        select(
+            count(Client).label("clients"),
+            count(Prospect).label("prospects"),
+            count(Ticket, Ticket.status.in_(OPEN_TICKET_STATUSES)).label("open_tickets"),
+            count(Machine).label("machines"),
+            count(Alert, Alert.created_at >= last_24h).label("alerts_24h"),
+            count(Invoice, Invoice.status.in_(UNPAID_INVOICE_STATUSES)).label("unpaid_invoices"),
+        )
+    ).one()
+    return dict(row._mapping)
+
+
+def prepare_metric_batch(
+    db: Session, samples: list[dict[str, Any]]
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    results: list[dict[str, Any]] = []
+    valid: list[tuple[int, MetricBatchItem]] = []
+    for index, raw in enumerate(samples):
+        try:
+            item = MetricBatchItem.model_validate(raw)
+        except ValidationError as exc:
+            error = exc.errors()[0]
+            location = ".".join(str(part) for part in error["loc"])
+            machine_id = raw.get("machine_id") if isinstance(raw.get("machine_id"), int) else None
+            results.append(
+                {"index": index, "machine_id": machine_id, "accepted": False, "error": f"{location}: {error['msg']}"}
+            )
+            continue
+        valid.append((index, item))
+
+    requested_ids = {item.machine_id for _, item in valid}
+    known_ids = set(db.scalars(select(Machine.id).where(Machine.id.in_(requested_ids)))) if requested_ids else set()
+
+    now = datetime.utcnow()
+    rows: list[dict[str, Any]] = []
+    for index, item in valid:
+        if item.machine_id not in known_ids:
+            results.append({"index": index, "machine_id": item.machine_id, "accepted": False, "error": "Machine introuvable"})
+            continue
+        rows.append(
+            {
+                "machine_id": item.machine_id,
+                "cpu_percent": item.cpu_percent,
+                "ram_percent": item.ram_percent,
+                "disk_percent": item.disk_percent,
+                "created_at": item.created_at or now,
+            }
+        )
+        results.append({"index": index, "machine_id": item.machine_id, "accepted": True, "error": None})
+
+    results.sort(key=lambda result: result["index"])
+    return results, rows
+
+
+def ingest_metric_batch(db: Session, rows: list[dict[str, Any]]) -> None:
+    if rows:
+        db.execute(insert(MetricSample), rows)
@@ -0,0 +1,87 @@
+"""Metric write path, shared by the sync and async routes."""
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.alert_dedup import AlertDeduplicator
+from app.alert_rules import AlertRuleEngine, RuleHit
+from app.ingest import IngestQueue, QueueFullError
+from app.metric_buffer import RecentMetricsBuffer
+from app.models import MetricSample
+from app.services import ingest_metric_batch, raise_rule_alerts
+
+
+def queue_full(exc: QueueFullError) -> HTTPException:
+    return HTTPException(status_code=503, detail=f"File d'ingestion saturée: {exc}", headers={"Retry-After": "1"})
+
+
+def accept_metric_rows(
+    db: Session, rows: list[dict], queue: IngestQueue | None, rules: AlertRuleEngine
+) -> list[RuleHit]:
+    """Write or enqueue validated rows, then run the alert rules on them; returns the hits.
+
+    Rules run once the rows are accepted: a sample refused with 503, which the
+    client sends again, must not advance the streaks.
+    """
+    rules.ensure_loaded(db)
+    if queue:
+        try:
+            queue.submit_metrics(rows)
+        except QueueFullError as exc:
+            raise queue_full(exc) from exc
+    else:
+        ingest_metric_batch(db, rows)
+    return rules.evaluate_rows(rows)
+
+
+def store_metric_rows(
+    db: Session,
+    rows: list[dict],
+    queue: IngestQueue | None,
+    buffer: RecentMetricsBuffer,
+    rules: AlertRuleEngine,
+    dedup: AlertDeduplicator,
+) -> bool:
+    """Write or enqueue validated rows and raise the alerts they trigger; returns True when queued."""
+    if hits := accept_metric_rows(db, rows, queue, rules):
+        raise_rule_alerts(db, hits, dedup)
+    db.commit()
+    buffer.extend(rows)
+    return queue is not None
+
+
+def accept_metric(
+    db: Session, row: dict, queue: IngestQueue | None, rules: AlertRuleEngine
+) -> tuple[MetricSample | None, list[RuleHit]]:
+    """``accept_metric_rows`` for one sample; the stored row is None when the sample was queued."""
+    rules.ensure_loaded(db)
+    if queue:
+        try:
+            queue.submit_metrics([row])
+        except QueueFullError as exc:
+            raise queue_full(exc) from exc
+        return None, rules.evaluate_rows([row])
+    metric = MetricSample(**row)
+    db.add(metric)
+    db.flush()
+    return metric, rules.evaluate_rows([row])
+
+
+def record_metric(
+    db: Session,
+    row: dict,
+    queue: IngestQueue | None,
+    buffer: RecentMetricsBuffer,
+    rules: AlertRuleEngine,
+    dedup: AlertDeduplicator,
+) -> MetricSample | None:
+    """Store one sample and raise the alerts it triggers; returns None when the sample was queued."""
+    metric, hits = accept_metric(db, row, queue, rules)
+    if hits:
+        raise_rule_alerts(db, hits, dedup)
+    if metric is not None or hits:
+        db.commit()
+    if metric is not None:
+        db.refresh(metric)
+    buffer.extend([row])
+    return metric
@@ -0,0 +1,138 @@
+"""Bytes on the wire and peak RSS of agent uploads: plain JSON vs gzip vs gzip NDJSON stream.
+
+Every scenario runs in its own interpreter so that peak RSS is not shared.
+
+Usage: python benchmarks/bench_agent_uploads.py [--software 20000] [--samples 50000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+SCENARIOS = ("inventory-json", "inventory-gzip", "metrics-batch-json", "metrics-stream-gzip")
+BATCH_LIMIT = 5000
+
+
+def peak_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_scenario(name: str, software: int, samples: int) -> dict:
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.database import Base, get_db
+    from app.main import app
+
+    tmp = tempfile.TemporaryDirectory()
+    engine = create_engine(f"sqlite:///{tmp.name}/bench.db", connect_args={"check_same_thread": False})
+    session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    Base.metadata.create_all(bind=engine)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+    c = client.post("/clients", json={"name": "Bench", "email": "bench@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc", "os_name": "Windows"}).json()
+    machine_id = machine["id"]
+
+    if name.startswith("inventory"):
+        inventory = {
+            "software": [
+                {
+                    "name": f"package-{i}",
+                    "version": f"{i % 40}.{i % 7}.{i}",
+                    "publisher": "Vendor",
+                    "install_dir": f"C:/Program Files/p{i}",
+                }
+                for i in range(software)
+            ]
+        }
+        body = json.dumps({"raw_json": inventory}).encode()
+        del inventory
+        requests = [(f"/machines/{machine_id}/inventory", body, {"Content-Type": "application/json"})]
+        if name == "inventory-gzip":
+            requests = [
+                (url, gzip.compress(data), {**headers, "Content-Encoding": "gzip"}) for url, data, headers in requests
+            ]
+    else:
+        rows = [
+            {"machine_id": machine_id, "cpu_percent": i % 100, "ram_percent": 50.5, "disk_percent": 70.25}
+            for i in range(samples)
+        ]
+        if name == "metrics-batch-json":
+            requests = [
+                (
+                    "/metrics/batch",
+                    json.dumps({"samples": rows[i:i + BATCH_LIMIT]}).encode(),
+                    {"Content-Type": "application/json"},
+                )
+                for i in range(0, len(rows), BATCH_LIMIT)
+            ]
+        else:
+            ndjson = "".join(json.dumps(row) + "\n" for row in rows).encode()
+            requests = [
+                (
+                    "/metrics/stream",
+                    gzip.compress(ndjson),
+                    {"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+                )
+            ]
+            del ndjson
+        del rows
+
+    baseline = peak_rss_mib()
+    started = time.perf_counter()
+    for url, data, headers in requests:
+        response = client.post(url, content=data, headers=headers)
+        response.raise_for_status()
+    elapsed = time.perf_counter() - started
+    return {
+        "wire_bytes": sum(len(data) for _, data, _ in requests),
+        "requests": len(requests),
+        "seconds": elapsed,
+        "rss_growth_mib": peak_rss_mib() - baseline,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--software", type=int, default=20_000)
+    parser.add_argument("--samples", type=int, default=50_000)
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario, args.software, args.samples)))
+        return
+
+    for name in SCENARIOS:
+        command = [sys.executable, __file__, "--scenario", name]
+        command += ["--software", str(args.software), "--samples", str(args.samples)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{name:<22}: {result['wire_bytes'] / 2**20:7.2f} MiB on the wire in {result['requests']} request(s), "
+            f"{result['seconds']:.2f} s, peak RSS +{result['rss_growth_mib']:.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
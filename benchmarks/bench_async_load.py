@@ -0,0 +1,142 @@
+"""Hot endpoints under concurrent load: threadpool routes vs the async router (CRM_RMM_ASYNC_DB_ENABLED).
+
+Each virtual agent loops over heartbeat, metric push and ticket list for the
+given duration; the report gives requests/sec and p50/p99 latency per
+concurrency level. ``--query-delay`` adds a sleep to every SELECT, in the
+thread that runs it (SQLite trace callback), to mimic a slow database.
+
+Usage: python benchmarks/bench_async_load.py [--concurrency 10 50 200] [--seconds 5] [--query-delay 2]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.async_database import get_async_db  # noqa: E402
+from app.async_routes import router as async_router  # noqa: E402
+from app.database import get_db  # noqa: E402
+from app.http_cache import VersionedRoute, response_cache  # noqa: E402
+from app.main import app  # noqa: E402
+from app.migrations import migrate  # noqa: E402
+
+
+def slow_statements(engine, delay: float) -> None:
+    """Every SELECT pays ``delay`` seconds in the thread running it, as on a remote or loaded database."""
+
+    def pause(statement: str) -> None:
+        if statement.lstrip().upper().startswith("SELECT"):
+            time.sleep(delay)
+
+    @event.listens_for(engine, "connect")
+    def register(dbapi_connection, connection_record):
+        connection = getattr(dbapi_connection, "driver_connection", dbapi_connection)
+        connection = getattr(connection, "_conn", connection)  # aiosqlite wraps the sqlite3 connection
+        if delay:
+            connection.set_trace_callback(pause)
+
+
+def build_apps(db_path: Path, delay: float) -> dict[str, FastAPI]:
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False, "timeout": 30})
+    migrate(engine)
+    slow_statements(engine, delay)
+    session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", connect_args={"timeout": 30})
+    slow_statements(async_engine.sync_engine, delay)
+    async_factory = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with async_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    async_app = FastAPI()
+    async_app.router.route_class = VersionedRoute
+    async_app.include_router(async_router)
+    async_app.include_router(app.router)
+    async_app.dependency_overrides = app.dependency_overrides
+    return {"threadpool": app, "async": async_app}
+
+
+async def seed(client: httpx.AsyncClient) -> int:
+    c = (await client.post("/clients", json={"name": "Load", "email": "load@example.com"})).json()
+    machine = (await client.post("/machines", json={"client_id": c["id"], "hostname": "pc-load", "os_name": "Debian"})).json()
+    for i in range(50):
+        await client.post("/tickets", json={"client_id": c["id"], "machine_id": machine["id"], "description": f"Ticket {i}"})
+    return machine["id"]
+
+
+async def agent(client: httpx.AsyncClient, machine_id: int, deadline: float, latencies: list[float]) -> None:
+    calls = (
+        ("POST", f"/machines/{machine_id}/heartbeat", {"agent_version": "2.0"}),
+        ("POST", f"/machines/{machine_id}/metrics", {"cpu_percent": 10, "ram_percent": 20, "disk_percent": 30}),
+        ("GET", "/tickets?limit=20", None),
+    )
+    step = 0
+    while time.perf_counter() < deadline:
+        method, url, body = calls[step % len(calls)]
+        started = time.perf_counter()
+        response = await client.request(method, url, json=body)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+        step += 1
+
+
+async def run(asgi_app: FastAPI, machine_id: int, concurrency: int, seconds: float) -> tuple[float, float, float]:
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        latencies: list[float] = []
+        started = time.perf_counter()
+        deadline = started + seconds
+        await asyncio.gather(*(agent(client, machine_id, deadline, latencies) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    quantiles = statistics.quantiles(latencies, n=100)
+    return len(latencies) / elapsed, quantiles[49] * 1000, quantiles[98] * 1000
+
+
+async def bench(apps: dict[str, FastAPI], levels: list[int], seconds: float) -> None:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        machine_id = await seed(client)
+    for concurrency in levels:
+        for label, asgi_app in apps.items():
+            rate, p50, p99 = await run(asgi_app, machine_id, concurrency, seconds)
+            print(f"{concurrency:>4} agents {label:<10} {rate:>8,.0f} req/s   p50 {p50:>8.1f} ms   p99 {p99:>8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--query-delay", type=float, default=2, help="milliseconds added to every SELECT")
+    args = parser.parse_args()
+
+    response_cache.max_entries = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        apps = build_apps(Path(tmp) / "load.db", args.query_delay / 1000)
+        asyncio.run(bench(apps, args.concurrency, args.seconds))
+    app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    main()
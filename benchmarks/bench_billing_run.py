@@ -0,0 +1,107 @@
+"""Month-end subscription billing: one POST /billing/subscription per contract vs one POST /billing/runs.
+
+The per-contract run is timed on a sample (--single) and extrapolated to the
+full volume; the billing run invoices every contract, then is started again
+to time the idempotent no-op pass.
+
+Usage: python benchmarks/bench_billing_run.py [--contracts 10000] [--single 500]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.orm import Session, sessionmaker  # noqa: E402
+
+from app.database import create_database_engine, get_db  # noqa: E402
+from app.http_cache import response_cache  # noqa: E402
+from app.main import app  # noqa: E402
+from app.migrations import migrate  # noqa: E402
+from app.models import Client, Contract, ContractType  # noqa: E402
+from app.services import billing_period  # noqa: E402
+
+
+def build_client(db_path: Path, contracts: int) -> TestClient:
+    engine = create_database_engine(f"sqlite:///{db_path}")
+    migrate(engine)
+    signed = datetime.utcnow() - timedelta(days=40)
+    with Session(engine) as db:
+        db.execute(
+            insert(Client), [{"name": f"Client {i}", "email": f"client{i}@example.com"} for i in range(contracts // 10)]
+        )
+        db.execute(
+            insert(Contract),
+            [
+                {
+                    "client_id": i % (contracts // 10) + 1,
+                    "type": ContractType.SUBSCRIPTION,
+                    "monthly_price": 12.5,
+                    "monthly_units": 1 + i % 40,
+                    "created_at": signed,
+                }
+                for i in range(contracts)
+            ],
+        )
+        db.commit()
+    session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def bench_single(client: TestClient, sample: int, period: str) -> float:
+    started = time.perf_counter()
+    for contract_id in range(1, sample + 1):
+        response = client.post("/billing/subscription", json={"contract_id": contract_id, "period": period})
+        assert response.status_code == 200, response.text
+    return sample / (time.perf_counter() - started)
+
+
+def bench_run(client: TestClient, period: str) -> tuple[float, dict]:
+    # TestClient returns once the background task is done.
+    started = time.perf_counter()
+    run = client.post("/billing/runs", json={"period": period}).json()
+    elapsed = time.perf_counter() - started
+    run = client.get(f"/billing/runs/{run['id']}").json()
+    assert run["status"] == "completed", run
+    return elapsed, run
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--contracts", type=int, default=10_000)
+    parser.add_argument("--single", type=int, default=500, help="contracts billed one POST at a time")
+    args = parser.parse_args()
+
+    period = billing_period()
+    response_cache.max_entries = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        rate = bench_single(build_client(Path(tmp) / "single.db", args.contracts), args.single, period)
+        client = build_client(Path(tmp) / "run.db", args.contracts)
+        elapsed, run = bench_run(client, period)
+        replay, again = bench_run(client, period)
+    app.dependency_overrides.clear()
+
+    print(f"per-contract POST  {rate:>9,.0f} contracts/s -> {args.contracts / rate:>7.1f} s for {args.contracts:,}")
+    print(f"billing run        {run['invoiced'] / elapsed:>9,.0f} contracts/s -> {elapsed:>7.1f} s ({run['invoiced']:,} invoiced)")
+    print(f"billing run again  {args.contracts / replay:>9,.0f} contracts/s -> {replay:>7.1f} s ({again['already_billed']:,} already billed)")
+
+
+if __name__ == "__main__":
+    main()
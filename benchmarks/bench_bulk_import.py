@@ -0,0 +1,136 @@
+"""Onboarding throughput: one POST per client/contact/machine vs POST /import/{entity} uploads.
+
+The single-row run is timed on a sample (--single) and reported as records/sec;
+the import run loads the full volumes.
+
+Usage: python benchmarks/bench_bulk_import.py [--clients 200] [--contacts 20000] [--machines 5000] [--single 1000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import get_db  # noqa: E402
+from app.http_cache import response_cache  # noqa: E402
+from app.main import app  # noqa: E402
+from app.migrations import migrate  # noqa: E402
+
+
+def build_client(db_path: Path) -> TestClient:
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    migrate(engine)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def records(clients: int, contacts: int, machines: int) -> dict[str, list[dict]]:
+    return {
+        "clients": [{"name": f"Client {i}", "email": f"client{i}@example.com", "phone": "0102030405"} for i in range(clients)],
+        "contacts": [
+            {"client_email": f"client{i % clients}@example.com", "name": f"Contact {i}", "email": f"u{i}@example.com"}
+            for i in range(contacts)
+        ],
+        "machines": [
+            {
+                "client_email": f"client{i % clients}@example.com",
+                "hostname": f"pc-{i:05d}",
+                "os_name": "Windows 11",
+                "ram_total_gb": 16,
+            }
+            for i in range(machines)
+        ],
+    }
+
+
+def bench_single(client: TestClient, data: dict[str, list[dict]], sample: int) -> dict[str, float]:
+    """What onboarding scripts do today: resolve the client id, then one POST per record."""
+    client_ids: dict[str, int] = {}
+    rates = {}
+    for entity, rows in data.items():
+        rows = rows[:sample]
+        started = time.perf_counter()
+        for row in rows:
+            row = dict(row)
+            if entity != "clients":
+                row["client_id"] = client_ids[row.pop("client_email")]
+            url = "/contacts" if entity == "contacts" else f"/{entity}"
+            response = client.post(url, json=row)
+            assert response.status_code == 200, response.text
+            if entity == "clients":
+                client_ids[row["email"]] = response.json()["id"]
+        rates[entity] = len(rows) / (time.perf_counter() - started)
+    return rates
+
+
+def to_csv(rows: list[dict]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def bench_import(client: TestClient, data: dict[str, list[dict]], fmt: str) -> dict[str, float]:
+    rates = {}
+    for entity, rows in data.items():
+        if fmt == "csv":
+            body, content_type = to_csv(rows), "text/csv"
+        else:
+            body, content_type = "\n".join(json.dumps(row) for row in rows).encode(), "application/x-ndjson"
+        started = time.perf_counter()
+        response = client.post(f"/import/{entity}", content=body, headers={"Content-Type": content_type})
+        elapsed = time.perf_counter() - started
+        result = response.json()
+        assert result["inserted"] == len(rows) and result["rejected"] == 0, result
+        rates[entity] = len(rows) / elapsed
+    return rates
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--contacts", type=int, default=20_000)
+    parser.add_argument("--machines", type=int, default=5_000)
+    parser.add_argument("--single", type=int, default=1_000, help="records per entity for the single-row run")
+    args = parser.parse_args()
+
+    data = records(args.clients, args.contacts, args.machines)
+    response_cache.max_entries = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        single = bench_single(build_client(Path(tmp) / "single.db"), data, args.single)
+        csv_rates = bench_import(build_client(Path(tmp) / "csv.db"), data, "csv")
+        ndjson_rates = bench_import(build_client(Path(tmp) / "ndjson.db"), data, "ndjson")
+
+    app.dependency_overrides.clear()
+    for entity, rows in data.items():
+        print(
+            f"{entity:<9} {len(rows):>7,} rows: single POST {single[entity]:>8,.0f}/s, "
+            f"import csv {csv_rates[entity]:>9,.0f}/s (x{csv_rates[entity] / single[entity]:.0f}), "
+            f"import ndjson {ndjson_rates[entity]:>9,.0f}/s (x{ndjson_rates[entity] / single[entity]:.0f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Write throughput and read latency under concurrent writers, per engine configuration.
+
+Writer threads insert metric samples, one commit each, as agents do; reader
+threads meanwhile page through a machine's latest samples. Configurations:
+SQLite with the rollback journal and ``synchronous=FULL`` (the former
+defaults), SQLite in WAL with ``synchronous=NORMAL`` (the new defaults) and,
+with ``--postgres-url``, PostgreSQL with the configured pool.
+
+Usage: python benchmarks/bench_db_engine.py [--writers 8] [--readers 4] [--seconds 5] [--postgres-url postgresql+psycopg://...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.config import Settings  # noqa: E402
+from app.database import create_database_engine  # noqa: E402
+from app.migrations import migrate  # noqa: E402
+from app.models import Client, Machine, MetricSample  # noqa: E402
+
+MACHINES = 100
+
+
+def seed(engine) -> None:
+    migrate(engine)
+    with Session(engine) as db:
+        db.execute(MetricSample.__table__.delete())
+        db.execute(Machine.__table__.delete())
+        db.execute(Client.__table__.delete())
+        client = Client(name="Bench", email="bench@example.com")
+        db.add(client)
+        db.flush()
+        db.execute(
+            insert(Machine),
+            [{"id": i, "client_id": client.id, "hostname": f"pc-{i:03d}", "os_name": "Debian"} for i in range(1, MACHINES + 1)],
+        )
+        db.commit()
+
+
+def writer(engine, stop: threading.Event, counts: list[int], errors: list[int], slot: int) -> None:
+    machine_id = 0
+    with Session(engine) as db:
+        while not stop.is_set():
+            machine_id = machine_id % MACHINES + 1
+            row = {"machine_id": machine_id, "cpu_percent": 10, "ram_percent": 20, "disk_percent": 30, "created_at": datetime.utcnow()}
+            try:
+                db.execute(insert(MetricSample), [row])
+                db.commit()
+                counts[slot] += 1
+            except OperationalError:
+                db.rollback()
+                errors[slot] += 1
+
+
+def reader(engine, stop: threading.Event, latencies: list[float]) -> None:
+    machine_id = 0
+    query = select(MetricSample.id, MetricSample.cpu_percent, MetricSample.created_at)
+    with Session(engine) as db:
+        while not stop.is_set():
+            machine_id = machine_id % MACHINES + 1
+            started = time.perf_counter()
+            db.execute(
+                query.where(MetricSample.machine_id == machine_id).order_by(MetricSample.created_at.desc()).limit(50)
+            ).all()
+            db.rollback()
+            latencies.append(time.perf_counter() - started)
+
+
+def bench(engine, writers: int, readers: int, seconds: float) -> dict[str, float]:
+    seed(engine)
+    stop = threading.Event()
+    counts, errors = [0] * writers, [0] * writers
+    latencies: list[float] = []
+    threads = [threading.Thread(target=writer, args=(engine, stop, counts, errors, i)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(engine, stop, latencies)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    return {
+        "writes": sum(counts) / seconds,
+        "errors": sum(errors),
+        "reads": len(latencies) / seconds,
+        "p50": quantiles[49] * 1000,
+        "p99": quantiles[98] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--postgres-url", help="also run against this PostgreSQL database (tables are created, samples wiped)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configurations = [
+            ("sqlite journal=delete sync=full", f"sqlite:///{tmp}/delete.db", Settings(sqlite_journal_mode="delete", sqlite_synchronous="full")),
+            ("sqlite journal=wal sync=normal", f"sqlite:///{tmp}/wal.db", Settings()),
+        ]
+        if args.postgres_url:
+            configurations.append(("postgresql pooled", args.postgres_url, Settings(db_pool_size=args.writers + args.readers)))
+        for label, url, config in configurations:
+            result = bench(create_database_engine(url, config), args.writers, args.readers, args.seconds)
+            print(
+                f"{label:<32} {result['writes']:>8,.0f} writes/s ({result['errors']:,} locked)   "
+                f"{result['reads']:>8,.0f} reads/s   read p50 {result['p50']:>7.2f} ms   p99 {result['p99']:>7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
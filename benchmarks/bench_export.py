@@ -0,0 +1,113 @@
+"""Rows/sec and peak RSS of GET /export/metrics versus loading ORM objects and Pydantic models.
+
+The database is built once; every mode then runs in its own interpreter so
+that peak RSS is not shared.
+
+Usage: python benchmarks/bench_export.py [--rows 1000000] [--baseline-rows 200000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.exports import iter_export  # noqa: E402
+from app.models import Client, Machine, MetricSample  # noqa: E402
+from app.schemas import MetricOut  # noqa: E402
+
+MODES = ("orm-pydantic", "export-ndjson", "export-csv")
+
+
+def peak_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build_database(path: Path, rows: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(Client(name="Bench", email="bench@example.com"))
+        db.flush()
+        db.execute(insert(Machine), [{"client_id": 1, "hostname": f"pc-{i}", "os_name": "Linux"} for i in range(100)])
+        start = datetime.utcnow() - timedelta(days=1)
+        for offset in range(0, rows, 100_000):
+            db.execute(
+                insert(MetricSample),
+                [
+                    {
+                        "machine_id": i % 100 + 1,
+                        "cpu_percent": random.uniform(0, 100),
+                        "ram_percent": random.uniform(0, 100),
+                        "disk_percent": random.uniform(0, 100),
+                        "created_at": start + timedelta(seconds=i),
+                    }
+                    for i in range(offset, min(offset + 100_000, rows))
+                ],
+            )
+        db.commit()
+
+
+def run_mode(path: Path, mode: str, baseline_rows: int) -> dict:
+    db = sessionmaker(bind=create_engine(f"sqlite:///{path}"))()
+    baseline = peak_rss_mib()
+    started = time.perf_counter()
+    written = rows = 0
+    if mode == "orm-pydantic":
+        # What a list endpoint does: every ORM object, then every response model, then one JSON document.
+        samples = db.scalars(select(MetricSample).order_by(MetricSample.id).limit(baseline_rows)).all()
+        body = json.dumps([MetricOut.model_validate(sample).model_dump(mode="json") for sample in samples]).encode()
+        written, rows = len(body), len(samples)
+    else:
+        fmt = mode.removeprefix("export-")
+        for chunk in iter_export(db, "metrics", fmt):
+            written += len(chunk)
+            rows += chunk.count(b"\n")
+        rows -= fmt == "csv"
+    elapsed = time.perf_counter() - started
+    return {"rows": rows, "bytes": written, "seconds": elapsed, "rss_growth_mib": peak_rss_mib() - baseline}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--baseline-rows", type=int, default=200_000)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--db", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.db, args.mode, args.baseline_rows)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        started = time.perf_counter()
+        build_database(path, args.rows)
+        print(f"metric_samples  : {args.rows:,} rows ({time.perf_counter() - started:.1f} s to build)")
+        for mode in MODES:
+            command = [sys.executable, __file__, "--mode", mode, "--db", str(path)]
+            command += ["--baseline-rows", str(args.baseline_rows)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{mode:<16}: {result['rows']:>9,} rows, {result['rows'] / result['seconds']:>9,.0f} rows/s, "
+                f"{result['bytes'] / 2**20:7.1f} MiB, peak RSS +{result['rss_growth_mib']:.1f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
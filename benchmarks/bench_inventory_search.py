@@ -0,0 +1,91 @@
+"""Latency of GET /inventory/search style queries over a large indexed fleet.
+
+Usage: python benchmarks/bench_inventory_search.py [--machines 50000] [--software 60]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.inventory_index import index_rows, parse_condition, search_inventory  # noqa: E402
+from app.models import Client, InstalledSoftware, InventoryFact, InventorySnapshot, Machine  # noqa: E402
+
+CATALOG = [f"app-{index}" for index in range(500)] + ["chrome", "firefox", "7-zip", "teamviewer"]
+
+
+def inventory(rng: random.Random, software: int) -> dict:
+    names = rng.sample(CATALOG, software)
+    return {
+        "cpu": rng.choice(["i3", "i5", "i7", "ryzen 5"]),
+        "ram_gb": rng.choice([4, 8, 16, 32]),
+        "os": {"name": "Windows 11", "build": rng.choice(["22621", "22631", "26100"])},
+        "disks": [{"size_gb": rng.choice([256, 512, 1024]), "smart_errors": rng.choice([0] * 30 + [1, 4])}],
+        "software": [
+            {"name": name, "version": f"{rng.randint(1, 130)}.{rng.randint(0, 9)}.{rng.randint(0, 999)}"} for name in names
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, default=50_000)
+    parser.add_argument("--software", type=int, default=60)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+        started = time.perf_counter()
+        with session_factory() as db:
+            db.add(Client(name="Bench", email="bench@example.com"))
+            db.flush()
+            db.execute(
+                insert(Machine),
+                [{"client_id": 1, "hostname": f"pc-{i}", "os_name": "Windows 11"} for i in range(args.machines)],
+            )
+            db.execute(insert(InventorySnapshot), [{"machine_id": i, "raw_json": {}} for i in range(1, args.machines + 1)])
+            facts, software = [], []
+            for machine_id in range(1, args.machines + 1):
+                machine_facts, machine_software = index_rows(machine_id, machine_id, inventory(rng, args.software))
+                facts += machine_facts
+                software += machine_software
+            db.execute(insert(InventoryFact), facts)
+            db.execute(insert(InstalledSoftware), software)
+            db.commit()
+        print(f"machines        : {args.machines}")
+        print(f"index rows      : {len(facts):,} facts, {len(software):,} software")
+        print(f"index build     : {time.perf_counter() - started:.1f} s")
+
+        queries = {
+            "chrome < 100": {"software": "chrome", "version": "<100"},
+            "ram < 8 + smart errors": {"conditions": ["ram_gb<8", "disks.*.smart_errors>0"]},
+            "build 22621 + 7-zip": {"conditions": ["os.build=22621"], "software": "7-zip"},
+            "prefix team*": {"software": "team*"},
+        }
+        with session_factory() as db:
+            for label, query in queries.items():
+                conditions = [parse_condition(expression) for expression in query.get("conditions", [])]
+                timings = []
+                for _ in range(5):
+                    started = time.perf_counter()
+                    hits = search_inventory(db, conditions, query.get("software"), query.get("version"), limit=1000)
+                    timings.append(time.perf_counter() - started)
+                print(f"{label:<24}: {min(timings) * 1000:7.1f} ms ({len(hits)} hits, limit 1000)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Walk every page of /tickets and /invoices: ORM + Pydantic validation vs column select + direct JSON encoding.
+
+Usage: python benchmarks/bench_list_serialization.py [--rows 10000 100000] [--page-size 500]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import Base, get_db  # noqa: E402
+from app.http_cache import response_cache  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Client, Invoice, InvoiceStatus, Ticket, TicketPriority, TicketStatus  # noqa: E402
+from app.pagination import paginate, paginate_columns  # noqa: E402
+from app.schemas import InvoiceOut, Page, TicketOut  # noqa: E402
+from app.serialization import dumps, model_columns  # noqa: E402
+
+ENTITIES = {"tickets": (Ticket, TicketOut), "invoices": (Invoice, InvoiceOut)}
+
+
+def build_database(path: Path, rows: int) -> sessionmaker:
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    start = datetime.utcnow() - timedelta(days=365)
+    with session_factory() as db:
+        db.execute(insert(Client), [{"name": f"Client {i}", "email": f"c{i}@example.com"} for i in range(100)])
+        db.execute(
+            insert(Ticket),
+            [
+                {
+                    "client_id": i % 100 + 1,
+                    "status": random.choice(list(TicketStatus)),
+                    "priority": random.choice(list(TicketPriority)),
+                    "description": f"Incident {i} sur le poste de travail",
+                    "created_at": start + timedelta(minutes=i),
+                }
+                for i in range(rows)
+            ],
+        )
+        db.execute(
+            insert(Invoice),
+            [
+                {
+                    "client_id": i % 100 + 1,
+                    "status": random.choice(list(InvoiceStatus)),
+                    "amount": round(random.uniform(50, 5000), 2),
+                    "description": f"Facture {i}",
+                    "created_at": start + timedelta(minutes=i),
+                }
+                for i in range(rows)
+            ],
+        )
+        db.commit()
+    return session_factory
+
+
+def walk_orm(session_factory: sessionmaker, model, schema, page_size: int) -> int:
+    """What the endpoints did before: ORM instances, then response_model validation and encoding."""
+    total, cursor = 0, None
+    with session_factory() as db:
+        while True:
+            items, cursor = paginate(db, select(model), (model.created_at, model.id), page_size, cursor)
+            Page[schema].model_validate({"items": items, "next_cursor": cursor}, from_attributes=True).model_dump_json()
+            total += len(items)
+            if cursor is None:
+                return total
+
+
+def walk_columns(session_factory: sessionmaker, model, schema, page_size: int) -> int:
+    total, cursor = 0, None
+    query = select(*model_columns(model, schema.model_fields))
+    with session_factory() as db:
+        while True:
+            items, cursor = paginate_columns(db, query, (model.created_at, model.id), page_size, cursor)
+            dumps({"items": items, "next_cursor": cursor})
+            total += len(items)
+            if cursor is None:
+                return total
+
+
+def walk_http(client: TestClient, entity: str, page_size: int) -> int:
+    total, cursor = 0, None
+    while True:
+        params = {"limit": page_size, **({"cursor": cursor} if cursor else {})}
+        page = client.get(f"/{entity}", params=params).json()
+        total += len(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    response_cache.max_entries = 0
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            session_factory = build_database(Path(tmp) / "bench.db", rows)
+
+            def override_get_db():
+                db = session_factory()
+                try:
+                    yield db
+                finally:
+                    db.close()
+
+            app.dependency_overrides[get_db] = override_get_db
+            client = TestClient(app)
+            for entity, (model, schema) in ENTITIES.items():
+                timings = {}
+                for label, walk in (
+                    ("orm+pydantic", lambda: walk_orm(session_factory, model, schema, args.page_size)),
+                    ("columns+json", lambda: walk_columns(session_factory, model, schema, args.page_size)),
+                    ("http endpoint", lambda: walk_http(client, entity, args.page_size)),
+                ):
+                    started = time.perf_counter()
+                    assert walk() == rows
+                    timings[label] = time.perf_counter() - started
+                speedup = timings["orm+pydantic"] / timings["columns+json"]
+                summary = ", ".join(f"{label} {rows / seconds:>9,.0f} rows/s" for label, seconds in timings.items())
+                print(f"{entity:<9} {rows:>7,} rows: {summary} (x{speedup:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Memory and throughput of the recent-metrics ring buffer for a large fleet.
+
+Usage: python benchmarks/bench_metric_buffer.py [--machines 50000] [--window 60] [--rounds 60]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.metric_buffer import RecentMetricsBuffer  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, default=50_000)
+    parser.add_argument("--window", type=int, default=60)
+    parser.add_argument("--rounds", type=int, default=60)
+    args = parser.parse_args()
+
+    buffer = RecentMetricsBuffer(window=args.window)
+    start = datetime.utcnow() - timedelta(minutes=args.rounds)
+    total = 0
+    elapsed = 0.0
+    for minute in range(args.rounds):
+        created_at = start + timedelta(minutes=minute)
+        rows = [
+            {
+                "machine_id": machine_id,
+                "created_at": created_at,
+                "cpu_percent": random.uniform(0, 100),
+                "ram_percent": random.uniform(0, 100),
+                "disk_percent": random.uniform(0, 100),
+            }
+            for machine_id in range(1, args.machines + 1)
+        ]
+        started = time.perf_counter()
+        buffer.extend(rows)
+        elapsed += time.perf_counter() - started
+        total += len(rows)
+
+    stats_times = []
+    for _ in range(5):
+        started = time.perf_counter()
+        buffer.window_stats(samples=args.window, percentile=95)
+        stats_times.append(time.perf_counter() - started)
+
+    print(f"machines        : {len(buffer)}")
+    print(f"buffer memory   : {buffer.nbytes / 2**20:.1f} MiB ({buffer.nbytes / len(buffer):.0f} B/machine)")
+    print(f"ingest          : {total / elapsed:,.0f} samples/s")
+    print(f"fleet stats     : {min(stats_times) * 1000:.1f} ms (mean/max/p95/slope x3 metrics, {args.window} samples)")
+
+
+if __name__ == "__main__":
+    main()
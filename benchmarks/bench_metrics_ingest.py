@@ -0,0 +1,97 @@
+"""Compare samples/sec between POST /machines/{id}/metrics and POST /metrics/batch.
+
+Usage: python benchmarks/bench_metrics_ingest.py [--machines 50] [--samples 2000] [--batch-size 500]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import Base, get_db  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+def build_client(db_path: Path) -> TestClient:
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    Base.metadata.create_all(bind=engine)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def random_sample() -> dict[str, float]:
+    return {
+        "cpu_percent": round(random.uniform(0, 100), 2),
+        "ram_percent": round(random.uniform(0, 100), 2),
+        "disk_percent": round(random.uniform(0, 100), 2),
+    }
+
+
+def setup_machines(client: TestClient, count: int) -> list[int]:
+    c = client.post("/clients", json={"name": "Bench", "email": "bench@example.com"}).json()
+    return [
+        client.post("/machines", json={"client_id": c["id"], "hostname": f"pc-{i}", "os_name": "Windows 11"}).json()["id"]
+        for i in range(count)
+    ]
+
+
+def bench_single(client: TestClient, machine_ids: list[int], samples: int) -> float:
+    started = time.perf_counter()
+    for i in range(samples):
+        r = client.post(f"/machines/{machine_ids[i % len(machine_ids)]}/metrics", json=random_sample())
+        assert r.status_code == 200
+    return samples / (time.perf_counter() - started)
+
+
+def bench_batch(client: TestClient, machine_ids: list[int], samples: int, batch_size: int) -> float:
+    started = time.perf_counter()
+    for offset in range(0, samples, batch_size):
+        batch = [
+            {"machine_id": machine_ids[i % len(machine_ids)], **random_sample()}
+            for i in range(offset, min(offset + batch_size, samples))
+        ]
+        r = client.post("/metrics/batch", json={"samples": batch})
+        assert r.status_code == 200 and r.json()["rejected"] == 0
+    return samples / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = build_client(Path(tmp) / "single.db")
+        single_rate = bench_single(client, setup_machines(client, args.machines), args.samples)
+
+        client = build_client(Path(tmp) / "batch.db")
+        batch_rate = bench_batch(client, setup_machines(client, args.machines), args.samples, args.batch_size)
+
+    app.dependency_overrides.clear()
+    print(f"single sample : {single_rate:10.0f} samples/s")
+    print(f"batch ({args.batch_size:>4})  : {batch_rate:10.0f} samples/s  (x{batch_rate / single_rate:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Pre-billing ledger: rows written per time entry and month-end consolidation cost.
+
+Billable time entries are spread over --clients clients (one time & material
+contract and a few tickets each). The former behaviour wrote one invoice per
+entry; the ledger writes none until consolidation, which produces one
+invoice per client. Consolidation is timed for growing entry volumes at a
+fixed client count: it should stay flat.
+
+Usage: python benchmarks/bench_prebilling.py [--clients 1000] [--entries 5000 20000] [--tickets 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import func, insert, select  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database import create_database_engine  # noqa: E402
+from app.migrations import migrate  # noqa: E402
+from app.models import Client, Contract, ContractType, Invoice, InvoiceLine, Technician, Ticket, TimeEntry  # noqa: E402
+from app.prebilling import accumulate_time_entry, consolidate_prebilling  # noqa: E402
+from app.services import billing_period  # noqa: E402
+
+
+def seed(db: Session, clients: int, tickets: int) -> list[Ticket]:
+    db.execute(insert(Client), [{"name": f"Client {i}", "email": f"client{i}@example.com"} for i in range(clients)])
+    db.execute(
+        insert(Contract),
+        [{"client_id": i + 1, "type": ContractType.TIME_MATERIAL, "hourly_rate": 90} for i in range(clients)],
+    )
+    db.add(Technician(name="Tech", email="tech@example.com"))
+    db.execute(
+        insert(Ticket),
+        [
+            {"client_id": i + 1, "contract_id": i + 1, "technician_id": 1, "description": "Support"}
+            for i in range(clients)
+            for _ in range(tickets)
+        ],
+    )
+    db.commit()
+    return list(db.scalars(select(Ticket).order_by(Ticket.id)))
+
+
+def bench(db_path: Path, clients: int, entries: int, tickets: int) -> dict[str, float]:
+    engine = create_database_engine(f"sqlite:///{db_path}")
+    migrate(engine)
+    with Session(engine, autoflush=False, expire_on_commit=False) as db:
+        all_tickets = seed(db, clients, tickets)
+        started = time.perf_counter()
+        for i in range(entries):
+            ticket = all_tickets[i % len(all_tickets)]
+            entry = TimeEntry(ticket_id=ticket.id, technician_id=1, duration_hours=0.25, billable=True)
+            db.add(entry)
+            accumulate_time_entry(db, ticket, entry)
+            db.commit()
+        accumulate = time.perf_counter() - started
+        invoices_before = db.scalar(select(func.count()).select_from(Invoice))
+
+        started = time.perf_counter()
+        invoiced = consolidate_prebilling(db, billing_period())
+        consolidate = time.perf_counter() - started
+        lines = db.scalar(select(func.count()).select_from(InvoiceLine))
+    engine.dispose()
+    return {
+        "entries/s": entries / accumulate,
+        "invoices_before": invoices_before,
+        "invoices": invoiced,
+        "lines": lines,
+        "consolidate_s": consolidate,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1_000)
+    parser.add_argument("--entries", type=int, nargs="+", default=[5_000, 20_000])
+    parser.add_argument("--tickets", type=int, default=5, help="tickets per client")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for entries in args.entries:
+            result = bench(Path(tmp) / f"prebilling-{entries}.db", args.clients, entries, args.tickets)
+            print(
+                f"{entries:>8,} entries / {args.clients:,} clients: {result['entries/s']:>7,.0f} entries/s, "
+                f"invoice rows {entries:,} -> {result['invoices_before']} before consolidation, "
+                f"{result['invoices']:,} invoices + {result['lines']:,} lines in {result['consolidate_s']:.2f} s"
+            )
+
+
+if __name__ == "__main__":
+    main()
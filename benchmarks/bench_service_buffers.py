@@ -0,0 +1,99 @@
+"""CRMRMMService event buffers under sustained load: plain lists vs bounded, spilling buffers.
+
+Each event consumes hours on a bank contract below its alert threshold
+(one ``HoursEvent`` and one notification) and queues a ticket id for
+pre-billing; a consumer drains the queue every --drain-every events. The
+Python heap still held by the three structures (tracemalloc) is reported
+after each volume: lists grow with the event count, the buffers stay flat.
+
+Usage: python benchmarks/bench_service_buffers.py [--events 100000 1000000] [--capacity 10000] [--drain-every 0]
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.crm_rmm.models import ContractType, HoursEvent  # noqa: E402
+from src.crm_rmm.service import CRMRMMService  # noqa: E402
+
+
+def load(service: CRMRMMService, events: int, drain_every: int) -> None:
+    client = service.create_client("ACME")
+    contract = service.create_contract(client.id, ContractType.BANQUE_HEURES, 90.0, 1e9, 1e9, 2e9)
+    for i in range(events):
+        service._consume_contract_hours(contract, 0.25)
+        service.prebilling_queue.append(f"tic_{i:010d}")
+        if drain_every and (i + 1) % drain_every == 0:
+            service.prebilling_queue.drain()
+
+
+def as_lists(service: CRMRMMService) -> CRMRMMService:
+    """The former storage: three plain lists, ``HoursEvent`` objects in the history."""
+
+    class ListQueue(list):
+        def drain(self) -> list:
+            items = self[:]
+            self.clear()
+            return items
+
+    class ListHistory(list):
+        def record(self, **fields: object) -> None:
+            self.append(HoursEvent(**fields))
+
+    service.hours_history = ListHistory()
+    service.notifications = []
+    service.prebilling_queue = ListQueue()
+    return service
+
+
+def bench(make: Callable[[], CRMRMMService], events: int, drain_every: int) -> tuple[float, float, CRMRMMService]:
+    """Events/s of an untraced run, then MiB held after a second run under tracemalloc."""
+    started = time.perf_counter()
+    load(make(), events, drain_every)
+    rate = events / (time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    service = make()
+    load(service, events, drain_every)
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rate, held / 2**20, service
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--capacity", type=int, default=10_000, help="items kept in memory per buffer")
+    parser.add_argument("--drain-every", type=int, default=0, help="drain the pre-billing queue every N events (0: never)")
+    args = parser.parse_args()
+
+    for events in args.events:
+        with tempfile.TemporaryDirectory() as tmp:
+            rate, held, _ = bench(lambda: as_lists(CRMRMMService()), events, args.drain_every)
+            print(f"{events:>10,} events  lists    {rate:>9,.0f} events/s  {held:>8.1f} MiB held")
+            run = iter(range(2))
+            rate, held, service = bench(
+                lambda: CRMRMMService(buffer_capacity=args.capacity, spill_dir=Path(tmp) / str(next(run))),
+                events,
+                args.drain_every,
+            )
+            spilled = sum(path.stat().st_size for path in service.hours_history.path.parent.iterdir()) / 2**20
+            print(f"{'':>10}         buffers  {rate:>9,.0f} events/s  {held:>8.1f} MiB held, {spilled:,.1f} MiB spilled")
+            # Reading the full history back from the log.
+            started = time.perf_counter()
+            count = sum(1 for _ in service.hours_history)
+            print(f"{'':>10}         history  {count / (time.perf_counter() - started):>9,.0f} events/s read back")
+
+
+if __name__ == "__main__":
+    main()
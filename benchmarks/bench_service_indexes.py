@@ -0,0 +1,102 @@
+"""CRMRMMService secondary indexes vs full scans, at growing contract and ticket counts.
+
+For each size the script times, per call: time entry validation and ticket
+closing (both look up the client's active contract), and the client /
+status / technician queries. Each query is compared with the full scan it
+replaces. Indexed timings should stay flat as the service grows.
+
+Usage: python benchmarks/bench_service_indexes.py [--sizes 10000:100000 100000:1000000] [--calls 2000] [--scans 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.crm_rmm.models import ContractType, Status  # noqa: E402
+from src.crm_rmm.service import CRMRMMService  # noqa: E402
+
+TECHNICIANS = 200
+
+
+def build(contracts: int, tickets: int) -> CRMRMMService:
+    service = CRMRMMService()
+    # Two contracts per client; tickets spread evenly over the clients.
+    clients = [service.create_client(f"Client {i}").id for i in range(max(1, contracts // 2))]
+    for i in range(contracts):
+        kind = ContractType.BANQUE_HEURES if i % 3 == 0 else ContractType.TIME_MATERIAL
+        service.create_contract(clients[i % len(clients)], kind, 90.0, 1e9, 1e9)
+    for i in range(tickets):
+        service.create_ticket(clients[i % len(clients)], "Incident", "Poste lent")
+    return service
+
+
+def per_call_us(func: Callable[[int], object], calls: int) -> float:
+    started = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def bench(contracts: int, tickets: int, calls: int, scans: int) -> dict[str, tuple[float, float | None]]:
+    random.seed(0)
+    started = time.perf_counter()
+    service = build(contracts, tickets)
+    print(f"{contracts:,} contracts, {tickets:,} tickets built in {time.perf_counter() - started:.1f} s")
+    client_ids = list(service.clients)
+    ticket_ids = random.sample(list(service.tickets), calls * 2)
+    entries = [
+        service.add_time_entry(ticket_ids[i], f"tech_{i % TECHNICIANS}", minutes=15).id for i in range(calls)
+    ]
+    for ticket_id in ticket_ids[calls : calls + 50]:
+        service.set_ticket_status(ticket_id, Status.EN_COURS)
+    clients = [random.choice(client_ids) for _ in range(calls)]
+
+    results: dict[str, tuple[float, float | None]] = {}
+    results["validate_time_entry"] = (per_call_us(lambda i: service.validate_time_entry(entries[i]), calls), None)
+    results["close_ticket"] = (per_call_us(lambda i: service.close_ticket(ticket_ids[calls + 50 + i]), calls - 50), None)
+    results["active contract"] = (
+        per_call_us(lambda i: service._active_contract_for_client(clients[i]), calls),
+        per_call_us(lambda i: [c for c in service.contracts.values() if c.client_id == clients[i]][:1], scans),
+    )
+    results["tickets_for_client"] = (
+        per_call_us(lambda i: service.tickets_for_client(clients[i]), calls),
+        per_call_us(lambda i: [t for t in service.tickets.values() if t.client_id == clients[i]], scans),
+    )
+    results["tickets_with_status"] = (
+        per_call_us(lambda i: service.tickets_with_status(Status.EN_COURS), calls),
+        per_call_us(lambda i: [t for t in service.tickets.values() if t.status == Status.EN_COURS], scans),
+    )
+    results["time_entries_for_technician"] = (
+        per_call_us(lambda i: service.time_entries_for_technician(f"tech_{i % TECHNICIANS}"), calls),
+        per_call_us(
+            lambda i: [e for e in service.time_entries.values() if e.technician_id == f"tech_{i % TECHNICIANS}"], scans
+        ),
+    )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["10000:100000", "100000:1000000"], help="contracts:tickets")
+    parser.add_argument("--calls", type=int, default=2_000, help="indexed calls per operation")
+    parser.add_argument("--scans", type=int, default=10, help="full-scan calls per operation")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        contracts, tickets = (int(part) for part in size.split(":"))
+        for name, (indexed, scan) in bench(contracts, tickets, args.calls, args.scans).items():
+            line = f"  {name:<28} indexed {indexed:>9.2f} µs/call"
+            if scan is not None:
+                line += f"   full scan {scan:>11,.0f} µs/call (x{scan / indexed:,.0f})"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
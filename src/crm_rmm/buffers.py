@@ -0,0 +1,226 @@
+"""Bounded in-memory event buffers that overflow to append-only JSON-lines logs."""
+
+from __future__ import annotations
+
+import json
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Any, Deque, Generic, Iterator, List, Optional, TypeVar, Union
+
+from .models import HoursEvent
+
+T = TypeVar("T")
+PathLike = Union[str, Path]
+
+_encode_json = json.JSONEncoder(separators=(",", ":")).encode
+
+
+class SpillBuffer(ABC, Generic[T]):
+    """Keeps the newest ``capacity`` items in memory and appends older ones to ``path``.
+
+    A quarter of the window spills at a time, so the log is opened once per
+    batch. ``len``, iteration and indexing cover the whole history, logged
+    items first. An existing log is only adopted with ``resume=True``, so a
+    buffer never inherits another one's history by accident.
+    """
+
+    def __init__(self, path: PathLike, capacity: int, resume: bool = False) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        if not resume and Path(path).exists():
+            raise FileExistsError(f"spill log already exists: {path} (pass resume=True to adopt it)")
+        self.path = Path(path)
+        self.capacity = capacity
+        self.spill_batch = max(1, capacity // 4)
+        # Byte offset of the first logged item still part of the buffer.
+        self._log_start = 0
+        self.spilled = self._count_logged()
+
+    def append(self, item: T) -> None:
+        if self._window_len() >= self.capacity:
+            self._spill()
+        self._push(item)
+
+    def window(self) -> List[T]:
+        """Items held in memory, oldest first."""
+        return list(self._window())
+
+    def __len__(self) -> int:
+        return self.spilled + self._window_len()
+
+    def __iter__(self) -> Iterator[T]:
+        yield from self._logged()
+        yield from self._window()
+
+    def __getitem__(self, index: int) -> T:
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("buffer index out of range")
+        if index >= self.spilled:
+            return self._window_item(index - self.spilled)
+        return next(islice(self._logged(), index, None))
+
+    def _spill(self) -> None:
+        batch = [self._encode(self._pop_oldest()) for _ in range(min(self.spill_batch, self._window_len()))]
+        with self.path.open("ab") as log:
+            log.write(("\n".join(map(_encode_json, batch)) + "\n").encode())
+        self.spilled += len(batch)
+
+    def _logged(self) -> Iterator[T]:
+        if not self.spilled:
+            return
+        with self.path.open("rb") as log:
+            log.seek(self._log_start)
+            for line in islice(log, self.spilled):
+                yield self._decode(json.loads(line))
+
+    def _count_logged(self) -> int:
+        if not self.path.exists():
+            return 0
+        with self.path.open("rb") as log:
+            return sum(1 for _ in log)
+
+    def _encode(self, item: T) -> Any:
+        return item
+
+    def _decode(self, value: Any) -> T:
+        return value
+
+    # In-memory window, oldest first; provided by subclasses.
+
+    @abstractmethod
+    def _window_len(self) -> int: ...
+
+    @abstractmethod
+    def _window(self) -> Iterator[T]: ...
+
+    @abstractmethod
+    def _window_item(self, index: int) -> T: ...
+
+    @abstractmethod
+    def _push(self, item: T) -> None: ...
+
+    @abstractmethod
+    def _pop_oldest(self) -> T: ...
+
+
+class EventLog(SpillBuffer[T]):
+    """Spill buffer over JSON-serializable items (notification texts, ids) held in a deque."""
+
+    def __init__(self, path: PathLike, capacity: int, resume: bool = False) -> None:
+        super().__init__(path, capacity, resume)
+        self._items: Deque[T] = deque()
+
+    def _window_len(self) -> int:
+        return len(self._items)
+
+    def _window(self) -> Iterator[T]:
+        return iter(self._items)
+
+    def _window_item(self, index: int) -> T:
+        return self._items[index]
+
+    def _push(self, item: T) -> None:
+        self._items.append(item)
+
+    def _pop_oldest(self) -> T:
+        return self._items.popleft()
+
+
+class SpillQueue(EventLog[T]):
+    """FIFO event log whose consumers take items out with ``drain``.
+
+    The log is read from a byte offset, so draining never rereads handed-out
+    items, and it is deleted once everything it held has been drained. Items
+    drained from a resumed log are handed out again (at least once).
+    """
+
+    def drain(self, limit: Optional[int] = None) -> List[T]:
+        """Remove and return up to ``limit`` items (all by default), oldest first."""
+        wanted = len(self) if limit is None else min(limit, len(self))
+        items: List[T] = []
+        if self.spilled and wanted:
+            with self.path.open("rb") as log:
+                log.seek(self._log_start)
+                while self.spilled and len(items) < wanted:
+                    items.append(self._decode(json.loads(log.readline())))
+                    self.spilled -= 1
+                self._log_start = log.tell()
+        while len(items) < wanted:
+            items.append(self._pop_oldest())
+        if not self.spilled and self._log_start:
+            self.path.unlink(missing_ok=True)
+            self._log_start = 0
+        return items
+
+
+class HoursHistory(SpillBuffer[HoursEvent]):
+    """Hours consumption history whose window is a ring of ``array('d')`` slots.
+
+    Each slot holds the three hour values as doubles plus references to the
+    contract's id strings; ``HoursEvent`` objects are only built when read.
+    """
+
+    def __init__(self, path: PathLike, capacity: int, resume: bool = False) -> None:
+        super().__init__(path, capacity, resume)
+        self._client_ids: List[str] = [""] * capacity
+        self._contract_ids: List[str] = [""] * capacity
+        # before, consumed and after hours of slot i at 3 * i, 3 * i + 1, 3 * i + 2.
+        self._hours = array("d", bytes(3 * capacity * array("d").itemsize))
+        self._head = 0
+        self._size = 0
+
+    def record(
+        self,
+        client_id: str,
+        contract_id: str,
+        before_hours: float,
+        consumed_hours: float,
+        after_hours: float,
+    ) -> None:
+        if self._size >= self.capacity:
+            self._spill()
+        slot = (self._head + self._size) % self.capacity
+        self._client_ids[slot] = client_id
+        self._contract_ids[slot] = contract_id
+        self._hours[3 * slot] = before_hours
+        self._hours[3 * slot + 1] = consumed_hours
+        self._hours[3 * slot + 2] = after_hours
+        self._size += 1
+
+    def _encode(self, item: HoursEvent) -> Any:
+        return [item.client_id, item.contract_id, item.before_hours, item.consumed_hours, item.after_hours]
+
+    def _decode(self, value: Any) -> HoursEvent:
+        return HoursEvent(*value)
+
+    def _window_len(self) -> int:
+        return self._size
+
+    def _window(self) -> Iterator[HoursEvent]:
+        return (self._window_item(index) for index in range(self._size))
+
+    def _window_item(self, index: int) -> HoursEvent:
+        slot = (self._head + index) % self.capacity
+        return HoursEvent(
+            self._client_ids[slot],
+            self._contract_ids[slot],
+            self._hours[3 * slot],
+            self._hours[3 * slot + 1],
+            self._hours[3 * slot + 2],
+        )
+
+    def _push(self, item: HoursEvent) -> None:
+        self.record(item.client_id, item.contract_id, item.before_hours, item.consumed_hours, item.after_hours)
+
+    def _pop_oldest(self) -> HoursEvent:
+        event = self._window_item(0)
+        self._client_ids[self._head] = self._contract_ids[self._head] = ""
+        self._head = (self._head + 1) % self.capacity
+        self._size -= 1
+        return event
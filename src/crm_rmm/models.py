@@ -75,3 +75,12 @@ class TimeEntry:
     billable: bool = True
     validated: bool = False
     created_at: datetime = field(default_factory=utcnow)
+
+
+@dataclass(slots=True)
+class HoursEvent:
+    client_id: str
+    contract_id: str
+    before_hours: float
+    consumed_hours: float
+    after_hours: float
@@ -1,32 +1,58 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import DefaultDict, Dict, List, Optional, Union
 from uuid import uuid4
 
-from .models import Client, Contract, ContractType, Priority, Status, Ticket, TimeEntry
+from .buffers import EventLog, HoursHistory, SpillQueue
+from .models import Client, Contract, ContractType, HoursEvent, Priority, Status, Ticket, TimeEntry
 
+__all__ = ["CRMRMMService", "HoursEvent"]
 
-@dataclass(slots=True)
-class HoursEvent:
-    client_id: str
-    contract_id: str
-    before_hours: float
-    consumed_hours: float
-    after_hours: float
+DEFAULT_BUFFER_CAPACITY = 10_000
 
 
 class CRMRMMService:
-    """In-memory MVP service implementing core CRM/RMM/PSA business rules."""
+    """In-memory MVP service implementing core CRM/RMM/PSA business rules.
 
-    def __init__(self) -> None:
+    Secondary indexes (client -> contracts and tickets, status -> tickets,
+    technician -> time entries) are maintained by every mutating method, so
+    ticket status must change through ``set_ticket_status`` or ``close_ticket``.
+
+    ``hours_history``, ``notifications`` and ``prebilling_queue`` keep at most
+    ``buffer_capacity`` items in memory each; older ones spill to JSON-lines
+    logs in ``spill_dir`` (a private temporary directory by default).
+    Consumers take queued tickets with ``prebilling_queue.drain()``.
+
+    Logs already in ``spill_dir`` raise ``FileExistsError`` unless ``resume``
+    is set: the service then carries on that history and pending queue,
+    handing queued tickets drained before out again.
+    """
+
+    def __init__(
+        self,
+        buffer_capacity: int = DEFAULT_BUFFER_CAPACITY,
+        spill_dir: Optional[Union[str, Path]] = None,
+        resume: bool = False,
+    ) -> None:
         self.clients: Dict[str, Client] = {}
         self.contracts: Dict[str, Contract] = {}
         self.tickets: Dict[str, Ticket] = {}
         self.time_entries: Dict[str, TimeEntry] = {}
-        self.hours_history: List[HoursEvent] = []
-        self.notifications: List[str] = []
-        self.prebilling_queue: List[str] = []
+        if spill_dir is None:
+            self._spill_tmp = tempfile.TemporaryDirectory(prefix="crm_rmm-")
+            spill_dir = self._spill_tmp.name
+        spill_dir = Path(spill_dir)
+        spill_dir.mkdir(parents=True, exist_ok=True)
+        self.hours_history = HoursHistory(spill_dir / "hours_history.jsonl", buffer_capacity, resume)
+        self.notifications: EventLog[str] = EventLog(spill_dir / "notifications.jsonl", buffer_capacity, resume)
+        self.prebilling_queue: SpillQueue[str] = SpillQueue(spill_dir / "prebilling_queue.jsonl", buffer_capacity, resume)
+        self._contracts_by_client: DefaultDict[str, List[str]] = defaultdict(list)
+        self._tickets_by_client: DefaultDict[str, List[str]] = defaultdict(list)
+        self._tickets_by_status: DefaultDict[Status, Dict[str, None]] = defaultdict(dict)
+        self._entries_by_technician: DefaultDict[str, List[str]] = defaultdict(list)
 
     def create_client(self, name: str, email: Optional[str] = None) -> Client:
         client = Client(id=self._id("cli"), name=name, email=email)
@@ -53,6 +79,7 @@ class CRMRMMService:
             alert_threshold_hours=alert_threshold_hours,
         )
         self.contracts[contract.id] = contract
+        self._contracts_by_client[client_id].append(contract.id)
         return contract
 
     def create_ticket(
@@ -75,6 +102,8 @@ class CRMRMMService:
             priority=priority,
         )
         self.tickets[ticket.id] = ticket
+        self._tickets_by_client[client_id].append(ticket.id)
+        self._tickets_by_status[ticket.status][ticket.id] = None
         return ticket
 
     def create_ticket_from_rmm_alert(
@@ -112,6 +141,7 @@ class CRMRMMService:
             validated=False,
         )
         self.time_entries[entry.id] = entry
+        self._entries_by_technician[technician_id].append(entry.id)
         return entry
 
     def validate_time_entry(self, entry_id: str) -> TimeEntry:
@@ -135,9 +165,16 @@ class CRMRMMService:
         entry.validated = True
         return entry
 
-    def close_ticket(self, ticket_id: str) -> Ticket:
+    def set_ticket_status(self, ticket_id: str, status: Status) -> Ticket:
         ticket = self._get_ticket(ticket_id)
-        ticket.status = Status.FERME
+        if ticket.status != status:
+            del self._tickets_by_status[ticket.status][ticket.id]
+            self._tickets_by_status[status][ticket.id] = None
+            ticket.status = status
+        return ticket
+
+    def close_ticket(self, ticket_id: str) -> Ticket:
+        ticket = self.set_ticket_status(ticket_id, Status.FERME)
 
         contract = self._active_contract_for_client(ticket.client_id)
         covered_by_bank = (
@@ -151,18 +188,29 @@ class CRMRMMService:
 
         return ticket
 
+    def contracts_for_client(self, client_id: str) -> List[Contract]:
+        return [self.contracts[contract_id] for contract_id in self._contracts_by_client.get(client_id, ())]
+
+    def tickets_for_client(self, client_id: str, status: Optional[Status] = None) -> List[Ticket]:
+        tickets = (self.tickets[ticket_id] for ticket_id in self._tickets_by_client.get(client_id, ()))
+        return [ticket for ticket in tickets if status is None or ticket.status == status]
+
+    def tickets_with_status(self, status: Status) -> List[Ticket]:
+        return [self.tickets[ticket_id] for ticket_id in self._tickets_by_status.get(status, ())]
+
+    def time_entries_for_technician(self, technician_id: str) -> List[TimeEntry]:
+        return [self.time_entries[entry_id] for entry_id in self._entries_by_technician.get(technician_id, ())]
+
     def _consume_contract_hours(self, contract: Contract, consumed_hours: float) -> None:
         before = contract.remaining_hours
         after = max(0.0, before - consumed_hours)
         contract.remaining_hours = after
-        self.hours_history.append(
-            HoursEvent(
-                client_id=contract.client_id,
-                contract_id=contract.id,
-                before_hours=before,
-                consumed_hours=consumed_hours,
-                after_hours=after,
-            )
+        self.hours_history.record(
+            client_id=contract.client_id,
+            contract_id=contract.id,
+            before_hours=before,
+            consumed_hours=consumed_hours,
+            after_hours=after,
         )
         if after <= contract.alert_threshold_hours:
             self.notifications.append(
@@ -170,8 +218,8 @@ class CRMRMMService:
             )
 
     def _active_contract_for_client(self, client_id: str) -> Optional[Contract]:
-        candidates = [c for c in self.contracts.values() if c.client_id == client_id]
-        return candidates[0] if candidates else None
+        contract_ids = self._contracts_by_client.get(client_id)
+        return self.contracts[contract_ids[0]] if contract_ids else None
 
     def _get_client(self, client_id: str) -> Client:
         if client_id not in self.clients:
@@ -1,18 +1,66 @@
+import csv
+import dataclasses
+import gzip
+import inspect
+import io
+import json
+import logging
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import Path
 
+import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session, sessionmaker
 
-from app.database import Base, get_db
+from app import billing_runs
+from app.alert_dedup import AlertDeduplicator, alert_fingerprint, get_alert_deduplicator
+from app.alert_rules import AlertRuleEngine, get_alert_rule_engine
+from app.dashboard import dashboard_counters
+from app.config import Settings
+from app.database import create_database_engine, engine_options, get_db
+from app.heartbeats import HeartbeatTracker, get_heartbeat_tracker
+from app.inventory import reconstruct
+from app import http_cache
+from app.http_cache import VersionedRoute, resource_versions, response_cache
+from app.ingest import IngestQueue, get_ingest_queue
+from app.metric_buffer import RecentMetricsBuffer, get_metric_buffer
+from app.migrations import migrate
+from app import main
 from app.main import app
+from app.models import (
+    Alert,
+    Contract,
+    HoursLedgerEntry,
+    InventorySnapshot,
+    Invoice,
+    InvoiceStatus,
+    Machine,
+    MetricSample,
+    Ticket,
+    TicketPriority,
+    TicketStatus,
+)
+from app.rollups import run_metric_rollups
+from app import serialization
+from app.schemas import AlertListItemOut, InvoiceOut, Page, PlaybookRunListItemOut, TicketOut, TimeEntryCreate
+from app.services import billing_period, subscription_invoice_key
 
 
-def build_client(tmp_path: Path) -> TestClient:
+def build_session_factory(tmp_path: Path) -> sessionmaker:
     db_path = tmp_path / "test.db"
-    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
-    TestingSessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-    Base.metadata.create_all(bind=engine)
+    engine = create_database_engine(f"sqlite:///{db_path}")
+    migrate(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+
+def build_client(tmp_path: Path, session_factory: sessionmaker | None = None) -> TestClient:
+    TestingSessionLocal = session_factory or build_session_factory(tmp_path)
 
     def override_get_db():
         db: Session = TestingSessionLocal()
@@ -21,7 +69,19 @@ def build_client(tmp_path: Path) -> TestClient:
         finally:
             db.close()
 
+    tracker = HeartbeatTracker()
+    buffer = RecentMetricsBuffer(window=10, initial_capacity=2)
+    rules = AlertRuleEngine()
+    dedup = AlertDeduplicator()
+    app.dependency_overrides.clear()
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_heartbeat_tracker] = lambda: tracker
+    app.dependency_overrides[get_metric_buffer] = lambda: buffer
+    app.dependency_overrides[get_alert_rule_engine] = lambda: rules
+    app.dependency_overrides[get_alert_deduplicator] = lambda: dedup
+    dashboard_counters.reset()
+    resource_versions.reset()
+    response_cache.clear()
     return TestClient(app)
 
 
@@ -47,10 +107,95 @@ def test_hours_bank_decrements_and_no_invoice(tmp_path: Path):
 
     contract_after = client.get(f"/contracts/{contract['id']}").json()
     assert contract_after["remaining_hours"] == 7.5
-    assert client.get("/invoices").json() == []
+    assert client.get("/invoices").json() == {"items": [], "next_cursor": None}
+
+    client.post(
+        "/time-entries",
+        json={"ticket_id": ticket["id"], "technician_id": t["id"], "duration_hours": 9, "billable": True},
+    )
+    balance = client.get(f"/contracts/{contract['id']}/hours").json()
+    assert balance == {"contract_id": contract["id"], "consumed_hours": 10.0, "remaining_hours": 0.0, "movements": 3}
+    ledger = client.get(f"/contracts/{contract['id']}/hours/ledger").json()["items"]
+    assert [(m["requested_hours"], m["applied_hours"], m["before_hours"], m["after_hours"]) for m in ledger] == [
+        (9.0, 7.5, 7.5, 0.0),
+        (2.5, 2.5, 10.0, 7.5),
+        (0.0, 0.0, 10.0, 10.0),
+    ]
+
+
+def test_emptying_a_bank_without_ledger_rows_journals_the_real_balance(tmp_path: Path):
+    factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, factory)
+
+    c = client.post("/clients", json={"name": "Lambda", "email": "lambda@example.com"}).json()
+    t = client.post("/technicians", json={"name": "Lea", "email": "lea@example.com"}).json()
+    contract_id = client.post(
+        "/contracts", json={"client_id": c["id"], "type": "hours_bank", "total_hours": 10, "hourly_rate": 90}
+    ).json()["id"]
+    ticket = client.post("/tickets", json={"client_id": c["id"], "contract_id": contract_id, "description": "Help"}).json()
+    with factory() as db:
+        # A bank opened before the ledger existed: a balance, no movements.
+        db.query(HoursLedgerEntry).filter_by(contract_id=contract_id).delete()
+        db.get(Contract, contract_id).remaining_hours = 2.0
+        db.commit()
+
+    r = client.post(
+        "/time-entries",
+        json={"ticket_id": ticket["id"], "technician_id": t["id"], "duration_hours": 5, "billable": True},
+    )
+    assert r.status_code == 200
+
+    ledger = client.get(f"/contracts/{contract_id}/hours/ledger").json()["items"]
+    assert [(m["requested_hours"], m["applied_hours"], m["before_hours"], m["after_hours"]) for m in ledger] == [
+        (5.0, 2.0, 2.0, 0.0),
+    ]
+
+
+def test_concurrent_time_entries_never_lose_hours(tmp_path: Path):
+    factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, factory)
 
+    c = client.post("/clients", json={"name": "Kappa", "email": "kappa@example.com"}).json()
+    t = client.post("/technicians", json={"name": "Karl", "email": "karl@example.com"}).json()
+    banks = {
+        total: client.post(
+            "/contracts", json={"client_id": c["id"], "type": "hours_bank", "total_hours": total, "hourly_rate": 90}
+        ).json()["id"]
+        for total in (1000, 10)
+    }
+    tickets = {
+        contract_id: client.post(
+            "/tickets", json={"client_id": c["id"], "contract_id": contract_id, "description": "Support"}
+        ).json()["id"]
+        for contract_id in banks.values()
+    }
 
-def test_time_material_generates_invoice(tmp_path: Path):
+    def log_time(ticket_id: int, hours: float, count: int) -> None:
+        for _ in range(count):
+            with factory() as db:
+                payload = TimeEntryCreate(ticket_id=ticket_id, technician_id=t["id"], duration_hours=hours)
+                main.create_time_entry(payload, db)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(log_time, tickets[banks[1000]], 0.25, 40) for _ in range(8)]
+        futures += [pool.submit(log_time, tickets[banks[10]], 0.5, 10) for _ in range(4)]
+        for future in futures:
+            future.result()
+
+    with factory() as db:
+        for total, expected in ((1000, 1000 - 8 * 40 * 0.25), (10, 0.0)):
+            contract = db.get(Contract, banks[total])
+            ledger = db.scalars(
+                select(HoursLedgerEntry).where(HoursLedgerEntry.contract_id == contract.id).order_by(HoursLedgerEntry.id)
+            ).all()
+            assert contract.remaining_hours == expected == ledger[-1].after_hours
+            assert sum(movement.applied_hours for movement in ledger) == total - expected
+            assert all(a.after_hours == b.before_hours for a, b in zip(ledger, ledger[1:]))
+            assert all(m.before_hours - m.applied_hours == m.after_hours for m in ledger)
+        assert len(ledger) == 1 + 4 * 10
+
+
+def test_time_material_accumulates_then_consolidates_into_invoices(tmp_path: Path):
     client = build_client(tmp_path)
 
     c = client.post("/clients", json={"name": "Beta", "email": "beta@example.com"}).json()
@@ -59,20 +204,55 @@ def test_time_material_generates_invoice(tmp_path: Path):
         "/contracts",
         json={"client_id": c["id"], "type": "time_material", "hourly_rate": 80},
     ).json()
-    ticket = client.post(
-        "/tickets",
-        json={"client_id": c["id"], "technician_id": t["id"], "contract_id": contract["id"], "description": "Install"},
-    ).json()
+    tickets = [
+        client.post(
+            "/tickets",
+            json={"client_id": c["id"], "technician_id": t["id"], "contract_id": contract["id"], "description": "Install"},
+        ).json()
+        for _ in range(2)
+    ]
+    no_contract = client.post("/tickets", json={"client_id": c["id"], "description": "Conseil"}).json()
 
-    r = client.post(
+    for ticket, hours in ((tickets[0], 1.5), (tickets[0], 0.5), (tickets[1], 1), (no_contract, 2)):
+        r = client.post(
+            "/time-entries",
+            json={"ticket_id": ticket["id"], "technician_id": t["id"], "duration_hours": hours, "billable": True},
+        )
+        assert r.status_code == 200
+    client.post(
         "/time-entries",
-        json={"ticket_id": ticket["id"], "technician_id": t["id"], "duration_hours": 1.5, "billable": True},
+        json={"ticket_id": tickets[1]["id"], "technician_id": t["id"], "duration_hours": 3, "billable": False},
     )
-    assert r.status_code == 200
 
-    invoices = client.get("/invoices").json()
-    assert len(invoices) == 1
-    assert invoices[0]["amount"] == 120.0
+    assert client.get("/invoices").json()["items"] == []
+    buckets = client.get("/billing/prebilling", params={"client_id": c["id"]}).json()
+    assert [(b["contract_id"], b["hours"], b["amount"], b["entry_count"]) for b in buckets] == [
+        (contract["id"], 3.0, 240.0, 3),
+        (None, 2.0, 240.0, 1),
+    ]
+
+    # Only closed months are consolidated unless a period is given.
+    assert client.post("/billing/prebilling/consolidate", json={}).json() == {"invoices": 0}
+    period = buckets[0]["period"]
+    assert client.post("/billing/prebilling/consolidate", json={"period": period}).json() == {"invoices": 2}
+    assert client.get("/billing/prebilling").json() == []
+
+    invoices = client.get("/invoices", params={"client_id": c["id"]}).json()["items"]
+    invoice = next(i for i in invoices if i["contract_id"] == contract["id"])
+    assert (invoice["amount"], invoice["period"]) == (240.0, period)
+    lines = client.get(f"/invoices/{invoice['id']}/lines").json()
+    assert [(line["ticket_id"], line["hours"], line["amount"]) for line in lines] == [
+        (tickets[0]["id"], 2.0, 160.0),
+        (tickets[1]["id"], 1.0, 80.0),
+    ]
+
+    # Time entered after consolidation opens a new bucket instead of changing the invoice.
+    client.post(
+        "/time-entries",
+        json={"ticket_id": tickets[0]["id"], "technician_id": t["id"], "duration_hours": 1, "billable": True},
+    )
+    assert [b["amount"] for b in client.get("/billing/prebilling").json()] == [80.0]
+    assert client.get("/invoices/999/lines").status_code == 404
 
 
 def test_alert_can_create_ticket(tmp_path: Path):
@@ -87,7 +267,7 @@ def test_alert_can_create_ticket(tmp_path: Path):
     ).json()
 
     assert alert["ticket_id"] is not None
-    tickets = client.get("/tickets").json()
+    tickets = client.get("/tickets").json()["items"]
     assert len(tickets) == 1
     assert tickets[0]["priority"] == "critical"
 
@@ -105,6 +285,90 @@ def test_subscription_billing(tmp_path: Path):
     assert invoice["amount"] == 300
 
 
+def test_concurrent_subscription_billing_returns_the_winning_invoice(tmp_path: Path):
+    session_factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, session_factory)
+    c = client.post("/clients", json={"name": "Delta", "email": "delta@example.com"}).json()
+    contract = client.post(
+        "/contracts",
+        json={"client_id": c["id"], "type": "subscription", "monthly_price": 20, "monthly_units": 1},
+    ).json()
+    period = billing_period()
+
+    # Another request bills the same contract and period between our lookup and our insert.
+    engine = session_factory.kw["bind"]
+    winner = []
+
+    def competing_insert(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO invoices") and not winner:
+            winner.append(None)
+            with engine.begin() as other:
+                key = subscription_invoice_key(contract["id"], period)
+                row = {"client_id": c["id"], "amount": 20, "contract_id": contract["id"], "period": period}
+                winner[0] = other.scalar(insert(Invoice).values(**row, idempotency_key=key).returning(Invoice.id))
+
+    event.listen(engine, "before_cursor_execute", competing_insert)
+    try:
+        r = client.post("/billing/subscription", json={"contract_id": contract["id"], "period": period})
+    finally:
+        event.remove(engine, "before_cursor_execute", competing_insert)
+    assert r.status_code == 200 and r.json()["id"] == winner[0]
+    with session_factory() as db:
+        assert db.scalar(select(func.count()).select_from(Invoice)) == 1
+
+
+def test_billing_run_invoices_each_contract_once_and_resumes(tmp_path: Path, monkeypatch):
+    factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, factory)
+
+    c = client.post("/clients", json={"name": "Theta", "email": "theta@example.com"}).json()
+    contracts = [
+        client.post(
+            "/contracts",
+            json={"client_id": c["id"], "type": "subscription", "monthly_price": 10, "monthly_units": units},
+        ).json()
+        for units in (1, 2, 0, 3)
+    ]
+    client.post("/contracts", json={"client_id": c["id"], "type": "time_material", "hourly_rate": 90})
+    period = billing_period()
+
+    first = client.post("/billing/subscription", json={"contract_id": contracts[0]["id"], "period": period}).json()
+    again = client.post("/billing/subscription", json={"contract_id": contracts[0]["id"], "period": period}).json()
+    assert again["id"] == first["id"] and first["period"] == period
+    assert client.post("/billing/runs", json={"period": "2024-13"}).status_code == 422
+
+    # Crash after the first chunk: its invoices and progress are committed, the rest is not.
+    calls = []
+    insert = billing_runs.insert_invoices
+
+    def failing_insert(db, rows):
+        calls.append(rows)
+        if len(calls) > 1:
+            raise RuntimeError("connexion perdue")
+        return insert(db, rows)
+
+    monkeypatch.setattr(billing_runs, "insert_invoices", failing_insert)
+    with factory() as db:
+        run = billing_runs.start_billing_run(db, period)
+        run = billing_runs.execute_billing_run(db, run.id, chunk_size=2)
+        assert (run.status.value, run.processed, run.invoiced, run.already_billed) == ("failed", 2, 1, 1)
+    monkeypatch.undo()
+
+    r = client.post("/billing/runs", json={"period": period})
+    assert r.status_code == 202 and r.json()["id"] == run.id
+    resumed = client.get(f"/billing/runs/{run.id}").json()
+    assert resumed["status"] == "completed" and resumed["error"] is None
+    assert (resumed["total_contracts"], resumed["processed"], resumed["invoiced"]) == (4, 4, 2)
+    assert (resumed["already_billed"], resumed["skipped"]) == (1, 1)
+
+    rerun = client.post("/billing/runs", json={"period": period}).json()
+    assert rerun["id"] != run.id
+    assert client.get(f"/billing/runs/{rerun['id']}").json()["already_billed"] == 3
+    invoices = client.get("/invoices", params={"client_id": c["id"]}).json()["items"]
+    assert sorted(i["amount"] for i in invoices) == [10, 20, 30]
+    assert client.get("/billing/runs/999").status_code == 404
+
+
 def test_dashboard_counts(tmp_path: Path):
     client = build_client(tmp_path)
 
@@ -114,3 +378,914 @@ def test_dashboard_counts(tmp_path: Path):
 
     assert dashboard["clients"] == 1
     assert dashboard["prospects"] == 1
+
+
+def test_dashboard_counters_follow_writes_without_recounting(tmp_path: Path):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Tau", "email": "tau@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-95", "os_name": "Debian"}).json()
+    assert client.get("/dashboard").json()["machines"] == 1
+    assert dashboard_counters.reloads == 1
+
+    ticket = client.post("/tickets", json={"client_id": c["id"], "description": "Imprimante"}).json()
+    client.post("/tickets", json={"client_id": c["id"], "description": "VPN"})
+    client.patch(f"/tickets/{ticket['id']}", json={"status": "resolved"})
+    client.post(f"/machines/{machine['id']}/alerts", json={"title": "Disque plein"})
+    client.post(f"/machines/{machine['id']}/alerts", json={"title": "Disque plein"})
+    client.post(f"/machines/{machine['id']}/heartbeat", json={})
+    client.post("/invoices", json={"client_id": c["id"], "amount": 90})
+
+    expected = {
+        "clients": 1,
+        "prospects": 0,
+        "open_tickets": 1,
+        "machines": 1,
+        "alerts_24h": 1,
+        "unpaid_invoices": 1,
+    }
+    assert client.get("/dashboard").json() == expected
+    assert dashboard_counters.reloads == 1
+
+    with build_session_factory(tmp_path)() as db:
+        db.execute(insert(Machine), [{"client_id": c["id"], "hostname": "pc-96", "os_name": "Debian"}])
+        db.commit()
+    assert client.get("/dashboard").json()["machines"] == 2
+    assert dashboard_counters.reloads == 2
+
+
+def test_metrics_batch_reports_per_item_results(tmp_path: Path):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Epsilon", "email": "epsilon@example.com"}).json()
+    m1 = client.post("/machines", json={"client_id": c["id"], "hostname": "srv-01", "os_name": "Debian 12"}).json()
+    m2 = client.post("/machines", json={"client_id": c["id"], "hostname": "srv-02", "os_name": "Debian 12"}).json()
+
+    r = client.post(
+        "/metrics/batch",
+        json={
+            "samples": [
+                {"machine_id": m1["id"], "cpu_percent": 10, "ram_percent": 20, "disk_percent": 30},
+                {"machine_id": m2["id"], "cpu_percent": 55, "ram_percent": 60, "disk_percent": 70},
+                {"machine_id": 9999, "cpu_percent": 1, "ram_percent": 1, "disk_percent": 1},
+                {"machine_id": m1["id"], "cpu_percent": 150, "ram_percent": 1, "disk_percent": 1},
+            ]
+        },
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["accepted"] == 2
+    assert body["rejected"] == 2
+    assert [result["accepted"] for result in body["results"]] == [True, True, False, False]
+    assert body["results"][2]["error"] == "Machine introuvable"
+    assert body["results"][3]["error"].startswith("cpu_percent")
+
+
+def test_ingest_queue_group_commits_metrics(tmp_path: Path):
+    session_factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, session_factory)
+    queue = IngestQueue(session_factory, maxsize=100, batch_size=50, flush_interval_ms=20)
+    queue.start()
+    app.dependency_overrides[get_ingest_queue] = lambda: queue
+
+    c = client.post("/clients", json={"name": "Zeta", "email": "zeta@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-09", "os_name": "Ubuntu"}).json()
+
+    r = client.post(f"/machines/{machine['id']}/metrics", json={"cpu_percent": 5, "ram_percent": 6, "disk_percent": 7})
+    assert r.status_code == 202
+    r = client.post(
+        "/metrics/batch",
+        json={"samples": [{"machine_id": machine["id"], "cpu_percent": 1, "ram_percent": 2, "disk_percent": 3}] * 3},
+    )
+    assert r.status_code == 202
+    assert r.json()["accepted"] == 3
+
+    queue.close()
+    with session_factory() as db:
+        assert db.scalar(select(func.count()).select_from(MetricSample)) == 4
+    stats = client.get("/ingest/stats").json()
+    assert stats["written"] == 4
+    assert stats["depth"] == 0
+
+
+def test_ingest_queue_retries_failed_group_commits(tmp_path: Path, caplog):
+    session_factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, session_factory)
+    c = client.post("/clients", json={"name": "Epsilon", "email": "epsilon@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-08", "os_name": "Ubuntu"}).json()
+    sample = {"machine_id": machine["id"], "cpu_percent": 1, "ram_percent": 2, "disk_percent": 3}
+    failures = [1]
+
+    def flaky_sessions() -> Session:
+        db = session_factory()
+        if failures[0] > 0:
+            failures[0] -= 1
+
+            def fail(*args, **kwargs):
+                raise OperationalError("INSERT INTO metric_samples", {}, Exception("database is locked"))
+
+            db.execute = fail
+        return db
+
+    # Acknowledged rows survive a failed commit: the batch is written again.
+    queue = IngestQueue(flaky_sessions, flush_interval_ms=1, write_attempts=2)
+    queue.submit_metrics([sample] * 3)
+    queue.close()
+    assert queue.stats()["written"] == 3 and queue.stats()["retries"] == 1 and queue.stats()["failed"] == 0
+
+    # Past the last attempt the batch is dropped, logged and counted.
+    failures[0] = 2
+    queue = IngestQueue(flaky_sessions, flush_interval_ms=1, write_attempts=2)
+    queue.submit_metrics([sample] * 2)
+    with caplog.at_level(logging.ERROR, logger="app.ingest"):
+        queue.close()
+    assert queue.stats()["failed"] == 2 and queue.stats()["written"] == 0
+    assert "dropping 2 rows" in caplog.text
+    with session_factory() as db:
+        assert db.scalar(select(func.count()).select_from(MetricSample)) == 3
+
+
+def test_ingest_queue_applies_backpressure(tmp_path: Path):
+    session_factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, session_factory)
+    queue = IngestQueue(session_factory, maxsize=2)
+    app.dependency_overrides[get_ingest_queue] = lambda: queue
+
+    c = client.post("/clients", json={"name": "Eta", "email": "eta@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-10", "os_name": "Ubuntu"}).json()
+    client.post(
+        "/alert-rules",
+        json={"name": "CPU saturé", "metric": "cpu_percent", "operator": ">", "threshold": 90, "consecutive": 2},
+    )
+
+    sample = {"machine_id": machine["id"], "cpu_percent": 99, "ram_percent": 2, "disk_percent": 3}
+    r = client.post("/metrics/batch", json={"samples": [sample] * 3})
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
+    assert client.get("/ingest/stats").json()["rejected"] == 3
+    # Refused samples are sent again by the agent: they must not advance the rule streaks.
+    rules = app.dependency_overrides[get_alert_rule_engine]()
+    assert [rule.streaks for rule in rules.rules] == [{}]
+
+
+def test_heartbeats_are_coalesced_and_flushed_in_bulk(tmp_path: Path):
+    session_factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, session_factory)
+    tracker = app.dependency_overrides[get_heartbeat_tracker]()
+
+    c = client.post("/clients", json={"name": "Theta", "email": "theta@example.com"}).json()
+    machines = [
+        client.post("/machines", json={"client_id": c["id"], "hostname": f"pc-{i}", "os_name": "macOS"}).json()
+        for i in range(3)
+    ]
+    for _ in range(5):
+        for machine in machines:
+            r = client.post(f"/machines/{machine['id']}/heartbeat", json={"agent_version": "3.0.0"})
+            assert r.json()["heartbeat_at"] is not None
+
+    with session_factory() as db:
+        assert db.scalar(select(func.count()).select_from(Machine).where(Machine.heartbeat_at.is_not(None))) == 0
+    listed = client.get("/machines").json()["items"]
+    assert all(m["heartbeat_at"] is not None and m["agent_version"] == "3.0.0" for m in listed)
+    assert tracker.pending() == 3
+
+    with session_factory() as db:
+        assert tracker.flush(db) == 3
+    assert tracker.pending() == 0
+    with session_factory() as db:
+        assert db.scalar(select(func.count()).select_from(Machine).where(Machine.heartbeat_at.is_not(None))) == 3
+
+
+def test_machine_listings_see_heartbeats_before_the_flush(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(http_cache, "settings", dataclasses.replace(http_cache.settings, http_cache_enabled=True))
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Kappa", "email": "kappa@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-12", "os_name": "macOS"}).json()
+    first = client.get("/machines")
+    assert first.json()["items"][0]["heartbeat_at"] is None
+
+    beat = client.post(f"/machines/{machine['id']}/heartbeat", json={"agent_version": "4.0"}).json()
+    listed = client.get("/machines").json()["items"][0]
+    assert listed["heartbeat_at"] == beat["heartbeat_at"] and listed["agent_version"] == "4.0"
+    r = client.get("/machines", headers={"If-None-Match": first.headers["etag"]})
+    assert r.status_code == 200
+    assert r.json()["items"][0]["heartbeat_at"] == beat["heartbeat_at"]
+
+
+def test_metric_rollups_and_resolution_selection(tmp_path: Path, monkeypatch):
+    session_factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, session_factory)
+
+    c = client.post("/clients", json={"name": "Iota", "email": "iota@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "srv-30", "os_name": "Debian"}).json()
+
+    start = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=30)
+    start -= timedelta(minutes=start.minute % 5)
+    samples = [
+        {
+            "machine_id": machine["id"],
+            "cpu_percent": float(i * 10),
+            "ram_percent": 50,
+            "disk_percent": 70,
+            "created_at": (start + timedelta(minutes=i)).isoformat(),
+        }
+        for i in range(10)
+    ]
+    assert client.post("/metrics/batch", json={"samples": samples}).json()["accepted"] == 10
+
+    with session_factory() as db:
+        processed = run_metric_rollups(db, force=True)
+    assert processed == {"1m": 10, "5m": 10, "1h": 10}
+
+    r = client.get(
+        f"/machines/{machine['id']}/metrics",
+        params={"from": start.isoformat(), "to": (start + timedelta(minutes=10)).isoformat(), "resolution": "5m"},
+    )
+    points = r.json()["points"]
+    assert [p["samples"] for p in points] == [5, 5]
+    assert points[0]["cpu_min"] == 0 and points[0]["cpu_max"] == 40 and points[0]["cpu_avg"] == 20
+    assert points[1]["cpu_p95"] == 90
+
+    r = client.get(f"/machines/{machine['id']}/metrics", params={"from": start.isoformat()})
+    assert r.json()["resolution"] == "raw"
+    assert len(r.json()["points"]) == 10
+    week_ago = (datetime.utcnow() - timedelta(days=6)).isoformat()
+    assert client.get(f"/machines/{machine['id']}/metrics", params={"from": week_ago}).json()["resolution"] == "1h"
+
+    # A late sample re-opens its bucket instead of being dropped.
+    late = {**samples[0], "cpu_percent": 100.0}
+    client.post("/metrics/batch", json={"samples": [late]})
+    with session_factory() as db:
+        run_metric_rollups(db, force=True)
+    r = client.get(
+        f"/machines/{machine['id']}/metrics",
+        params={"from": start.isoformat(), "to": (start + timedelta(minutes=5)).isoformat(), "resolution": "5m"},
+    )
+    assert r.json()["points"][0]["samples"] == 6
+    assert r.json()["points"][0]["cpu_max"] == 100
+
+    # PostgreSQL assigns ids before commit: a transaction committing after a run can land below the
+    # watermark. Ids within the lag window are read again by the next run.
+    monkeypatch.setattr("app.rollups.rollup_lag", lambda db: 1000)
+    row = {key: value for key, value in samples[0].items() if key != "created_at"}
+
+    def insert_samples(*id_minutes: tuple[int, int]) -> None:
+        with session_factory() as db:
+            db.execute(
+                insert(MetricSample),
+                [{**row, "id": sample_id, "created_at": start + timedelta(minutes=minutes)} for sample_id, minutes in id_minutes],
+            )
+            db.commit()
+            run_metric_rollups(db, force=True)
+
+    insert_samples((1000, 7))
+    # The late sample is alone in its bucket: only the lag window brings it back.
+    insert_samples((500, 2), (1001, 8))
+    r = client.get(
+        f"/machines/{machine['id']}/metrics",
+        params={"from": start.isoformat(), "to": (start + timedelta(minutes=10)).isoformat(), "resolution": "5m"},
+    )
+    assert [p["samples"] for p in r.json()["points"]] == [7, 7]
+
+
+def test_recent_metrics_buffer_fleet_stats(tmp_path: Path):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Kappa", "email": "kappa@example.com"}).json()
+    machines = [
+        client.post("/machines", json={"client_id": c["id"], "hostname": f"pc-{i}", "os_name": "Windows 11"}).json()
+        for i in range(3)
+    ]
+    start = datetime.utcnow() - timedelta(minutes=20)
+    samples = [
+        {
+            "machine_id": machine["id"],
+            "cpu_percent": 10.0 * index + minute,
+            "ram_percent": 40,
+            "disk_percent": 60,
+            "created_at": (start + timedelta(minutes=minute)).isoformat(),
+        }
+        for index, machine in enumerate(machines)
+        for minute in range(15)
+    ]
+    client.post("/metrics/batch", json={"samples": samples})
+    client.post(f"/machines/{machines[0]['id']}/metrics", json={"cpu_percent": 99, "ram_percent": 40, "disk_percent": 60})
+
+    stats = client.get("/fleet/metrics/stats", params={"samples": 5, "limit": 2}).json()
+    assert [s["machine_id"] for s in stats] == [machines[2]["id"], machines[0]["id"]]
+    assert stats[0]["samples"] == 5
+    assert stats[0]["cpu"]["max"] == 34
+    assert stats[0]["cpu"]["mean"] == 32
+    assert stats[0]["cpu"]["slope_per_minute"] == pytest.approx(1.0)
+    assert stats[0]["ram"]["slope_per_minute"] == 0
+
+    buffer = app.dependency_overrides[get_metric_buffer]()
+    assert len(buffer) == 3
+    assert buffer.nbytes < 3 * 1024
+
+
+def test_alert_rules_fire_on_consecutive_samples(tmp_path: Path):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Lambda", "email": "lambda@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "srv-40", "os_name": "Debian"}).json()
+    client.post(
+        "/alert-rules",
+        json={"name": "CPU saturé", "metric": "cpu_percent", "operator": ">", "threshold": 90, "consecutive": 3},
+    )
+    client.post(
+        "/alert-rules",
+        json={
+            "name": "Disque plein",
+            "metric": "disk_percent",
+            "operator": ">",
+            "threshold": 95,
+            "severity": "critical",
+            "auto_create_ticket": True,
+        },
+    )
+
+    cpu = [95, 96, 50, 91, 92, 93, 94, 97]
+    samples = [{"machine_id": machine["id"], "cpu_percent": v, "ram_percent": 10, "disk_percent": 20} for v in cpu]
+    client.post("/metrics/batch", json={"samples": samples})
+    client.post(f"/machines/{machine['id']}/metrics", json={"cpu_percent": 10, "ram_percent": 10, "disk_percent": 99})
+
+    with build_session_factory(tmp_path)() as db:
+        alerts = db.query(Alert).order_by(Alert.id).all()
+    assert [(a.title, a.severity.value) for a in alerts] == [("CPU saturé", "warning"), ("Disque plein", "critical")]
+    assert "dernière valeur 93" in alerts[0].details
+    assert alerts[0].ticket_id is None and alerts[1].ticket_id is not None
+
+
+def test_repeated_alerts_are_deduplicated_and_storms_capped(tmp_path: Path):
+    client = build_client(tmp_path)
+    dedup = AlertDeduplicator(window_seconds=60, max_inserts_per_second=0.001, burst=2)
+    app.dependency_overrides[get_alert_deduplicator] = lambda: dedup
+
+    c = client.post("/clients", json={"name": "Mu", "email": "mu@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-50", "os_name": "Windows 11"}).json()
+    payload = {"severity": "critical", "title": "Service Spooler arrêté", "auto_create_ticket": True}
+
+    first = client.post(f"/machines/{machine['id']}/alerts", json=payload).json()
+    for _ in range(4):
+        repeat = client.post(f"/machines/{machine['id']}/alerts", json={**payload, "title": "service spooler  ARRÊTÉ"})
+    assert repeat.json()["id"] == first["id"]
+    assert repeat.json()["occurrences"] == 5
+    tickets = client.get("/tickets").json()["items"]
+    assert len(tickets) == 1
+
+    with build_session_factory(tmp_path)() as db:
+        assert db.get(Ticket, first["ticket_id"]).alert_occurrences == 5
+
+    assert client.post(f"/machines/{machine['id']}/alerts", json={"title": "Disque C: plein"}).status_code == 200
+    r = client.post(f"/machines/{machine['id']}/alerts", json={"title": "Mise à jour en échec"})
+    assert r.status_code == 429
+    assert client.get("/alerts/stats").json() == {"tracked": 2, "deduplicated": 4, "suppressed": 1}
+
+
+def test_alert_dedup_survives_restarts_without_locking_queries(tmp_path: Path):
+    session_factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, session_factory)
+    c = client.post("/clients", json={"name": "Nu", "email": "nu@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-51", "os_name": "Windows 11"}).json()
+    first = client.post(f"/machines/{machine['id']}/alerts", json={"title": "Sauvegarde en échec"}).json()
+
+    # A new process starts with an empty fingerprint index: the repeat is found in the database.
+    dedup = AlertDeduplicator()
+    app.dependency_overrides[get_alert_deduplicator] = lambda: dedup
+    lock_free_during_queries = []
+
+    def try_lock() -> bool:
+        if not dedup.lock.acquire(blocking=False):
+            return False
+        dedup.lock.release()
+        return True
+
+    def probe(*args):
+        with ThreadPoolExecutor(1) as pool:
+            lock_free_during_queries.append(pool.submit(try_lock).result())
+
+    engine = session_factory.kw["bind"]
+    event.listen(engine, "before_cursor_execute", probe)
+    try:
+        repeat = client.post(f"/machines/{machine['id']}/alerts", json={"title": "Sauvegarde en échec"}).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", probe)
+    assert repeat["id"] == first["id"] and repeat["occurrences"] == 2
+    assert lock_free_during_queries and all(lock_free_during_queries)
+    assert dedup.stats()["deduplicated"] == 1
+
+    # An open row the lookup cannot see (never seen, like a concurrent insert)
+    # makes the insert conflict on (fingerprint, is_open): the alert folds into it.
+    with session_factory() as db:
+        other = Alert(
+            machine_id=machine["id"],
+            title="Pare-feu désactivé",
+            fingerprint=alert_fingerprint(machine["id"], "Pare-feu désactivé", "warning"),
+            is_open=True,
+            last_seen_at=None,
+        )
+        db.add(other)
+        db.commit()
+        other_id = other.id
+    r = client.post(f"/machines/{machine['id']}/alerts", json={"title": "Pare-feu désactivé"}).json()
+    assert r["id"] == other_id and r["occurrences"] == 2
+    with session_factory() as db:
+        assert db.scalar(select(func.count()).select_from(Alert)) == 2
+
+
+def test_inventory_snapshots_are_deduplicated_and_delta_encoded(tmp_path: Path, monkeypatch):
+    client = build_client(tmp_path)
+    monkeypatch.setattr(main, "settings", dataclasses.replace(main.settings, inventory_keyframe_interval=3))
+
+    c = client.post("/clients", json={"name": "Nu", "email": "nu@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-60", "os_name": "Windows 11"}).json()
+    url = f"/machines/{machine['id']}/inventory"
+    software = [{"name": f"App {i}", "version": "1.0"} for i in range(20)]
+    inventory = {"cpu": "i5", "ram_gb": 16, "software": software}
+
+    assert client.post(url, json={"raw_json": inventory}).json()["storage"] == "full"
+    assert client.post(url, json={"raw_json": inventory}).json()["storage"] == "unchanged"
+
+    versions = []
+    for step in range(1, 5):
+        inventory = {**inventory, "ram_gb": 16 + step, "software": software[:-step] + [{"name": "Chrome", "version": f"{step}.0"}]}
+        versions.append((client.post(url, json={"raw_json": inventory}).json(), inventory))
+    assert [created["storage"] for created, _ in versions] == ["delta", "delta", "full", "delta"]
+
+    with build_session_factory(tmp_path)() as db:
+        assert db.query(InventorySnapshot).count() == 5
+
+    for created, expected in versions:
+        r = client.get(url, params={"at": created["created_at"]})
+        assert r.json()["id"] == created["id"]
+        assert r.json()["raw_json"] == expected
+    assert client.get(url).json()["raw_json"] == inventory
+
+    changes = client.get(f"{url}/changes").json()
+    assert changes[0]["changes"] is None
+    assert ["set", ["ram_gb"], 18] in changes[2]["changes"]
+    assert ["set", ["ram_gb"], 19] in changes[3]["changes"] and changes[3]["storage"] == "full"
+    assert client.get("/machines/999/inventory").status_code == 404
+
+
+def test_sibling_inventory_deltas_rebuild_their_own_documents(tmp_path: Path, monkeypatch):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Omicron", "email": "omicron@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-61", "os_name": "Debian"}).json()
+    url = f"/machines/{machine['id']}/inventory"
+    base = {"cpu": "i7", "ram_gb": 8, "software": [{"name": f"App {i}", "version": "1.0"} for i in range(20)]}
+    keyframe = client.post(url, json={"raw_json": base}).json()
+
+    # Two submissions that both read the keyframe as the latest snapshot (the race the row lock prevents).
+    with build_session_factory(tmp_path)() as db:
+        parent = db.get(InventorySnapshot, keyframe["id"])
+    monkeypatch.setattr("app.inventory.latest_snapshot", lambda db, machine_id: db.merge(parent))
+    first, second = {**base, "ram_gb": 16}, {**base, "cpu": "i9"}
+    created = [client.post(url, json={"raw_json": document}).json() for document in (first, second)]
+    monkeypatch.undo()
+    third = {**second, "ram_gb": 64}
+    created.append(client.post(url, json={"raw_json": third}).json())
+    assert [snapshot["storage"] for snapshot in created] == ["delta"] * 3
+
+    with build_session_factory(tmp_path)() as db:
+        rebuilt = [reconstruct(db, db.get(InventorySnapshot, snapshot["id"])) for snapshot in created]
+    assert rebuilt == [first, second, third]
+    assert client.get(url).json()["raw_json"] == third
+
+
+def test_inventory_search_uses_latest_inventory_index(tmp_path: Path):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Xi", "email": "xi@example.com"}).json()
+    inventories = {
+        "pc-70": {
+            "ram_gb": 4,
+            "disks": [{"smart_errors": 0}, {"smart_errors": 3}],
+            "software": [{"name": "Chrome", "version": "119.0.6045.199"}],
+        },
+        "pc-71": {"ram_gb": 16, "disks": [{"smart_errors": 1}], "software": [{"name": "Chrome", "version": "120.0"}]},
+        "pc-72": {"ram_gb": 6, "disks": [{"smart_errors": 0}], "software": [{"name": "Firefox", "version": "121.0"}]},
+    }
+    ids = {}
+    for hostname, inventory in inventories.items():
+        machine = client.post("/machines", json={"client_id": c["id"], "hostname": hostname, "os_name": "Windows 11"}).json()
+        ids[hostname] = machine["id"]
+        client.post(f"/machines/{machine['id']}/inventory", json={"raw_json": inventory})
+
+    def hosts(**params) -> list[str]:
+        r = client.get("/inventory/search", params=params)
+        assert r.status_code == 200, r.text
+        return [hit["hostname"] for hit in r.json()]
+
+    assert hosts(software="chrome", version="<120") == ["pc-70"]
+    assert hosts(software="Chrome", version=">=120.0.0") == ["pc-71"]
+    assert hosts(where=["ram_gb<8", "disks.*.smart_errors>0"]) == ["pc-70"]
+    assert hosts(where=["ram_gb<8"], software="fire*") == ["pc-72"]
+
+    # Only the latest inventory is indexed.
+    client.post(f"/machines/{ids['pc-70']}/inventory", json={"raw_json": {**inventories["pc-70"], "ram_gb": 32}})
+    assert hosts(where=["ram_gb<8", "disks.*.smart_errors>0"]) == []
+    assert client.get("/inventory/search", params={"where": "ram_gb<beaucoup"}).status_code == 422
+    assert client.get("/inventory/search").status_code == 422
+
+
+def test_agent_uploads_accept_gzip_and_ndjson_streams(tmp_path: Path):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Omicron", "email": "omicron@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-80", "os_name": "Debian"}).json()
+
+    inventory = {"software": [{"name": f"paquet-{i}", "version": "1.0"} for i in range(2000)]}
+    body = gzip.compress(json.dumps({"raw_json": inventory}).encode())
+    r = client.post(
+        f"/machines/{machine['id']}/inventory",
+        content=body,
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+    )
+    assert r.status_code == 200, r.text
+    assert len(r.json()["raw_json"]["software"]) == 2000
+
+    sample = {"machine_id": machine["id"], "ram_percent": 1, "disk_percent": 2}
+    lines = [json.dumps({**sample, "cpu_percent": i % 100}) for i in range(1200)]
+    lines[10] = "{pas du json"
+    lines[20] = json.dumps({"machine_id": 999, "cpu_percent": 1, "ram_percent": 1, "disk_percent": 1})
+    r = client.post(
+        "/metrics/stream",
+        content=gzip.compress(("\n".join(lines) + "\n").encode()),
+        headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+    )
+    assert r.status_code == 200, r.text
+    assert (r.json()["accepted"], r.json()["rejected"]) == (1198, 2)
+    assert [(e["index"], e["error"]) for e in r.json()["errors"]][1] == (20, "Machine introuvable")
+    with build_session_factory(tmp_path)() as db:
+        assert db.scalar(select(func.count()).select_from(MetricSample)) == 1198
+
+    bomb = gzip.compress(b" " * (main.settings.max_request_body_bytes + 1))
+    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    r = client.post("/metrics/batch", content=bomb, headers=headers)
+    assert r.status_code == 413
+    assert client.post("/metrics/batch", content=b"{}", headers={"Content-Encoding": "br"}).status_code == 415
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "zstd"])
+def test_corrupt_compressed_bodies_are_rejected(tmp_path: Path, encoding: str):
+    if encoding == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        body = zstandard.ZstdCompressor().compress(b'{"samples": []}' * 100)
+    else:
+        body = gzip.compress(b'{"samples": []}' * 100) if encoding == "gzip" else zlib.compress(b'{"samples": []}' * 100)
+    corrupt = body[:12] + bytes(byte ^ 0xFF for byte in body[12:40]) + body[40:]
+    client = build_client(tmp_path)
+
+    headers = {"Content-Type": "application/json", "Content-Encoding": encoding}
+    r = client.post("/metrics/batch", content=corrupt, headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Corps compressé invalide"
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "zstd"])
+def test_truncated_compressed_bodies_are_rejected(tmp_path: Path, encoding: str):
+    payload = b'{"samples": [' + b" " * 2000 + b"]}"
+    if encoding == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        body = zstandard.ZstdCompressor().compress(payload)
+    else:
+        body = gzip.compress(payload) if encoding == "gzip" else zlib.compress(payload)
+    client = build_client(tmp_path)
+
+    headers = {"Content-Type": "application/json", "Content-Encoding": encoding}
+    r = client.post("/metrics/batch", content=body[:-4], headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Corps compressé invalide"
+    plain = client.post("/metrics/batch", content=payload, headers={"Content-Type": "application/json"})
+    assert client.post("/metrics/batch", content=body, headers=headers).status_code == plain.status_code
+
+
+def test_list_endpoints_use_keyset_pagination_and_filters(tmp_path: Path):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Pi", "email": "pi@example.com"}).json()
+    other = client.post("/clients", json={"name": "Rho", "email": "rho@example.com"}).json()
+    created = []
+    for i in range(7):
+        payload = {
+            "client_id": c["id"] if i % 2 == 0 else other["id"],
+            "priority": "high" if i < 3 else "normal",
+            "description": f"Incident {i}",
+        }
+        created.append(client.post("/tickets", json=payload).json()["id"])
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/tickets", params=params).json()
+        seen += [ticket["id"] for ticket in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == created[::-1]
+
+    page = client.get("/tickets", params={"client_id": c["id"], "priority": "high", "limit": 1}).json()
+    assert [ticket["id"] for ticket in page["items"]] == [created[2]]
+    page = client.get("/tickets", params={"client_id": c["id"], "priority": "high", "cursor": page["next_cursor"]}).json()
+    assert [ticket["id"] for ticket in page["items"]] == [created[0]] and page["next_cursor"] is None
+
+    assert client.get("/clients", params={"limit": 1}).json()["next_cursor"] is not None
+    assert client.get("/tickets", params={"cursor": "pas-un-curseur"}).status_code == 400
+    assert client.get("/tickets", params={"limit": 10_000}).status_code == 422
+
+
+def test_sparse_fieldsets_and_deferred_heavy_columns(tmp_path: Path):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Sigma", "email": "sigma@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-16", "os_name": "Windows 11"}).json()
+    for i in range(3):
+        client.post("/tickets", json={"client_id": c["id"], "description": "x" * 900})
+        client.post(f"/machines/{machine['id']}/alerts", json={"title": f"Disque {i}", "details": "journal " * 50})
+    client.post("/playbooks", json={"name": "Nettoyage", "os_type": "windows", "script": "cleanmgr /sagerun:1"})
+    client.post("/playbook-runs", json={"playbook_id": 1, "machine_id": machine["id"]})
+
+    page = client.get("/tickets", params={"fields": "id,status", "limit": 2}).json()
+    assert [set(ticket) for ticket in page["items"]] == [{"id", "status"}] * 2
+    rest = client.get("/tickets", params={"fields": "id,status", "cursor": page["next_cursor"]}).json()
+    assert len(rest["items"]) == 1 and rest["next_cursor"] is None
+    assert "description" in client.get("/tickets").json()["items"][0]
+    response = client.get("/tickets", params={"fields": "id,secret"})
+    assert response.status_code == 400 and "secret" in response.json()["detail"]
+
+    alerts = client.get("/alerts", params={"machine_id": machine["id"]}).json()["items"]
+    assert [alert["title"] for alert in alerts] == ["Disque 2", "Disque 1", "Disque 0"]
+    assert "details" not in alerts[0]
+    alerts = client.get("/alerts", params={"fields": "id,details", "limit": 1}).json()["items"]
+    assert alerts[0]["details"].startswith("journal")
+
+    runs = client.get("/playbook-runs", params={"machine_id": machine["id"]}).json()["items"]
+    assert len(runs) == 1 and "output_log" not in runs[0] and runs[0]["status"] == "success"
+    assert "output_log" in client.get("/playbook-runs", params={"fields": "output_log"}).json()["items"][0]
+    schemas = client.get("/openapi.json").json()["components"]["schemas"]
+    listings = (("/alerts", AlertListItemOut, "details"), ("/playbook-runs", PlaybookRunListItemOut, "output_log"))
+    for path, schema, deferred in listings:
+        assert deferred not in schemas[schema.__name__]["required"]
+        Page[schema].model_validate(client.get(path).json())
+
+    client.post(f"/machines/{machine['id']}/inventory", json={"raw_json": {"cpu": "i7", "ram_gb": 16}})
+    inventory = client.get(f"/machines/{machine['id']}/inventory", params={"fields": "id,created_at,storage"}).json()
+    assert set(inventory) == {"id", "created_at", "storage"} and inventory["storage"] == "full"
+    assert client.get(f"/machines/{machine['id']}/inventory").json()["raw_json"]["ram_gb"] == 16
+
+
+@pytest.mark.parametrize("encoder", ["orjson", "json"])
+def test_fast_list_pages_match_response_model_serialization(tmp_path: Path, monkeypatch, encoder: str):
+    if encoder == "json":
+        monkeypatch.setattr(serialization, "orjson", None)
+    session_factory = build_session_factory(tmp_path)
+    client = build_client(tmp_path, session_factory)
+
+    c = client.post("/clients", json={"name": "Chi", "email": "chi@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-18", "os_name": "Debian"}).json()
+    client.post("/tickets", json={"client_id": c["id"], "machine_id": machine["id"], "description": "Écran « noir »"})
+    client.post("/invoices", json={"client_id": c["id"], "amount": 90, "description": "Forfait"})
+    with session_factory() as db:
+        db.add(
+            Ticket(
+                client_id=c["id"],
+                status=TicketStatus.ON_HOLD,
+                priority=TicketPriority.CRITICAL,
+                description="Sans machine",
+                created_at=datetime(2024, 3, 1, 8, 30),
+            )
+        )
+        db.add(
+            Invoice(
+                client_id=c["id"],
+                amount=12.345,
+                description="Abonnement",
+                status=InvoiceStatus.PAID,
+                created_at=datetime(2024, 3, 1, 8, 30, 0, 1),
+                contract_id=None,
+                period="2024-02",
+            )
+        )
+        db.commit()
+        expected = {
+            "/tickets": [TicketOut.model_validate(t) for t in db.scalars(select(Ticket).order_by(Ticket.created_at.desc()))],
+            "/invoices": [InvoiceOut.model_validate(i) for i in db.scalars(select(Invoice).order_by(Invoice.created_at.desc()))],
+        }
+
+    for path, models in expected.items():
+        # What FastAPI renders through response_model=Page[...] for the same rows.
+        reference = [model.model_dump(mode="json") for model in models]
+        assert client.get(path).json() == {"items": reference, "next_cursor": None}
+        sparse = client.get(path, params={"fields": "id,status,created_at"}).json()["items"]
+        assert sparse == [{name: item[name] for name in ("id", "status", "created_at")} for item in reference]
+    tickets = client.get("/tickets").json()["items"]
+    assert {ticket["machine_id"] for ticket in tickets} == {machine["id"], None}
+    assert "2024-03-01T08:30:00" in {ticket["created_at"] for ticket in tickets}
+
+
+def test_bulk_import_resolves_clients_and_reports_row_errors(tmp_path: Path):
+    client = build_client(tmp_path)
+    existing = client.post("/clients", json={"name": "Déjà là", "email": "old@example.com"}).json()
+
+    clients_csv = (
+        "name,email,phone\n"
+        "Tau,tau@example.com,0102\n"
+        "Upsilon,ups@example.com,\n"
+        "Doublon,tau@example.com,\n"
+        "Ancien,old@example.com,\n"
+        ",sans-nom@example.com\n"
+    )
+    response = client.post("/import/clients", content=clients_csv, headers={"Content-Type": "text/csv"})
+    body = response.json()
+    assert (body["inserted"], body["rejected"]) == (2, 3)
+    assert sorted(error["index"] for error in body["errors"]) == [2, 3, 4]
+    assert {error["index"]: error["error"] for error in body["errors"]}[2] == "email déjà utilisé : tau@example.com"
+
+    machines = [
+        {"client_email": "tau@example.com", "hostname": "tau-01", "os_name": "Windows 11", "ram_total_gb": 16},
+        {"client_id": existing["id"], "hostname": "old-01", "os_name": "Ubuntu 24.04"},
+        {"client_email": "inconnu@example.com", "hostname": "x-01", "os_name": "macOS"},
+        {"hostname": "orphelin", "os_name": "macOS"},
+    ]
+    ndjson = "\n".join(json.dumps(machine) for machine in machines) + "\n{pas du json\n"
+    body = client.post("/import/machines", content=gzip.compress(ndjson.encode()), headers={
+        "Content-Type": "application/x-ndjson", "Content-Encoding": "gzip",
+    }).json()
+    assert (body["inserted"], body["rejected"]) == (2, 3)
+    errors = {error["index"]: error["error"] for error in body["errors"]}
+    assert errors[2] == "Client introuvable : inconnu@example.com"
+    assert "client_id ou client_email requis" in errors[3] and errors[4].startswith("JSON invalide")
+
+    hosts = {machine["hostname"]: machine["client_id"] for machine in client.get("/machines").json()["items"]}
+    tau = next(c for c in client.get("/clients").json()["items"] if c["email"] == "tau@example.com")
+    assert hosts == {"tau-01": tau["id"], "old-01": existing["id"]}
+    assert client.get("/dashboard").json()["machines"] == 2
+    assert client.post("/import/clients", content="{}", headers={"Content-Type": "application/json"}).status_code == 415
+
+
+def build_async_client(tmp_path: Path) -> TestClient:
+    """The app with the async router mounted first, as with ``CRM_RMM_ASYNC_DB_ENABLED``."""
+    pytest.importorskip("aiosqlite")
+    pytest.importorskip("greenlet")
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from app.async_database import get_async_db
+    from app.async_routes import router
+
+    build_client(tmp_path)
+    # NullPool: TestClient may run each request on a fresh event loop.
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool)
+    factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with factory() as db:
+            yield db
+
+    async_app = FastAPI()
+    async_app.router.route_class = VersionedRoute
+    async_app.include_router(router)
+    async_app.include_router(app.router)
+    async_app.dependency_overrides = app.dependency_overrides
+    async_app.dependency_overrides[get_async_db] = override_get_async_db
+    return TestClient(async_app)
+
+
+def test_async_routes_serve_hot_endpoints(tmp_path: Path):
+    from app.async_routes import router
+
+    client = build_async_client(tmp_path)
+    tickets_route = next(route for route in router.routes if route.path == "/tickets")
+    assert inspect.iscoroutinefunction(tickets_route.endpoint)
+
+    c = client.post("/clients", json={"name": "Phi", "email": "phi@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-19", "os_name": "Debian"}).json()
+    mid = machine["id"]
+    client.post("/alert-rules", json={"name": "Disque plein", "metric": "disk_percent", "operator": ">", "threshold": 95})
+
+    beat = client.post(f"/machines/{mid}/heartbeat", json={"agent_version": "2.0"}).json()
+    assert beat["agent_version"] == "2.0" and beat["heartbeat_at"] is not None
+    assert client.post("/machines/999/heartbeat", json={}).status_code == 404
+
+    metric = client.post(f"/machines/{mid}/metrics", json={"cpu_percent": 10, "ram_percent": 20, "disk_percent": 99})
+    assert metric.status_code == 200 and metric.json()["id"] > 0
+    batch = client.post(
+        "/metrics/batch",
+        json={"samples": [{"machine_id": mid, "cpu_percent": 1, "ram_percent": 2, "disk_percent": 3}, {"machine_id": mid}]},
+    ).json()
+    assert (batch["accepted"], batch["rejected"]) == (1, 1)
+
+    for _ in range(2):
+        alert = client.post(f"/machines/{mid}/alerts", json={"title": "Ventilateur", "auto_create_ticket": True}).json()
+    assert alert["occurrences"] == 2 and alert["ticket_id"] is not None
+    alerts = client.get("/alerts", params={"machine_id": mid}).json()["items"]
+    assert sorted(a["title"] for a in alerts) == ["Disque plein", "Ventilateur"]
+
+    tickets = client.get("/tickets", params={"fields": "id,status"}).json()
+    assert tickets["items"] == [{"id": alert["ticket_id"], "status": "open"}]
+    assert client.get("/tickets", params={"cursor": "abc"}).status_code == 400
+
+
+def test_async_alert_writes_keep_the_dedup_lock_off_the_event_loop(tmp_path: Path):
+    client = build_async_client(tmp_path)
+    dedup = app.dependency_overrides[get_alert_deduplicator]()
+    c = client.post("/clients", json={"name": "Chi", "email": "chi@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-20", "os_name": "Debian"}).json()
+
+    with client, ThreadPoolExecutor(2) as pool:
+        # A threadpool request holding the lock must not stall the loop.
+        dedup.lock.acquire()
+        try:
+            alert = pool.submit(client.post, f"/machines/{machine['id']}/alerts", json={"title": "Onduleur"})
+            time.sleep(0.2)
+            assert pool.submit(client.get, "/tickets").result(timeout=5).status_code == 200
+            assert not alert.done()
+        finally:
+            dedup.lock.release()
+        assert alert.result(timeout=5).json()["title"] == "Onduleur"
+
+
+def test_database_engine_is_configured_from_settings(tmp_path: Path):
+    config = Settings(sqlite_busy_timeout_ms=1234, sqlite_cache_size_kb=2048, sqlite_mmap_size_bytes=1 << 20)
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'tuned.db'}", config)
+    with engine.connect() as connection:
+        pragmas = {
+            name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size")
+        }
+    # synchronous: 1 is NORMAL.
+    assert pragmas == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 1234, "cache_size": -2048, "mmap_size": 1 << 20}
+
+    options = engine_options("postgresql+asyncpg://crm@db/crm", Settings(db_pool_size=4, db_max_overflow=2))
+    assert (options["pool_size"], options["max_overflow"], options["pool_pre_ping"]) == (4, 2, True)
+    assert options["connect_args"] == {"prepared_statement_cache_size": 500}
+    assert "pool_size" not in engine_options("sqlite:///crm.db")
+
+
+def test_exports_stream_ndjson_and_csv(tmp_path: Path):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Sigma", "email": "sigma@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-90", "os_name": "Debian"}).json()
+    samples = [{"machine_id": machine["id"], "cpu_percent": i, "ram_percent": 2, "disk_percent": 3} for i in range(30)]
+    client.post("/metrics/batch", json={"samples": samples})
+    client.post("/tickets", json={"client_id": c["id"], "description": "Écran noir, \"urgent\""})
+
+    r = client.get("/export/metrics", params={"machine_id": machine["id"]})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["cpu_percent"] for row in rows] == list(range(30))
+
+    r = client.get("/export/tickets", params={"format": "csv", "status": "open"})
+    lines = list(csv.reader(io.StringIO(r.text)))
+    assert lines[0][:2] == ["id", "client_id"]
+    assert lines[1][lines[0].index("description")] == 'Écran noir, "urgent"'
+    assert lines[1][lines[0].index("status")] == "open"
+
+    assert client.get("/export/invoices", params={"machine_id": 1}).status_code == 400
+    assert client.get("/export/tickets", params={"status": "perdu"}).status_code == 422
+
+
+def test_conditional_get_and_response_cache(tmp_path: Path, monkeypatch):
+    client = build_client(tmp_path)
+
+    c = client.post("/clients", json={"name": "Upsilon", "email": "upsilon@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-97", "os_name": "macOS"}).json()
+    # Off by default: versions would not follow writes made by other workers.
+    assert "etag" not in client.get("/machines").headers
+    monkeypatch.setattr(http_cache, "settings", dataclasses.replace(http_cache.settings, http_cache_enabled=True))
+
+    first = client.get("/machines")
+    etag = first.headers["etag"]
+    assert client.get("/machines", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/machines", params={"client_id": c["id"]}).headers["etag"] != etag
+
+    # A cache hit is served without running the endpoint or its dependencies.
+    override_get_db = app.dependency_overrides[get_db]
+    app.dependency_overrides[get_db] = lambda: pytest.fail("la base ne doit pas être lue")
+    assert client.get("/machines").json() == first.json()
+    assert response_cache.hits == 1
+    app.dependency_overrides[get_db] = override_get_db
+
+    # A machine already seen is answered from memory: no session at all.
+    tracker = app.dependency_overrides[get_heartbeat_tracker]()
+    client.post(f"/machines/{machine['id']}/heartbeat", json={"agent_version": "2.0"})
+    app.dependency_overrides[get_db] = lambda: None
+    for _ in range(3):
+        beat = client.post(f"/machines/{machine['id']}/heartbeat", json={"agent_version": "2.1"})
+        assert beat.json()["agent_version"] == "2.1" and beat.json()["hostname"] == "pc-97"
+    app.dependency_overrides[get_db] = override_get_db
+    with build_session_factory(tmp_path)() as db:
+        tracker.flush(db)
+    r = client.get("/machines", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["items"][0]["agent_version"] == "2.1"
+
+    etag = client.get("/clients").headers["etag"]
+    client.post("/clients", json={"name": "Phi", "email": "phi@example.com"})
+    r = client.get("/clients", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and len(r.json()["items"]) == 2
@@ -0,0 +1,197 @@
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.billing_runs import execute_billing_run, start_billing_run
+from app.database import Base
+from app.migrations import MIGRATIONS, migrate
+from app.prebilling import consolidate_prebilling
+from app.rollups import maintain_metrics
+from app.services import billing_period
+from test_api import build_client
+
+SINCE = (datetime.utcnow() - timedelta(days=7)).isoformat()
+# Read paths hit by the UI and the agents; every query they issue must be
+# served by an index (a bare ``SCAN table`` is a full table scan) and must
+# not sort its rows in a temporary b-tree.
+HOT_PATHS = [
+    "/dashboard",
+    "/clients",
+    f"/clients?from={SINCE}",
+    "/clients/1/contacts",
+    "/prospects?status=lead",
+    "/machines?client_id=1",
+    "/machines?os_name=Windows%2011",
+    "/machines/1/metrics?resolution=raw",
+    "/machines/1/metrics?resolution=1m",
+    "/machines/1/inventory",
+    "/machines/1/inventory/changes",
+    "/inventory/search?software=chrome&version=%3C120",
+    "/inventory/search?where=ram_gb%3C8",
+    "/alerts",
+    "/alerts?machine_id=1",
+    "/playbook-runs?machine_id=1",
+    "/playbook-runs?playbook_id=1",
+    "/tickets",
+    "/tickets?status=open",
+    "/tickets?priority=high",
+    f"/tickets?client_id=1&from={SINCE}",
+    "/tickets?technician_id=1",
+    "/tickets?machine_id=1",
+    "/technicians/1/interventions",
+    "/invoices?status=sent",
+    "/invoices?client_id=1",
+    "/invoices/1/lines",
+    "/contracts/1/hours/ledger",
+    "/billing/prebilling?client_id=1",
+    "/export/tickets?status=open",
+    "/export/invoices?client_id=1",
+    "/export/metrics?machine_id=1",
+]
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+PLANNED = ("SELECT", "UPDATE", "DELETE")
+
+
+@pytest.fixture()
+def traced(tmp_path: Path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}", connect_args={"check_same_thread": False})
+    migrate(engine)
+    statements: list[tuple[str, tuple]] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(PLANNED):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    client = build_client(tmp_path, sessionmaker(bind=engine, autoflush=False, autocommit=False))
+    c = client.post("/clients", json={"name": "Plan", "email": "plan@example.com"}).json()
+    machine = client.post("/machines", json={"client_id": c["id"], "hostname": "pc-01", "os_name": "Windows 11"}).json()
+    client.post("/tickets", json={"client_id": c["id"], "machine_id": machine["id"], "description": "Écran noir"})
+    technician = client.post("/technicians", json={"name": "Plan", "email": "tech@example.com"}).json()
+    entry = {"ticket_id": 1, "technician_id": technician["id"], "duration_hours": 1, "billable": True}
+    client.post("/time-entries", json=entry)
+    client.post("/invoices", json={"client_id": c["id"], "amount": 90})
+    client.post(f"/machines/{machine['id']}/inventory", json={"raw_json": {"ram_gb": 4, "software": []}})
+    sample = {"cpu_percent": 12, "ram_percent": 40, "disk_percent": 70}
+    assert client.post(f"/machines/{machine['id']}/metrics", json=sample).status_code == 200
+    statements.clear()
+    return engine, client, statements
+
+
+def query_plan(engine, statement: str, parameters: tuple) -> list[str]:
+    connection = engine.raw_connection()
+    try:
+        rows = connection.cursor().execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    finally:
+        connection.close()
+    return [row[3] for row in rows]
+
+
+def assert_indexed(engine, statements: list[tuple[str, tuple]], label: str) -> None:
+    assert statements, "aucune requête SQL capturée"
+    for statement, parameters in statements:
+        plan = query_plan(engine, statement, parameters)
+        scans = [line for line in plan if FULL_SCAN.match(line)]
+        sorts = [line for line in plan if "USE TEMP B-TREE FOR ORDER BY" in line]
+        assert not scans and not sorts, f"{label}\n{statement}\n" + "\n".join(plan)
+
+
+@pytest.mark.parametrize("path", HOT_PATHS)
+def test_hot_read_paths_never_scan_a_whole_table(traced, path: str):
+    engine, client, statements = traced
+
+    response = client.get(path)
+    assert response.status_code == 200, response.text
+    assert_indexed(engine, statements, path)
+
+
+def test_metric_maintenance_never_scans_samples(traced):
+    engine, client, statements = traced
+
+    with Session(engine) as db:
+        maintain_metrics(db)
+    assert_indexed(engine, statements, "maintain_metrics")
+
+
+def test_billing_run_never_scans_contracts(traced):
+    engine, client, statements = traced
+
+    with Session(engine) as db:
+        execute_billing_run(db, start_billing_run(db, billing_period()).id)
+    assert_indexed(engine, statements, "billing run")
+
+
+def test_prebilling_consolidation_never_scans(traced):
+    engine, client, statements = traced
+
+    with Session(engine) as db:
+        assert consolidate_prebilling(db, billing_period()) == 1
+    assert_indexed(engine, statements, "prebilling consolidation")
+
+
+def test_migrations_upgrade_a_legacy_database(tmp_path: Path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        # Tables as the first release created them (before deduplication and inventory deltas).
+        connection.execute(text(
+            "CREATE TABLE tickets (id INTEGER NOT NULL PRIMARY KEY, client_id INTEGER NOT NULL, "
+            "contract_id INTEGER, machine_id INTEGER, technician_id INTEGER, status VARCHAR(11), "
+            "priority VARCHAR(8), description VARCHAR(1000) NOT NULL, created_at DATETIME)"
+        ))
+        connection.execute(text(
+            "CREATE TABLE alerts (id INTEGER NOT NULL PRIMARY KEY, machine_id INTEGER NOT NULL, "
+            "severity VARCHAR(8), title VARCHAR(255) NOT NULL, details TEXT, ticket_id INTEGER, created_at DATETIME)"
+        ))
+        connection.execute(text(
+            "CREATE TABLE inventory_snapshots (id INTEGER NOT NULL PRIMARY KEY, machine_id INTEGER NOT NULL, "
+            "created_at DATETIME, raw_json JSON NOT NULL)"
+        ))
+        connection.execute(text(
+            "CREATE TABLE contracts (id INTEGER NOT NULL PRIMARY KEY, client_id INTEGER NOT NULL, type VARCHAR(13) NOT NULL, "
+            "total_hours FLOAT, remaining_hours FLOAT, hourly_rate FLOAT, monthly_price FLOAT, monthly_units INTEGER, "
+            "created_at DATETIME)"
+        ))
+        connection.execute(text(
+            "CREATE TABLE invoices (id INTEGER NOT NULL PRIMARY KEY, client_id INTEGER NOT NULL, status VARCHAR(9) NOT NULL, "
+            "amount FLOAT NOT NULL, description VARCHAR(1000) NOT NULL, created_at DATETIME NOT NULL)"
+        ))
+        connection.execute(text(
+            "INSERT INTO invoices (client_id, status, amount, description, created_at) "
+            "VALUES (1, 'DRAFT', 250, 'Forfait', '2024-01-01 00:00:00')"
+        ))
+        connection.execute(text(
+            "INSERT INTO contracts (client_id, type, total_hours, remaining_hours, hourly_rate, created_at) "
+            "VALUES (1, 'HOURS_BANK', 20, 12.5, 90, '2024-01-01 00:00:00')"
+        ))
+        connection.execute(text(
+            "INSERT INTO alerts (machine_id, severity, title, details, created_at) "
+            "VALUES (1, 'WARNING', 'Disque', '', '2024-01-01 00:00:00')"
+        ))
+        connection.execute(text(
+            "INSERT INTO inventory_snapshots (machine_id, created_at, raw_json) "
+            "VALUES (1, '2024-01-01 00:00:00', '{\"ram_gb\": 8}')"
+        ))
+
+    assert migrate(engine) == [migration.version for migration in MIGRATIONS]
+    assert migrate(engine) == []
+
+    schema = inspect(engine)
+    assert {"fingerprint", "occurrences", "last_seen_at"} <= {c["name"] for c in schema.get_columns("alerts")}
+    raw_json = next(c for c in schema.get_columns("inventory_snapshots") if c["name"] == "raw_json")
+    assert raw_json["nullable"]
+    assert "ix_tickets_status_created" in {index["name"] for index in schema.get_indexes("tickets")}
+    assert "ix_inventory_snapshots_machine_created" in {index["name"] for index in schema.get_indexes("inventory_snapshots")}
+    for table in Base.metadata.sorted_tables:
+        assert {index["name"] for index in schema.get_indexes(table.name)} == {index.name for index in table.indexes}
+    with engine.connect() as connection:
+        # Legacy alerts have no fingerprint: none becomes the open alert of one.
+        assert tuple(connection.execute(text("SELECT occurrences, is_open FROM alerts")).one()) == (1, None)
+        assert connection.execute(text("SELECT raw_json, chain_position FROM inventory_snapshots")).one() == ('{"ram_gb": 8}', 0)
+        invoice = connection.execute(text("SELECT amount, contract_id, period, idempotency_key FROM invoices")).one()
+        assert tuple(invoice) == (250, None, None, None)
+        opening = connection.execute(text("SELECT contract_id, before_hours, after_hours FROM hours_ledger")).one()
+        assert tuple(opening) == (1, 12.5, 12.5)
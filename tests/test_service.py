@@ -1,7 +1,10 @@
+import tempfile
 import unittest
+from pathlib import Path
 
-from src.crm_rmm.models import ContractType, Priority
-from src.crm_rmm.service import CRMRMMService
+from src.crm_rmm.buffers import SpillBuffer
+from src.crm_rmm.models import ContractType, Priority, Status
+from src.crm_rmm.service import CRMRMMService, HoursEvent
 
 
 class CRMRMMServiceTests(unittest.TestCase):
@@ -85,6 +88,79 @@ class CRMRMMServiceTests(unittest.TestCase):
         self.assertEqual(ticket.priority, Priority.CRITIQUE)
         self.assertTrue(ticket.title.startswith("Alerte RMM"))
 
+    def test_secondary_indexes_follow_mutations(self) -> None:
+        other = self.service.create_client("Globex")
+        bank = self.service.create_contract(self.client.id, ContractType.BANQUE_HEURES, 90.0, 10.0, 10.0)
+        later = self.service.create_contract(self.client.id, ContractType.TIME_MATERIAL, 120.0)
+        self.service.create_contract(other.id, ContractType.TIME_MATERIAL, 110.0)
+        first = self.service.create_ticket(self.client.id, "Mail", "No mail")
+        second = self.service.create_ticket(self.client.id, "Backup", "Failed backup")
+        foreign = self.service.create_ticket(other.id, "Printer", "Jam")
+        entry = self.service.add_time_entry(first.id, "tech_1", minutes=30)
+        self.service.add_time_entry(foreign.id, "tech_2", minutes=15)
+
+        self.assertEqual(self.service.contracts_for_client(self.client.id), [bank, later])
+        self.assertIs(self.service._active_contract_for_client(self.client.id), bank)
+        self.assertEqual(self.service.tickets_for_client(self.client.id), [first, second])
+        self.assertEqual(self.service.time_entries_for_technician("tech_1"), [entry])
+        self.assertEqual(self.service.tickets_with_status(Status.OUVERT), [first, second, foreign])
+
+        self.service.set_ticket_status(second.id, Status.EN_COURS)
+        self.service.close_ticket(first.id)
+
+        self.assertEqual(self.service.tickets_with_status(Status.OUVERT), [foreign])
+        self.assertEqual(self.service.tickets_with_status(Status.EN_COURS), [second])
+        self.assertEqual(self.service.tickets_for_client(self.client.id, Status.FERME), [first])
+        self.assertEqual(self.service.tickets_for_client("cli_unknown"), [])
+        self.assertEqual(self.service.time_entries_for_technician("tech_3"), [])
+
+    def test_buffers_spill_to_disk_and_queue_drains(self) -> None:
+        spill_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        service = CRMRMMService(buffer_capacity=4, spill_dir=spill_dir)
+        client = service.create_client("Initech")
+        contract = service.create_contract(client.id, ContractType.BANQUE_HEURES, 90.0, 20.0, 20.0, 30.0)
+        time_material = service.create_client("Umbrella")
+        service.create_contract(time_material.id, ContractType.TIME_MATERIAL, 120.0)
+        ticket = service.create_ticket(client.id, "Audit", "Yearly audit")
+        for _ in range(10):
+            service.validate_time_entry(service.add_time_entry(ticket.id, "tech_1", minutes=60).id)
+        queued = []
+        for index in range(10):
+            billed = service.create_ticket(time_material.id, f"Task {index}", "Billed")
+            service.validate_time_entry(service.add_time_entry(billed.id, "tech_2", minutes=30).id)
+            queued.append(service.close_ticket(billed.id).id)
+
+        history = service.hours_history
+        self.assertEqual(len(history), 10)
+        self.assertLessEqual(len(history.window()), 4)
+        self.assertEqual(history.spilled, 10 - len(history.window()))
+        self.assertEqual([event.after_hours for event in history], [19.0 - i for i in range(10)])
+        self.assertEqual(history[0], HoursEvent(client.id, contract.id, 20.0, 1.0, 19.0))
+        self.assertEqual(history[-1].after_hours, 10.0)
+        self.assertEqual(len(service.notifications), 10)
+        self.assertIn("19.00h", service.notifications[0])
+        self.assertTrue((spill_dir / "notifications.jsonl").exists())
+
+        self.assertEqual(list(service.prebilling_queue), queued)
+        self.assertEqual(service.prebilling_queue.drain(3), queued[:3])
+        self.assertEqual(service.prebilling_queue.drain(), queued[3:])
+        self.assertEqual(len(service.prebilling_queue), 0)
+        self.assertFalse((spill_dir / "prebilling_queue.jsonl").exists())
+
+        with self.assertRaises(FileExistsError):
+            CRMRMMService(buffer_capacity=4, spill_dir=spill_dir)
+        reopened = CRMRMMService(buffer_capacity=4, spill_dir=spill_dir, resume=True)
+        self.assertEqual(list(reopened.hours_history)[: history.spilled], list(history)[: history.spilled])
+
+    def test_spill_buffer_subclasses_must_provide_the_window(self) -> None:
+        class Incomplete(SpillBuffer):
+            def _window_len(self) -> int:
+                return 0
+
+        spill_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        with self.assertRaises(TypeError):
+            Incomplete(spill_dir / "log.jsonl", 4)
+
 
 if __name__ == "__main__":
     unittest.main()